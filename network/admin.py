@@ -1,8 +1,12 @@
 from django.contrib import admin
 
-from .models import User, Post, Follow
+from .models import User, Post, Follow, TimelineEntry, Suggestion, Job, ArchivedPost
 
 # Register your models here.
 admin.site.register(User)
 admin.site.register(Post)
 admin.site.register(Follow)
+admin.site.register(TimelineEntry)
+admin.site.register(Suggestion)
+admin.site.register(Job)
+admin.site.register(ArchivedPost)
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class NetworkConfig(AppConfig):
     name = 'network'
+
+    def ready(self):
+        # registers the deploy checks
+        from . import checks  # noqa: F401
@@ -0,0 +1,82 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.utils import timezone
+
+from . import cache, counters, writes
+from .models import Post, ArchivedPost
+
+
+# moving old posts out of the Post table
+
+# the feeds, their indexes and the users_liked table only need recent posts,
+# so posts older than a horizon are moved to ArchivedPost in batches (one
+# transaction each), with who liked them kept as a list of user ids on the
+# archived post instead of a users_liked row per like
+
+# profiles keep showing everything: their pages carry on into the archive
+# after the user's last live post (see feed.FeedRows and feed.cursor_feed),
+# archived posts are read-only and leave the other feeds, search and trending
+
+ARCHIVE_BATCH_SIZE = 1000
+
+
+def horizon(days):
+    # posts made before this are archived
+    return timezone.now() - timedelta(days=days)
+
+
+def archive_batch(before, batch_size=ARCHIVE_BATCH_SIZE):
+    # moves up to batch_size of the oldest posts made before before into the archive
+    # returns the number of posts moved
+    def write():
+        old_posts = Post.objects.filter(timestamp__lt=before).order_by("timestamp", "pk")
+        rows = list(old_posts.values_list(
+            "pk", "poster", "content", "timestamp", counters.like_count_expression()
+        )[:batch_size])
+        post_ids = [row[0] for row in rows]
+
+        liked_by = defaultdict(list)
+        likes = Post.users_liked.through.objects.filter(post__in=post_ids).order_by("pk")
+        for post_id, user_id in likes.values_list("post", "user"):
+            liked_by[post_id].append(user_id)
+
+        # (ignoring conflicts, so a batch that was copied but not deleted can be run again)
+        ArchivedPost.objects.bulk_create([
+            ArchivedPost(
+                id=post_id, poster_id=poster_id, content=content, timestamp=timestamp,
+                like_count=like_count, liked_by=liked_by[post_id],
+            )
+            for post_id, poster_id, content, timestamp, like_count in rows
+        ], ignore_conflicts=True)
+
+        # (deleting the posts deletes their likes, timeline entries, trending
+        # scores and like counter shards, and their search index rows)
+        Post.objects.filter(pk__in=post_ids).delete()
+        return rows, {user_id for user_ids in liked_by.values() for user_id in user_ids}
+
+    rows, liker_ids = writes.locked_write(write)
+
+    # the posts leave the all posts feed and move within their posters' profiles
+    for poster_id in {row[1] for row in rows}:
+        cache.post_changed(poster_id)
+    # and their likes move from users_liked to liked_by
+    for user_id in liker_ids:
+        cache.likes_changed(user_id)
+
+    return len(rows)
+
+
+def archive(days, batch_size=ARCHIVE_BATCH_SIZE, progress=None):
+    # archives every post older than days, batch by batch
+    # progress(number archived so far) is called after each batch
+    # returns the number of posts archived
+    before = horizon(days)
+    total = 0
+    while True:
+        moved = archive_batch(before, batch_size)
+        if not moved:
+            return total
+        total += moved
+        if progress is not None:
+            progress(total)
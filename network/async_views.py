@@ -0,0 +1,125 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from . import cache, instrumentation, routers, timelines, trending
+from .feed import newest_first
+from .instrumentation import JsonResponse
+from .models import User, Post, ArchivedPost
+from .views import feed_page, profile_info
+
+
+# async versions of the posts and profile views (GET only)
+
+# under ASGI (project4/asgi.py) these don't tie up a worker while they wait,
+# so one process can serve many slow clients at once
+
+# the ORM calls run in sync_to_async (Django's ORM is sync-only in this version)
+# and the independent parts of a page are awaited together with asyncio.gather
+
+# sync_to_async runs every call on one shared thread by default, one at a
+# time, so these read-only calls go through read_only instead: each runs in a
+# thread of its own with that thread's own database connection, so the calls
+# awaited together really run at the same time (the database does the work,
+# and releases the GIL while it does)
+# (that pays off with connections kept open, CONN_MAX_AGE as in SQLite
+# production mode, otherwise every call opens a new connection)
+
+
+def read_only(func):
+    # an awaitable version of func (read-only ORM work) run in a pool thread
+    def call(*args, **kwargs):
+        # (like InstrumentationMiddleware, only when instrumentation is on)
+        if settings.NETWORK_INSTRUMENTATION:
+            instrumentation.instrument_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            # (the pool thread's connection is closed like a request's would be)
+            close_old_connections()
+
+    return sync_to_async(call, thread_sensitive=False)
+
+
+@read_only
+def get_viewer(request):
+    # loads request.user (the session lookup is a database query)
+    request.user.is_authenticated
+    return request.user
+
+
+@read_only
+def get_user(username):
+    try:
+        return User.objects.get(username=username)
+    except User.DoesNotExist:
+        return None
+
+
+@routers.replica_reads
+async def posts(request, posts_filter, page_num=None):
+    # same as views.posts
+
+    if request.method != "GET":
+        return JsonResponse({"error": "GET request required."}, status=400)
+
+    viewer = await get_viewer(request)
+
+    # determrine what posts we're getting (all or following?)
+    if posts_filter == "all":
+        posts = Post.objects.all()
+        cache_scope = cache.ALL_POSTS
+    elif posts_filter == "following":
+        if not viewer.is_authenticated:
+            return JsonResponse({"error": "User is not signed in"}, status=400)
+        posts = await read_only(timelines.following_posts)(viewer)
+        cache_scope = None
+    elif posts_filter == "trending":
+        try:
+            return JsonResponse(await read_only(trending.feed_page)(request, page_num))
+        except ValueError:
+            return JsonResponse({"error": "Invalid cursor."}, status=400)
+    else:
+        return JsonResponse({"error": "Invalid posts filter"}, status=400)
+
+    posts = newest_first(posts)
+
+    try:
+        posts_dict = await read_only(feed_page)(request, posts, cache_scope, page_num)
+    except ValueError:
+        return JsonResponse({"error": "Invalid cursor."}, status=400)
+
+    return JsonResponse(posts_dict)
+
+
+@routers.replica_reads
+async def profile(request, username, page_num=None):
+    # same as views.profile (following/unfollowing stays on views.profile)
+
+    if request.method != "GET":
+        return JsonResponse({"error": "GET request required."}, status=400)
+
+    # the viewer and the user don't depend on each other
+    viewer, user = await asyncio.gather(get_viewer(request), get_user(username))
+
+    if user is None:
+        return JsonResponse({"error": "User not found."}, status=404)
+
+    # neither do the user's info and their page of posts
+    posts = Post.objects.filter(poster=user).order_by("-timestamp", "-pk")
+    archived = ArchivedPost.objects.filter(poster=user).order_by("-timestamp", "-pk")
+
+    try:
+        user_info, page_dict = await asyncio.gather(
+            read_only(profile_info)(viewer, user),
+            read_only(feed_page)(
+                request, posts, cache.profile_scope(user.pk), page_num, posts_key="user_posts", archived=archived
+            ),
+        )
+    except ValueError:
+        return JsonResponse({"error": "Invalid cursor."}, status=400)
+
+    user_info.update(page_dict)
+    return JsonResponse(user_info)
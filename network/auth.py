@@ -0,0 +1,121 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.auth.signals import user_logged_out
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.functional import SimpleLazyObject
+
+from .models import User
+
+
+# a fast path for finding the signed in user
+
+# Django's AuthenticationMiddleware fetches request.user from the database on
+# every request that uses it (after the session lookup, which signed cookie
+# sessions avoid, see project4/settings.py)
+
+# CachedAuthenticationMiddleware keeps the users it has seen lately in an
+# in-process LRU for NETWORK_USER_CACHE_TTL seconds, and only uses one if the
+# session's user, backend and auth hash still match it, so logging out,
+# another login or a password change are seen like before
+# (this process forgets a user when they log out or are saved or deleted,
+# other processes after the TTL, so keep it short; a cached user's stored
+# counts may be that far behind too)
+
+
+class UserCache:
+    # the NETWORK_USER_CACHE_SIZE most recently used users,
+    # each kept for NETWORK_USER_CACHE_TTL seconds
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, user_id, backend, session_hash):
+        # a copy of the cached user with user_id, if it was cached for the same
+        # backend and session auth hash and hasn't expired (otherwise None)
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None:
+                return None
+
+            expires, cached_backend, cached_hash, user = entry
+            if expires < time.monotonic():
+                del self.entries[user_id]
+                return None
+            if cached_backend != backend or cached_hash != session_hash:
+                return None
+
+            self.entries.move_to_end(user_id)
+
+        # (each request gets its own copy, views may change request.user)
+        return copy.copy(user)
+
+    def set(self, user, backend):
+        expires = time.monotonic() + settings.NETWORK_USER_CACHE_TTL
+        entry = (expires, backend, user.get_session_auth_hash(), copy.copy(user))
+        with self.lock:
+            self.entries[user.pk] = entry
+            self.entries.move_to_end(user.pk)
+            while len(self.entries) > settings.NETWORK_USER_CACHE_SIZE:
+                self.entries.popitem(last=False)
+
+    def forget(self, user_id):
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+user_cache = UserCache()
+
+
+def get_user(request):
+    # request.user, from user_cache if it can be
+    session = request.session
+    try:
+        user_id = User._meta.pk.to_python(session[auth.SESSION_KEY])
+        backend = session[auth.BACKEND_SESSION_KEY]
+    except KeyError:
+        return auth.get_user(request)
+
+    user = user_cache.get(user_id, backend, session.get(auth.HASH_SESSION_KEY))
+    if user is not None:
+        user.backend = backend
+        return user
+
+    user = auth.get_user(request)
+    if user.is_authenticated:
+        user_cache.set(user, backend)
+    return user
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    # in place of django.contrib.auth's AuthenticationMiddleware
+    # (the same unless NETWORK_USER_CACHE_TTL is set)
+
+    def process_request(self, request):
+        if not settings.NETWORK_USER_CACHE_TTL:
+            return super().process_request(request)
+
+        request.user = SimpleLazyObject(lambda: get_user(request))
+
+
+@receiver(user_logged_out)
+def forget_logged_out_user(sender, user, **kwargs):
+    if user is not None:
+        user_cache.forget(user.pk)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_changed_user(sender, instance, **kwargs):
+    user_cache.forget(instance.pk)
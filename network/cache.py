@@ -0,0 +1,175 @@
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import routers, writes
+
+
+# caching for feed pages
+
+# every cached value belongs to a scope (the all posts feed or one user's profile)
+# and its key includes the scope's version, so bumping the version
+# (when a post in the scope is made, liked or edited) invalidates all of them at once
+
+# shared values (the posts on a page) are cached once for everyone,
+# per-viewer values (which of those posts the viewer liked) are cached separately
+
+# the versions also make cheap HTTP validators (see etag and last_modified),
+# so a client with an unchanged page gets a 304 before any of it is built
+
+# the versions are only shared by processes that share the cache: with the
+# default locmem cache each process has its own, so with more than one worker
+# a write bumps only its own process's versions and the others keep serving
+# (and 304ing) the old pages (`manage.py check --deploy` warns about this,
+# see network/checks.py)
+
+ALL_POSTS = "all"
+
+# user ids by username (never bumped, usernames don't change)
+USER_IDS = "user-ids"
+
+# returned by cache.get when a key is missing (None and False are valid values)
+_MISSING = object()
+
+
+def profile_scope(user_id):
+    return f"profile:{user_id}"
+
+
+def follows_scope(user_id):
+    # a user's follower and following lists
+    return f"follows:{user_id}"
+
+
+def viewer_scope(user_id):
+    # which posts a user liked and who they follow (see network/viewer_state.py)
+    return f"viewer:{user_id}"
+
+
+def get_cache():
+    # the cache from settings.CACHES to use (None if caching is turned off)
+    alias = settings.NETWORK_FEED_CACHE
+    if alias is None:
+        return None
+    return caches[alias]
+
+
+def _version_key(scope):
+    return f"feed-version:{scope}"
+
+
+def _modified_key(scope):
+    return f"feed-modified:{scope}"
+
+
+def _new_version():
+    # (not 1, so a version that was evicted from the cache
+    # doesn't come back as a version that already has values cached)
+    return time.time_ns()
+
+
+def version(cache, scope):
+    key = _version_key(scope)
+    current = cache.get(key)
+    if current is None:
+        cache.add(key, _new_version(), None)
+        current = cache.get(key)
+    return current
+
+
+def bump(*scopes):
+    # invalidates everything cached for scopes
+    # (once the write that changed them commits: bumped before that, a read
+    # could cache the old rows under the new version)
+    writes.after_commit(lambda: _bump(scopes))
+
+
+def _bump(scopes):
+    cache = get_cache()
+    if cache is None:
+        return
+
+    for scope in scopes:
+        try:
+            cache.incr(_version_key(scope))
+        except ValueError:
+            # no version yet (or it was evicted)
+            cache.set(_version_key(scope), _new_version(), None)
+        cache.set(_modified_key(scope), time.time(), None)
+
+
+def post_changed(poster_id):
+    # a post was made, liked, unliked or edited
+    bump(ALL_POSTS, profile_scope(poster_id))
+
+
+def follow_changed(user_id, following_id):
+    # user_id followed or unfollowed following_id
+    # (changing the follower count on one's profile and the following count on the other's,
+    # both of their follow lists and who user_id follows)
+    bump(
+        profile_scope(user_id), profile_scope(following_id),
+        follows_scope(user_id), follows_scope(following_id),
+        viewer_scope(user_id),
+    )
+
+
+def likes_changed(user_id):
+    # user_id liked or unliked posts
+    bump(viewer_scope(user_id))
+
+
+def etag(scope, viewer):
+    # an ETag for viewer's pages in scope (None if caching is turned off)
+    # it changes whenever anything cached in scope would be
+    cache = get_cache()
+    if cache is None:
+        return None
+    return f'"{version(cache, scope)}-{viewer.pk or 0}"'
+
+
+def last_modified(scope):
+    # when scope last changed (None if caching is turned off)
+    # (as a validator it only has whole seconds, see views.conditional)
+    cache = get_cache()
+    if cache is None:
+        return None
+
+    key = _modified_key(scope)
+    modified = cache.get(key)
+    if modified is None:
+        # not known, so it has to count as just now
+        cache.add(key, time.time(), None)
+        modified = cache.get(key)
+    return datetime.fromtimestamp(modified, timezone.utc)
+
+
+def cached(scope, key, build, cache_none=True):
+    # returns the value cached for key in scope,
+    # calling build() to make it if it isn't cached
+    # (scope None means the value isn't cached,
+    # cache_none False means a None from build() isn't either)
+    cache = get_cache()
+    if cache is None or scope is None:
+        return build()
+
+    full_key = f"feed:{scope}:{version(cache, scope)}:{key}"
+    timeout = settings.NETWORK_FEED_CACHE_TIMEOUT
+
+    # a replica may not have caught up with the write that bumped the scope,
+    # so what's built from one is kept apart from what's built from the
+    # default database (which writers read) and only for as long as a replica
+    # is expected to lag (see network/routers.py)
+    replica = routers.current_replica()
+    if replica is not None:
+        full_key = f"{full_key}:{replica}"
+        timeout = min(timeout, settings.NETWORK_REPLICA_STICKY_SECONDS)
+
+    value = cache.get(full_key, _MISSING)
+    if value is _MISSING:
+        value = build()
+        if value is not None or cache_none:
+            cache.set(full_key, value, timeout)
+    return value
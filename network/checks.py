@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+# `manage.py check --deploy` warnings about settings that are fine for
+# development but not for running more than one process
+
+# cache backends that keep their values in each process
+# (a bump in one process isn't seen by the others, see network/cache.py)
+PER_PROCESS_CACHES = (
+    "django.core.cache.backends.locmem.LocMemCache",
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_feed_cache(app_configs, **kwargs):
+    alias = settings.NETWORK_FEED_CACHE
+    if alias is None or settings.CACHES.get(alias, {}).get("BACKEND") not in PER_PROCESS_CACHES:
+        return []
+    return [
+        Warning(
+            f"NETWORK_FEED_CACHE uses the per-process cache {alias!r}.",
+            hint=(
+                "With more than one worker process, each one keeps its own feed versions "
+                "and serves stale pages after writes made in the others. Use a shared cache "
+                "(memcached, redis, database or file based), or set NETWORK_FEED_CACHE = None."
+            ),
+            id="network.W001",
+        )
+    ]
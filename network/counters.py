@@ -0,0 +1,230 @@
+import random
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from .models import User, Post, Follow, LikeCountShard
+
+
+def sharded():
+    return bool(settings.NETWORK_LIKE_COUNTER_SHARDS)
+
+
+def _add_likes(post_id, delta):
+    # adds delta to post_id's like count
+    if not sharded():
+        Post.objects.filter(pk=post_id).update(like_count=F("like_count") + delta)
+        return
+
+    shard = random.randrange(settings.NETWORK_LIKE_COUNTER_SHARDS)
+    shards = LikeCountShard.objects.filter(post_id=post_id, shard=shard)
+    if shards.update(delta=F("delta") + delta):
+        return
+    try:
+        with transaction.atomic():
+            LikeCountShard.objects.create(post_id=post_id, shard=shard, delta=delta)
+    except IntegrityError:
+        # another like made the shard first
+        shards.update(delta=F("delta") + delta)
+
+
+def _shard_total():
+    # the sum of the shards of each post in a Post queryset
+    shards = LikeCountShard.objects.filter(post=OuterRef("pk")).order_by().values("post")
+    return Coalesce(Subquery(shards.annotate(total=Sum("delta")).values("total")), 0)
+
+
+def like_count_expression():
+    # the like count of each post in a Post queryset (including its shards)
+    if not sharded():
+        return F("like_count")
+    return F("like_count") + _shard_total()
+
+
+def like_counts(post_ids):
+    # {post id: like count} of the posts in post_ids
+    return dict(Post.objects.filter(pk__in=post_ids).values_list("pk", like_count_expression()))
+
+
+def fold_like_counts():
+    # moves the shards' likes into their posts' like_count
+    # returns the number of posts whose count moved
+
+    # (each shard is moved by subtracting what was read from it, so likes
+    # made while this runs aren't lost)
+    # (a post's shards are added to like_count together, a negative shard on
+    # its own could take like_count below zero and fail its check)
+    shards = defaultdict(list)
+    with transaction.atomic():
+        for shard_id, post_id, delta in LikeCountShard.objects.exclude(delta=0).values_list("pk", "post", "delta"):
+            shards[post_id].append((shard_id, delta))
+
+        for post_id, post_shards in shards.items():
+            for shard_id, delta in post_shards:
+                LikeCountShard.objects.filter(pk=shard_id).update(delta=F("delta") - delta)
+            total = sum(delta for _, delta in post_shards)
+            if total:
+                Post.objects.filter(pk=post_id).update(like_count=F("like_count") + total)
+        LikeCountShard.objects.filter(delta=0).delete()
+    return len(shards)
+
+
+# like and follow writes go through these functions so the stored
+# counters (Post.like_count, User.num_followers, User.num_following)
+# always move together with the rows they count
+
+# F() expressions make the database do the increment,
+# so concurrent likes/follows don't overwrite each other's counts
+
+# every like of a viral post updating its one like_count row makes the likes
+# wait on each other for that row, so with NETWORK_LIKE_COUNTER_SHARDS set
+# likes add +1/-1 to one of that many LikeCountShard rows of the post picked
+# at random instead, a post's count is its like_count plus its shards
+# (like_count_expression), and fold_like_counts() moves the shards into
+# like_count now and then (see the fold_like_counts command)
+
+
+def like(post, user):
+    # returns True if the like was added (False if it already existed)
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                Post.users_liked.through.objects.create(post_id=post.pk, user_id=user.pk)
+        except IntegrityError:
+            return False
+        _add_likes(post.pk, 1)
+    return True
+
+
+def unlike(post, user):
+    # returns True if the like was removed (False if there wasn't one)
+    with transaction.atomic():
+        deleted, _ = Post.users_liked.through.objects.filter(post_id=post.pk, user_id=user.pk).delete()
+        if deleted:
+            _add_likes(post.pk, -deleted)
+    return bool(deleted)
+
+
+def follow(user, following):
+    # returns True if the follow was added (False if it already existed)
+    with transaction.atomic():
+        if Follow.objects.filter(user=user, following=following).exists():
+            return False
+        try:
+            with transaction.atomic():
+                Follow.objects.create(user=user, following=following)
+        except IntegrityError:
+            return False
+        User.objects.filter(pk=user.pk).update(num_following=F("num_following") + 1)
+        User.objects.filter(pk=following.pk).update(num_followers=F("num_followers") + 1)
+    return True
+
+
+def unfollow(user, following):
+    # returns True if the follow was removed (False if there wasn't one)
+    with transaction.atomic():
+        deleted, _ = Follow.objects.filter(user=user, following=following).delete()
+        if deleted:
+            User.objects.filter(pk=user.pk).update(num_following=F("num_following") - deleted)
+            User.objects.filter(pk=following.pk).update(num_followers=F("num_followers") - deleted)
+    return bool(deleted)
+
+
+def _lock_user(user):
+    # makes concurrent set_likes/set_follows of user (a retried bulk request)
+    # wait for each other, so both can't see the same row missing and count it
+    # (a no-op on SQLite, which already lets one transaction write at a time
+    # and doesn't let one that read before another's write commit write after it)
+    User.objects.select_for_update().filter(pk=user.pk).exists()
+
+
+def set_likes(user, liked):
+    # likes/unlikes many posts at once (in a few queries however many there are)
+    # liked is a dict of post id to True (like) or False (unlike)
+    # returns the ids of the posts whose like actually changed
+    likes = Post.users_liked.through
+
+    with transaction.atomic():
+        _lock_user(user)
+        existing = set(likes.objects.filter(user_id=user.pk, post_id__in=liked).values_list("post_id", flat=True))
+        to_add = [post_id for post_id, like in liked.items() if like and post_id not in existing]
+        to_remove = [post_id for post_id, like in liked.items() if not like and post_id in existing]
+
+        likes.objects.bulk_create(
+            [likes(post_id=post_id, user_id=user.pk) for post_id in to_add],
+            ignore_conflicts=True,
+        )
+        likes.objects.filter(user_id=user.pk, post_id__in=to_remove).delete()
+
+        if sharded():
+            for post_id in to_add:
+                _add_likes(post_id, 1)
+            for post_id in to_remove:
+                _add_likes(post_id, -1)
+        else:
+            Post.objects.filter(pk__in=to_add).update(like_count=F("like_count") + 1)
+            Post.objects.filter(pk__in=to_remove).update(like_count=F("like_count") - 1)
+
+    return to_add + to_remove
+
+
+def set_follows(user, followed):
+    # follows/unfollows many users at once (in a few queries however many there are)
+    # followed is a dict of user id to True (follow) or False (unfollow)
+    # returns the ids of the users whose follow was added and removed
+    with transaction.atomic():
+        _lock_user(user)
+        existing = set(Follow.objects.filter(user=user, following__in=followed).values_list("following", flat=True))
+        to_add = [user_id for user_id, follow in followed.items() if follow and user_id not in existing]
+        to_remove = [user_id for user_id, follow in followed.items() if not follow and user_id in existing]
+
+        Follow.objects.bulk_create(
+            [Follow(user_id=user.pk, following_id=user_id) for user_id in to_add],
+            ignore_conflicts=True,
+        )
+        Follow.objects.filter(user=user, following__in=to_remove).delete()
+
+        User.objects.filter(pk__in=to_add).update(num_followers=F("num_followers") + 1)
+        User.objects.filter(pk__in=to_remove).update(num_followers=F("num_followers") - 1)
+        User.objects.filter(pk=user.pk).update(num_following=F("num_following") + len(to_add) - len(to_remove))
+
+    return to_add, to_remove
+
+
+def _count_of(model, field):
+    # subquery counting the rows of model that point at the outer row through field
+    counts = model.objects.filter(**{field: OuterRef("pk")}).order_by().values(field).annotate(n=Count("pk")).values("n")
+    return Coalesce(Subquery(counts), 0)
+
+
+def reconcile_counters(fix=True):
+    # compares every stored counter with a count of the source table
+    # and (if fix is True) rewrites the ones that are wrong
+    # returns the number of wrong counters for each column
+
+    counters = [
+        (Post, "like_count", _count_of(Post.users_liked.through, "post")),
+        (User, "num_followers", _count_of(Follow, "following")),
+        (User, "num_following", _count_of(Follow, "user")),
+    ]
+
+    drift = {}
+    with transaction.atomic():
+        # (counts still in shards would look like drift, so they're folded
+        # before fixing and counted as part of like_count when only checking)
+        if fix:
+            fold_like_counts()
+        else:
+            counters[0] = (Post, "like_count", counters[0][2] - _shard_total())
+
+        for model, column, actual in counters:
+            wrong = model.objects.annotate(actual=actual).exclude(**{column: F("actual")})
+            if fix:
+                drift[column] = model.objects.filter(pk__in=wrong.values("pk")).update(**{column: actual})
+            else:
+                drift[column] = wrong.count()
+
+    return drift
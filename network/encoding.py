@@ -0,0 +1,30 @@
+import json
+
+from django.http import HttpResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# compact JSON for API responses
+
+# django's JsonResponse pads every separator with a space and escapes all
+# non-ASCII text, this leaves both out (about a tenth smaller for a feed page)
+# and uses orjson, a much faster encoder, if it's installed
+
+
+def dumps(data):
+    # data as compact JSON bytes
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+class JsonResponse(HttpResponse):
+    # django's JsonResponse with dumps (data must be plain JSON types)
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault("content_type", "application/json")
+        super().__init__(content=dumps(data), **kwargs)
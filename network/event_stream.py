@@ -0,0 +1,135 @@
+import asyncio
+import json
+from http.cookies import SimpleCookie
+from importlib import import_module
+from types import SimpleNamespace
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+
+from . import events
+from .models import Follow
+
+
+# server-sent events endpoint (/events, routed in project4/asgi.py)
+
+# GET /events?feed=all|following&posts=1,2,3 streams
+#   "post" events for new posts in the feed (following needs a signed in user)
+#   "like" events for the like counts of the listed posts (the ones on screen)
+
+# it's a plain ASGI app rather than a Django view so the connection can stay
+# open without holding a worker (Django 3 can't stream from async code)
+
+
+# seconds between keep-alive comments
+HEARTBEAT_SECONDS = 15
+
+
+@sync_to_async
+def get_followed_ids(scope):
+    # the ids of the users the signed in user follows (None if nobody is signed in)
+    cookies = SimpleCookie()
+    for name, value in scope["headers"]:
+        if name == b"cookie":
+            cookies.load(value.decode("latin-1"))
+
+    session_key = cookies.get(settings.SESSION_COOKIE_NAME)
+    if session_key is None:
+        return None
+
+    # get_user only needs the session (and checks it the same way as a request)
+    session = import_module(settings.SESSION_ENGINE).SessionStore(session_key.value)
+    user = get_user(SimpleNamespace(session=session))
+    if not user.is_authenticated:
+        return None
+
+    return set(Follow.objects.filter(user=user).values_list("following", flat=True))
+
+
+def wants(event, feed, followed_ids, post_ids):
+    # whether a subscriber with these parameters gets event
+    if event["type"] == "post":
+        if feed == "all":
+            return True
+        if feed == "following":
+            return event["data"]["poster_id"] in followed_ids
+        return False
+
+    if event["type"] == "like":
+        return event["data"]["post_id"] in post_ids
+
+    return False
+
+
+def format_event(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event['data'])}\n\n".encode()
+
+
+async def wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def send_response(send, status, body=b""):
+    await send({"type": "http.response.start", "status": status, "headers": [(b"content-type", b"text/plain")]})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def event_stream(scope, receive, send):
+    if scope["method"] != "GET":
+        await send_response(send, 405)
+        return
+
+    query = parse_qs(scope["query_string"].decode())
+    feed = query.get("feed", [None])[0]
+    try:
+        post_ids = {int(post_id) for post_id in query.get("posts", [""])[0].split(",") if post_id}
+    except ValueError:
+        await send_response(send, 400, b"Invalid posts.")
+        return
+
+    followed_ids = None
+    if feed == "following":
+        followed_ids = await get_followed_ids(scope)
+        if followed_ids is None:
+            await send_response(send, 400, b"User is not signed in")
+            return
+
+    subscription = events.get_broker().subscribe()
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+
+    try:
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream"),
+                (b"cache-control", b"no-cache"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": b": connected\n\n", "more_body": True})
+
+        while True:
+            next_event = asyncio.ensure_future(subscription.__anext__())
+            done, _ = await asyncio.wait(
+                [next_event, disconnected], timeout=HEARTBEAT_SECONDS, return_when=asyncio.FIRST_COMPLETED
+            )
+
+            if disconnected in done:
+                next_event.cancel()
+                break
+
+            if next_event in done:
+                event = next_event.result()
+                if wants(event, feed, followed_ids, post_ids):
+                    await send({"type": "http.response.body", "body": format_event(event), "more_body": True})
+            else:
+                next_event.cancel()
+                await send({"type": "http.response.body", "body": b": heartbeat\n\n", "more_body": True})
+    finally:
+        subscription.close()
+        disconnected.cancel()
@@ -0,0 +1,99 @@
+import asyncio
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from . import writes
+
+
+# publishing events (new posts, like counts) to the event stream
+# (see network/event_stream.py for the server-sent events endpoint)
+
+# views call publish(), which hands the event to the broker in
+# settings.NETWORK_EVENT_BROKER; the broker delivers it to every subscriber
+
+# the default InProcessBroker only reaches subscribers in the same process,
+# a broker for more than one process needs the same publish/subscribe methods
+
+
+class Subscription:
+    # events for one subscriber, read with `async for event in subscription`
+    # (must be made inside the event loop that reads it)
+
+    # events are dropped if a subscriber falls this far behind
+    MAX_QUEUED = 100
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(self.MAX_QUEUED)
+
+    def put(self, event):
+        # called in the event loop's thread
+        if not self.queue.full():
+            self.queue.put_nowait(event)
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.queue.get()
+
+
+class InProcessBroker:
+    # delivers events to the subscribers in this process
+
+    def __init__(self):
+        self.subscriptions = set()
+        self.lock = threading.Lock()
+
+    def subscribe(self):
+        subscription = Subscription(self)
+        with self.lock:
+            self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+    def publish(self, event):
+        # can be called from any thread (views run in worker threads)
+        with self.lock:
+            subscriptions = list(self.subscriptions)
+
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, event)
+            except RuntimeError:
+                # the subscriber's event loop has closed
+                self.unsubscribe(subscription)
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        _broker = import_string(settings.NETWORK_EVENT_BROKER)()
+    return _broker
+
+
+def publish(event_type, data):
+    # event_type is "post" (a new post) or "like" (a post's like count changed)
+    # (sent once the write commits, so subscribers can read what it's about)
+    event = {"type": event_type, "data": data}
+    writes.after_commit(lambda: get_broker().publish(event))
+
+
+def post_created(post):
+    publish("post", {"post_id": post.pk, "poster": post.poster.username, "poster_id": post.poster_id})
+
+
+def like_count_changed(post_id, like_count):
+    publish("like", {"post_id": post_id, "like_count": like_count})
@@ -0,0 +1,190 @@
+import base64
+from datetime import datetime
+
+from django.core.paginator import Paginator
+from django.db.models import Q, Value
+
+from . import cache, counters, viewer_state
+
+
+# number of posts on each page of a feed
+FEED_PAGE_SIZE = 10
+
+
+def order_fields(posts):
+    # the (timestamp, id) columns a queryset of posts is paged by, newest first
+    # (a queryset can alias other columns holding the same values as
+    # feed_timestamp and feed_post, e.g. timelines, to be read in their index's order)
+    if "feed_timestamp" in posts.query.annotations:
+        return "feed_timestamp", "feed_post"
+    return "timestamp", "pk"
+
+
+def newest_first(posts):
+    # posts ordered latest first by their order_fields
+    timestamp, pk = order_fields(posts)
+    return posts.order_by(f"-{timestamp}", f"-{pk}")
+
+
+def feed_rows(posts):
+    # just the columns a feed page needs from a queryset of posts, as tuples
+    # so a whole page is fetched in one query (joining the poster)
+    # without building a model instance for every post
+    # (like counts include any shards, see network.counters)
+    return posts.values_list(
+        "pk", "poster__username", "content", "timestamp", counters.like_count_expression(), Value(False)
+    )
+
+
+def archived_rows(archived):
+    # feed_rows for a queryset of archived posts
+    return archived.values_list("pk", "poster__username", "content", "timestamp", "like_count", Value(True))
+
+
+class FeedRows:
+    # the feed_rows of posts followed by the archived_rows of archived
+    # (a feed's archived posts are older than its posts, so they come after them)
+    # sliceable and countable, so Paginator can page through both,
+    # the archive is only read for pages that reach it
+
+    def __init__(self, posts, archived=None):
+        self.posts = posts
+        self.archived = archived
+        self.num_posts = None
+
+    def count(self):
+        self.num_posts = self.posts.count()
+        if self.archived is None:
+            return self.num_posts
+        return self.num_posts + self.archived.count()
+
+    def __getitem__(self, page):
+        rows = list(feed_rows(self.posts)[page.start:page.stop])
+        if self.archived is None or len(rows) == page.stop - page.start:
+            return rows
+
+        if self.num_posts is None:
+            self.num_posts = self.posts.count()
+        start = max(page.start - self.num_posts, 0)
+        stop = page.stop - self.num_posts
+        return rows + list(archived_rows(self.archived)[start:stop])
+
+
+def epoch_ms(timestamp):
+    # timestamps are sent as milliseconds since 1970 (the client formats them)
+    return int(timestamp.timestamp() * 1000)
+
+
+def serialize_post(row):
+    # this is the post format we return (without the viewer's state)
+    # (row must come from feed_rows)
+    post_id, poster, content, timestamp, like_count, archived = row
+    return {
+        'post_id': post_id,
+        'poster': poster,
+        'content': content,
+        'timestamp': epoch_ms(timestamp),
+        'like_count': like_count,
+        'archived': archived,
+    }
+
+
+def add_viewer_state(posts_array, viewer):
+    # returns copies of the formatted posts with whether viewer made or liked them
+    # (which posts viewer liked is cached per viewer, see network/viewer_state.py)
+
+    user_liked = viewer_state.liked_post_ids(
+        viewer,
+        [post['post_id'] for post in posts_array],
+        [post['post_id'] for post in posts_array if post.get('archived')],
+    )
+
+    return [
+        {
+            **post,
+            'user_liked': post['post_id'] in user_liked,
+            'user_is_poster': viewer.is_authenticated and post['poster'] == viewer.username,
+        }
+        for post in posts_array
+    ]
+
+
+def paginate_feed(posts, page_num, viewer, scope=None, archived=None):
+    # returns the formatted posts on page page_num and the number of pages
+    # (posts, and archived posts after them, should already be ordered)
+    # scope is the network.cache scope the page is cached in (None to not cache it)
+
+    def build():
+        # count the pages with the plain querysets (no joins needed),
+        # then fetch just the posts on this page with their poster
+        post_paginator = Paginator(FeedRows(posts, archived), FEED_PAGE_SIZE)
+        num_pages = post_paginator.num_pages
+        current_page = post_paginator.page(page_num)
+
+        return [serialize_post(row) for row in current_page.object_list], num_pages
+
+    page_key = f"page:{page_num}"
+    posts_array, num_pages = cache.cached(scope, page_key, build)
+
+    return add_viewer_state(posts_array, viewer), num_pages
+
+
+def encode_cursor(timestamp, pk):
+    # an opaque string that marks where the next page starts
+    # (the timestamp and id of the last post on this page)
+    value = f"{timestamp.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(cursor):
+    # returns the (timestamp, id) in a cursor
+    # (raises ValueError if the cursor wasn't made by encode_cursor)
+    value = base64.urlsafe_b64decode(cursor.encode()).decode()
+    timestamp, pk = value.split("|")
+    return datetime.fromisoformat(timestamp), int(pk)
+
+
+def _after_cursor(fields, timestamp, pk):
+    # the posts after (timestamp, pk), newest first, by the order_fields fields
+    timestamp_field, pk_field = fields
+    return Q(**{f"{timestamp_field}__lt": timestamp}) | Q(**{timestamp_field: timestamp, f"{pk_field}__lt": pk})
+
+
+def cursor_feed(posts, cursor, viewer, scope=None, archived=None):
+    # returns the formatted posts after cursor and the cursor for the next page
+    # (next cursor is None on the last page)
+    # scope is the network.cache scope the page is cached in (None to not cache it)
+    # archived posts (older than all of posts) continue the feed after posts
+
+    # seeks straight to the page with (timestamp, id) instead of
+    # counting and skipping all of the posts before it like Paginator does
+    posts = newest_first(posts)
+    if archived is not None:
+        archived = newest_first(archived)
+
+    if cursor:
+        timestamp, pk = decode_cursor(cursor)
+        posts = posts.filter(_after_cursor(order_fields(posts), timestamp, pk))
+        if archived is not None:
+            archived = archived.filter(_after_cursor(order_fields(archived), timestamp, pk))
+
+    def build():
+        # get one extra post to see if there is a next page
+        page_rows = list(feed_rows(posts)[:FEED_PAGE_SIZE + 1])
+
+        # the rest of the page from the archive once the posts run out
+        if archived is not None and len(page_rows) <= FEED_PAGE_SIZE:
+            page_rows += archived_rows(archived)[:FEED_PAGE_SIZE + 1 - len(page_rows)]
+
+        next_cursor = None
+        if len(page_rows) > FEED_PAGE_SIZE:
+            page_rows = page_rows[:FEED_PAGE_SIZE]
+            post_id, _, _, timestamp, _, _ = page_rows[-1]
+            next_cursor = encode_cursor(timestamp, post_id)
+
+        return [serialize_post(row) for row in page_rows], next_cursor
+
+    page_key = f"cursor:{cursor or ''}"
+    posts_array, next_cursor = cache.cached(scope, page_key, build)
+
+    return add_viewer_state(posts_array, viewer), next_cursor
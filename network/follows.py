@@ -0,0 +1,62 @@
+from . import cache, viewer_state
+from .models import Follow
+
+
+# lists of the users following a user and the users they follow
+
+# pages are newest follow first, and the cursor is the id of the last Follow
+# on the page, so every page is a range of the follows' foreign key index
+# (even deep in the followers of a user with millions of them, where an
+# OFFSET would skip over every row before the page)
+
+# first pages are cached in the user's follows scope (bumped when they follow,
+# unfollow or are followed), whether the viewer follows each listed user isn't
+# shared, so it's looked up per viewer (see network/viewer_state.py)
+
+# number of users on each page of a follow list
+FOLLOWS_PAGE_SIZE = 20
+
+FOLLOWERS = "followers"
+FOLLOWING = "following"
+
+
+def follow_rows(user_id, direction, cursor):
+    # the (follow id, username) of the users on a page of user_id's
+    # followers or following list after cursor (one more than a page)
+    if direction == FOLLOWERS:
+        follows = Follow.objects.filter(following=user_id).values_list("pk", "user__username")
+    else:
+        follows = Follow.objects.filter(user=user_id).values_list("pk", "following__username")
+
+    if cursor is not None:
+        follows = follows.filter(pk__lt=cursor)
+
+    return list(follows.order_by("-pk")[:FOLLOWS_PAGE_SIZE + 1])
+
+
+def follow_list(user_id, direction, cursor, viewer):
+    # returns a page of user_id's followers or following list after cursor
+    # and the cursor for the next page (None on the last page)
+    # raises ValueError if the cursor is invalid
+    if cursor is not None:
+        cursor = int(cursor)
+
+    def build():
+        return follow_rows(user_id, direction, cursor)
+
+    if cursor is None:
+        rows = cache.cached(cache.follows_scope(user_id), direction, build)
+    else:
+        rows = build()
+
+    next_cursor = None
+    if len(rows) > FOLLOWS_PAGE_SIZE:
+        rows = rows[:FOLLOWS_PAGE_SIZE]
+        next_cursor = str(rows[-1][0])
+
+    viewer_follows = viewer_state.followed_usernames(viewer, [username for follow_id, username in rows])
+    users = [
+        {"username": username, "viewer_follows": username in viewer_follows}
+        for follow_id, username in rows
+    ]
+    return users, next_cursor
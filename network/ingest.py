@@ -0,0 +1,143 @@
+import json
+
+from django.db import connection
+
+from . import cache, jobs, writes
+from .models import User, Post
+
+
+# bulk post ingestion from newline-delimited JSON (one {"content": ...} per line)
+# (used by the /import-posts endpoint and the import_posts command)
+
+# lines are read and validated one at a time, and valid posts are inserted
+# INGEST_CHUNK_SIZE at a time with bulk_create, one transaction per chunk,
+# so memory stays bounded however long the input is and a bad line is
+# reported without losing the rest
+
+# imported posts get the same side work as make_post (timelines, cached
+# pages), except events: they aren't pushed to watchers one by one
+
+MAX_CONTENT_LENGTH = Post._meta.get_field("content").max_length
+
+INGEST_CHUNK_SIZE = 500
+
+# longer lines are rejected without being read into memory
+# (a post of MAX_CONTENT_LENGTH escaped characters is a fraction of this)
+MAX_LINE_BYTES = 16 * 1024
+
+# the /import-posts endpoint reports this many bad lines (and how many there were)
+MAX_REPORTED_ERRORS = 100
+
+
+def read_lines(stream):
+    # the lines of a binary file-like stream,
+    # with None for lines longer than MAX_LINE_BYTES
+    while True:
+        line = stream.readline(MAX_LINE_BYTES + 1)
+        if not line:
+            return
+
+        if len(line) > MAX_LINE_BYTES and not line.endswith(b"\n"):
+            # skip the rest of it
+            while line and not line.endswith(b"\n"):
+                line = stream.readline(MAX_LINE_BYTES)
+            yield None
+        else:
+            yield line
+
+
+def parse_line(line, with_poster):
+    # returns the (content, poster username) in a line
+    # (the username is None unless with_poster)
+    # raises ValueError saying what's wrong with the line
+    if line is None:
+        raise ValueError("Line too long.")
+
+    try:
+        data = json.loads(line)
+    except ValueError:
+        raise ValueError("Invalid JSON.")
+    if not isinstance(data, dict):
+        raise ValueError("Expected a JSON object.")
+
+    content = data.get("content")
+    if not isinstance(content, str) or not content.strip():
+        raise ValueError("Content required.")
+    if len(content) > MAX_CONTENT_LENGTH:
+        raise ValueError(f"Content is longer than {MAX_CONTENT_LENGTH} characters.")
+
+    username = None
+    if with_poster:
+        username = data.get("poster")
+        if not isinstance(username, str):
+            raise ValueError("Poster required.")
+
+    return content, username
+
+
+def insert_posts(posts):
+    # inserts a chunk of posts in one transaction and does their side work
+    def write():
+        created = Post.objects.bulk_create(posts)
+        if connection.features.can_return_rows_from_bulk_insert:
+            post_ids = [post.pk for post in created]
+        else:
+            # (SQLite doesn't return the new ids, but the transaction holds
+            # the database's write lock, so they're the newest posts)
+            post_ids = list(Post.objects.order_by("-pk").values_list("pk", flat=True)[:len(posts)])
+        jobs.posts_created(post_ids)
+
+    writes.locked_write(write)
+
+    for poster_id in {post.poster_id for post in posts}:
+        cache.post_changed(poster_id)
+
+
+def ingest(lines, poster=None, on_error=None, chunk_size=INGEST_CHUNK_SIZE):
+    # imports a post from each line (blank lines are skipped), by poster,
+    # or by the user named in each line's "poster" if poster is None
+    # on_error(line number, message) is called for every line that isn't imported
+    # returns the number of posts imported
+    num_created = 0
+    chunk = []
+
+    def report(line_num, message):
+        if on_error is not None:
+            on_error(line_num, message)
+
+    def flush():
+        if poster is None:
+            posters = User.objects.in_bulk({username for line_num, content, username in chunk}, field_name="username")
+
+        posts = []
+        for line_num, content, username in chunk:
+            if poster is not None:
+                posts.append(Post(poster=poster, content=content))
+            elif username in posters:
+                posts.append(Post(poster=posters[username], content=content))
+            else:
+                report(line_num, "Unknown poster.")
+
+        if posts:
+            insert_posts(posts)
+        chunk.clear()
+        return len(posts)
+
+    for line_num, line in enumerate(lines, start=1):
+        if line is not None and not line.strip():
+            continue
+
+        try:
+            content, username = parse_line(line, with_poster=poster is None)
+        except ValueError as error:
+            report(line_num, str(error))
+            continue
+
+        chunk.append((line_num, content, username))
+        if len(chunk) >= chunk_size:
+            num_created += flush()
+
+    if chunk:
+        num_created += flush()
+
+    return num_created
@@ -0,0 +1,223 @@
+import bisect
+import contextvars
+import json
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import encoding
+
+
+# per-request instrumentation (turned on with settings.NETWORK_INSTRUMENTATION)
+
+# for every request InstrumentationMiddleware records the route name, the number
+# of queries, the time spent in SQL, repeated queries (N+1 patterns), the time
+# spent serializing JSON and the response size, then
+#   logs them as one JSON line to the "network.instrumentation" logger
+#   adds them to in-process histograms, served at /metrics for a scraper
+#   (in the Prometheus text format)
+
+# when it's turned off the middleware removes itself, so it costs nothing
+
+logger = logging.getLogger(__name__)
+
+# the RequestStats of the request being handled (None outside a request)
+_current = contextvars.ContextVar("network_request_stats", default=None)
+
+
+class RequestStats:
+    def __init__(self):
+        self.num_queries = 0
+        self.sql_seconds = 0.0
+        self.serialize_seconds = 0.0
+        # how many times each SQL statement ran (ignoring its parameters)
+        self.statements = Counter()
+
+    def repeated_queries(self):
+        # {sql: times run} for statements run often enough to be an N+1 pattern
+        threshold = settings.NETWORK_INSTRUMENTATION_REPEATED_QUERIES
+        return {sql: count for sql, count in self.statements.items() if count >= threshold}
+
+
+def record_query(execute, sql, params, many, context):
+    # database execute wrapper (installed on every connection by the middleware)
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.sql_seconds += time.perf_counter() - start
+        stats.num_queries += 1
+        stats.statements[sql] += 1
+
+
+class JsonResponse(encoding.JsonResponse):
+    # the compact JsonResponse from network/encoding.py, recording how long encoding the data took
+    # (a drop-in replacement used by the views)
+
+    def __init__(self, *args, **kwargs):
+        stats = _current.get()
+        if stats is None:
+            super().__init__(*args, **kwargs)
+            return
+
+        start = time.perf_counter()
+        super().__init__(*args, **kwargs)
+        stats.serialize_seconds += time.perf_counter() - start
+
+
+class Histogram:
+    # counts of observed values in cumulative buckets (like a Prometheus histogram)
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # the last count is for values above every bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+
+    def lines(self, name, labels):
+        # the histogram in the Prometheus text format
+        cumulative = 0
+        for bucket, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bucket}"}} {cumulative}'
+        cumulative += self.counts[-1]
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {cumulative}'
+        yield f"{name}_sum{{{labels}}} {self.total}"
+        yield f"{name}_count{{{labels}}} {cumulative}"
+
+
+SECONDS_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+QUERY_BUCKETS = [0, 1, 2, 3, 5, 10, 20, 50, 100]
+BYTES_BUCKETS = [256, 1024, 4096, 16384, 65536, 262144, 1048576]
+
+# metric name: (help, buckets)
+METRICS = {
+    "network_request_duration_seconds": ("Time to handle the request.", SECONDS_BUCKETS),
+    "network_request_queries": ("Database queries per request.", QUERY_BUCKETS),
+    "network_request_sql_seconds": ("Time spent in SQL per request.", SECONDS_BUCKETS),
+    "network_request_serialize_seconds": ("Time spent encoding JSON per request.", SECONDS_BUCKETS),
+    "network_response_bytes": ("Response body size.", BYTES_BUCKETS),
+}
+
+
+class Registry:
+    # the histograms for every route (shared by the threads of this process)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (metric name, route): Histogram
+        self.histograms = {}
+        # route: requests with repeated queries
+        self.repeated = Counter()
+
+    def observe(self, route, values, repeated):
+        # values is {metric name: value}
+        with self.lock:
+            for name, value in values.items():
+                key = (name, route)
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram(METRICS[name][1])
+                self.histograms[key].observe(value)
+            if repeated:
+                self.repeated[route] += 1
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, (help_text, _) in METRICS.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                for (metric, route), histogram in sorted(self.histograms.items()):
+                    if metric == name:
+                        lines.extend(histogram.lines(name, f'route="{route}"'))
+
+            lines.append("# HELP network_repeated_query_requests_total Requests that ran the same SQL many times (N+1).")
+            lines.append("# TYPE network_repeated_query_requests_total counter")
+            for route, count in sorted(self.repeated.items()):
+                lines.append(f'network_repeated_query_requests_total{{route="{route}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        with self.lock:
+            self.histograms.clear()
+            self.repeated.clear()
+
+
+registry = Registry()
+
+
+def instrument_connections():
+    # connections are per thread, so each thread's gets the wrapper
+    # (called by the middleware, and by threads doing work for a request)
+    for alias in connections:
+        connection = connections[alias]
+        if record_query not in connection.execute_wrappers:
+            connection.execute_wrappers.append(record_query)
+
+
+class InstrumentationMiddleware:
+    # goes first in settings.MIDDLEWARE, so its time covers the other middleware too
+
+    def __init__(self, get_response):
+        if not settings.NETWORK_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        instrument_connections()
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        duration = time.perf_counter() - start
+
+        record(request, response, stats, duration)
+        return response
+
+
+def record(request, response, stats, duration):
+    match = request.resolver_match
+    route = match.url_name if match is not None and match.url_name else "unresolved"
+    size = None if response.streaming else len(response.content)
+    repeated = stats.repeated_queries()
+
+    values = {
+        "network_request_duration_seconds": duration,
+        "network_request_queries": stats.num_queries,
+        "network_request_sql_seconds": stats.sql_seconds,
+        "network_request_serialize_seconds": stats.serialize_seconds,
+    }
+    if size is not None:
+        values["network_response_bytes"] = size
+    registry.observe(route, values, bool(repeated))
+
+    line = {
+        "route": route,
+        "method": request.method,
+        "status": response.status_code,
+        "duration_ms": round(duration * 1000, 2),
+        "queries": stats.num_queries,
+        "sql_ms": round(stats.sql_seconds * 1000, 2),
+        "serialize_ms": round(stats.serialize_seconds * 1000, 2),
+        "bytes": size,
+        "repeated_queries": [{"sql": sql, "count": count} for sql, count in repeated.items()],
+    }
+    # a warning if the request looks like an N+1 pattern
+    logger.log(logging.WARNING if repeated else logging.INFO, json.dumps(line))
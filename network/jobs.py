@@ -0,0 +1,204 @@
+import logging
+import traceback
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from . import suggestions, timelines, trending
+from .models import User, Post, Follow, Job
+
+
+# deferred side work of the write views
+# (timeline fan-out, suggestions, trending scores)
+
+# with NETWORK_JOBS_ASYNC on, enqueue() stores a Job row in the current
+# transaction and the run_jobs worker runs them, otherwise enqueue() runs the
+# job right away like the views used to (and the tests rely on)
+# (the views make a write and enqueue its jobs in one transaction.atomic(),
+# so the job is committed with the post/like/follow it's about, no broker
+# needed; outside a transaction they'd be two commits, and a crash between
+# them would lose the job)
+
+# the worker claims up to BATCH_SIZE due jobs at a time and hands each
+# handler all of its jobs at once, in a transaction: if the handler raises,
+# everything it did is rolled back and its jobs are retried after a growing
+# delay, until they've failed MAX_ATTEMPTS times and are left as failed
+
+# jobs can have a key: a job isn't added if one with the same key is still
+# waiting to run (so 10 follows in a row recompute suggestions once), handlers
+# of keyed jobs look at the current state instead of what the job says happened
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+MAX_ATTEMPTS = 5
+
+# a failed job waits RETRY_DELAY, then twice that, ... before running again
+RETRY_DELAY = timedelta(seconds=5)
+
+# jobs running for longer than this are assumed to belong to a worker that died
+# and go back in the queue
+STALE_AFTER = timedelta(minutes=10)
+
+# {job name: function taking the list of those jobs' args}
+HANDLERS = {}
+
+
+def handler(name):
+    # registers a function as the handler of name's jobs
+    def register(function):
+        HANDLERS[name] = function
+        return function
+    return register
+
+
+def enqueue(name, args, key=None):
+    # runs job name with args (a JSON-able dict), or stores it for the worker
+    enqueue_many(name, [(args, key)])
+
+
+def enqueue_many(name, jobs):
+    # enqueue() for a list of (args, key) of the same job
+    # (run as one batch when they're run right away)
+    if not jobs:
+        return
+
+    if not settings.NETWORK_JOBS_ASYNC:
+        HANDLERS[name]([args for args, key in jobs])
+        return
+
+    Job.objects.bulk_create([Job(name=name, args=args, key=key) for args, key in jobs], ignore_conflicts=True)
+
+
+def claim(batch_size=BATCH_SIZE):
+    # marks up to batch_size due jobs as running and returns them (oldest first)
+    now = timezone.now()
+
+    # (their keys are dropped, a job with the same key may have been added since)
+    Job.objects.filter(status=Job.RUNNING, run_at__lt=now - STALE_AFTER).update(
+        status=Job.PENDING, claimed_by="", key=None
+    )
+
+    due = Job.objects.filter(status=Job.PENDING, run_at__lte=now).order_by("pk").values_list("pk", flat=True)
+    token = uuid.uuid4().hex
+    # (only pending jobs are updated, so two workers can't claim the same job)
+    Job.objects.filter(pk__in=list(due[:batch_size]), status=Job.PENDING).update(
+        status=Job.RUNNING, claimed_by=token, run_at=now
+    )
+    return list(Job.objects.filter(status=Job.RUNNING, claimed_by=token).order_by("pk"))
+
+
+def run_pending(batch_size=BATCH_SIZE):
+    # runs a batch of due jobs
+    # returns the number of jobs run (including ones that failed)
+    jobs = claim(batch_size)
+
+    by_name = {}
+    for job in jobs:
+        by_name.setdefault(job.name, []).append(job)
+
+    for name, batch in by_name.items():
+        try:
+            # (the jobs are deleted in the handler's transaction, so a job
+            # whose work committed can't be claimed and run again)
+            with transaction.atomic():
+                HANDLERS[name]([job.args for job in batch])
+                Job.objects.filter(pk__in=[job.pk for job in batch]).delete()
+        except Exception:
+            logger.exception("%s jobs failed", name)
+            _retry(batch, traceback.format_exc())
+
+    return len(jobs)
+
+
+def _retry(batch, error):
+    # puts failed jobs back in the queue, or leaves them failed after MAX_ATTEMPTS
+    now = timezone.now()
+    for job in batch:
+        job.attempts += 1
+        job.last_error = error
+        job.claimed_by = ""
+        if job.attempts >= MAX_ATTEMPTS:
+            job.status = Job.FAILED
+        else:
+            job.status = Job.PENDING
+            job.run_at = now + RETRY_DELAY * 2 ** (job.attempts - 1)
+
+        try:
+            with transaction.atomic():
+                job.save()
+        except IntegrityError:
+            # a job with the same key was added while this one ran, it does the same work
+            job.delete()
+
+
+@handler("fan_out")
+def _fan_out(batch):
+    # {"post": id}: adds a new post to its poster's followers' timelines
+    posts = Post.objects.select_related("poster").in_bulk([args["post"] for args in batch])
+    for post in posts.values():
+        timelines.fan_out(post)
+
+
+@handler("follow_changed")
+def _follow_changed(batch):
+    # {"user": id, "following": id}: backfills or prunes user's timeline
+    # for whether they follow following now
+    pairs = {(args["user"], args["following"]) for args in batch}
+    users = User.objects.in_bulk({user_id for pair in pairs for user_id in pair})
+    num_unfollows = defaultdict(int)
+    for user_id, following_id in pairs:
+        if user_id not in users or following_id not in users:
+            continue
+        if Follow.objects.filter(user=user_id, following=following_id).exists():
+            timelines.backfill(users[user_id], users[following_id])
+        else:
+            timelines.prune(users[user_id], users[following_id])
+            num_unfollows[following_id] += 1
+
+    # (users the unfollows took back under the fan-out limit go into their followers' timelines)
+    for following_id, count in num_unfollows.items():
+        timelines.unfollowed(users[following_id], count)
+
+
+@handler("update_suggestions")
+def _update_suggestions(batch):
+    # {"user": id}: recomputes user's suggestions
+    for user in User.objects.filter(pk__in={args["user"] for args in batch}):
+        suggestions.update_user(user)
+
+
+@handler("like_changed")
+def _like_changed(batch):
+    # {"post": id, "liked": bool}: updates the post's trending score
+    for args in batch:
+        trending.like_changed(args["post"], args["liked"])
+
+
+def post_created(post):
+    # the side work of a new post
+    posts_created([post.pk])
+
+
+def posts_created(post_ids):
+    # the side work of new posts
+    enqueue_many("fan_out", [({"post": post_id}, f"fan_out:{post_id}") for post_id in post_ids])
+
+
+def follows_changed(user, following_ids):
+    # the side work of user following or unfollowing the users in following_ids
+    enqueue_many("follow_changed", [
+        ({"user": user.pk, "following": following_id}, f"follow:{user.pk}:{following_id}")
+        for following_id in following_ids
+    ])
+    if following_ids:
+        enqueue("update_suggestions", {"user": user.pk}, key=f"suggestions:{user.pk}")
+
+
+def likes_changed(liked):
+    # the side work of posts being liked (or unliked), liked is {post id: liked}
+    enqueue_many("like_changed", [({"post": post_id, "liked": value}, None) for post_id, value in liked.items()])
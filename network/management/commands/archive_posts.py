@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from network import archive
+
+
+class Command(BaseCommand):
+    help = (
+        "Move posts older than NETWORK_ARCHIVE_AFTER_DAYS (or --days) out of the Post table into the archive, "
+        "in batches. Archived posts stay on their poster's profile."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days", type=int, default=settings.NETWORK_ARCHIVE_AFTER_DAYS,
+            help="Archive posts older than this many days.",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=archive.ARCHIVE_BATCH_SIZE,
+            help="Number of posts moved per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        def progress(total):
+            if options["verbosity"] > 1:
+                self.stdout.write(f"  {total} post(s) archived...")
+
+        total = archive.archive(options["days"], options["batch_size"], progress)
+        self.stdout.write(f"Archived {total} post(s) older than {options['days']} day(s).")
@@ -0,0 +1,117 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from network import seeding
+from network.feed import FEED_PAGE_SIZE
+from network.models import User, Post, Follow
+
+
+class Rollback(Exception):
+    # raised to undo everything the benchmark wrote
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Show the query plans and timings of the feed queries with and without "
+        "the Post indexes. Seeds the data in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=1000000, help="Number of posts to seed.")
+        parser.add_argument("--users", type=int, default=10000, help="Number of users to seed.")
+        parser.add_argument("--follows", type=int, default=50, help="Average number of users each user follows.")
+        parser.add_argument("--repeat", type=int, default=20, help="Number of times each query is timed.")
+
+    def handle(self, *args, **options):
+        self.repeat = options["repeat"]
+
+        if connection.vendor != "sqlite":
+            raise CommandError("This benchmark drops and reads SQLite indexes, use a SQLite database.")
+
+        try:
+            with transaction.atomic():
+                self.seed(options["users"], options["posts"], options["follows"])
+                queries = self.feed_queries()
+
+                self.stdout.write(self.style.MIGRATE_HEADING("With indexes"))
+                with_indexes = self.run_queries(queries, "with indexes")
+
+                self.drop_post_indexes()
+
+                self.stdout.write(self.style.MIGRATE_HEADING("Without indexes"))
+                without_indexes = self.run_queries(queries, "without indexes")
+
+                self.stdout.write(self.style.MIGRATE_HEADING("Summary (median ms)"))
+                for name in queries:
+                    self.stdout.write(f"{name:<20} {without_indexes[name]:>10.2f} -> {with_indexes[name]:>8.2f}")
+
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, num_users, num_posts, num_follows):
+        self.stdout.write(f"Seeding {num_users} users, {num_posts} posts...")
+
+        user_ids = seeding.seed(
+            num_users=num_users,
+            num_posts=num_posts,
+            num_follows=num_users * num_follows,
+            num_likes=0,
+            prefix="bench",
+        )
+
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+        # a typical viewer and the user with the most posts and followers
+        # (see seeding.PowerLaw)
+        self.viewer = User.objects.get(pk=user_ids[-1])
+        self.other = User.objects.get(pk=user_ids[0])
+
+    def feed_queries(self):
+        # the queries the posts and profile views run for the first page
+        # (plus the "does the viewer follow this user" lookup)
+        posts = Post.objects.order_by("-timestamp", "-pk")
+        following = Follow.objects.filter(user=self.viewer).values("following")
+
+        return {
+            "all": posts[:FEED_PAGE_SIZE + 1],
+            "following": posts.filter(poster__in=following)[:FEED_PAGE_SIZE + 1],
+            "profile": posts.filter(poster=self.other)[:FEED_PAGE_SIZE + 1],
+            "follow lookup": Follow.objects.filter(user=self.viewer, following=self.other),
+        }
+
+    def run_queries(self, queries, label):
+        # prints the plan of each query and returns its median time in ms
+        timings = {}
+        for name, queryset in queries.items():
+            self.stdout.write(f"{name}:")
+            for row in self.explain(queryset, label):
+                self.stdout.write("    " + " ".join(str(column) for column in row))
+
+            times = []
+            for i in range(self.repeat):
+                start = time.perf_counter()
+                list(queryset.all())
+                times.append((time.perf_counter() - start) * 1000)
+            timings[name] = statistics.median(times)
+
+        return timings
+
+    def explain(self, queryset, label):
+        # sqlite3 caches statements by their SQL and doesn't re-plan a cached
+        # EXPLAIN after an index is dropped, so label makes the SQL different
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql} /* {label} */", params)
+            return cursor.fetchall()
+
+    def drop_post_indexes(self):
+        # (rolled back with everything else at the end)
+        with connection.cursor() as cursor:
+            for index in Post._meta.indexes:
+                cursor.execute(f"DROP INDEX {connection.ops.quote_name(index.name)}")
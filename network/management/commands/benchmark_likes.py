@@ -0,0 +1,58 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.test.utils import override_settings
+
+from network import counters, writes
+from network.management.reporting import write_report
+from network.models import User, Post
+
+
+class Command(BaseCommand):
+    help = (
+        "Like one post from many threads at once, with the like count in the post's row "
+        "and spread over counter shards, and check that no like was lost. "
+        "Uses existing users as the likers (see the seed command) and deletes the post afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--likes", type=int, default=2000, help="Number of likes (one per user).")
+        parser.add_argument("--threads", type=int, default=16, help="Number of threads liking at once.")
+        parser.add_argument("--shards", type=int, default=16, help="Number of counter shards to compare with.")
+
+    def handle(self, *args, **options):
+        users = list(User.objects.order_by("pk")[:options["likes"]])
+        if len(users) < options["likes"]:
+            raise CommandError(f"Needs {options['likes']} users, seed more or pass a smaller --likes.")
+
+        for name, shards in [("like_count row", 0), (f"{options['shards']} shards", options["shards"])]:
+            post = Post.objects.create(poster=users[0], content="benchmark_likes")
+            try:
+                with override_settings(NETWORK_LIKE_COUNTER_SHARDS=shards):
+                    start = time.perf_counter()
+                    with ThreadPoolExecutor(max_workers=options["threads"]) as executor:
+                        results = list(executor.map(lambda user: self.like(post, user), users))
+                    elapsed = time.perf_counter() - start
+
+                    write_report(self, name, results, elapsed)
+                    like_count = counters.like_counts([post.pk])[post.pk]
+                    num_likes = post.users_liked.count()
+                    self.stdout.write(f"  like count: {like_count} ({num_likes} likes stored)")
+            finally:
+                post.delete()
+
+    def like(self, post, user):
+        # returns (succeeded, latency in ms)
+        start = time.perf_counter()
+        try:
+            writes.retry_locked(lambda: counters.like(post, user), settings.NETWORK_WRITE_RETRIES)
+            succeeded = True
+        except OperationalError:
+            succeeded = False
+        finally:
+            # (each thread has its own connection)
+            connection.close()
+        return succeeded, (time.perf_counter() - start) * 1000
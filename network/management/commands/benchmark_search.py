@@ -0,0 +1,92 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from network import seeding
+from network.feed import FEED_PAGE_SIZE
+from network.models import Post
+from network.search import SEARCH_WINDOW, match_expression, matching_ids
+
+
+class Rollback(Exception):
+    # raised to undo everything the benchmark wrote
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the first page of full-text search results (FTS5) against a content__icontains scan "
+        "for common, uncommon and rare words. Seeds the data in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=2000000, help="Number of posts to seed.")
+        parser.add_argument("--users", type=int, default=10000, help="Number of users to seed.")
+        parser.add_argument("--repeat", type=int, default=10, help="Number of times each search is timed.")
+        parser.add_argument(
+            "--use-existing", action="store_true",
+            help="Search the posts already in the database (e.g. from the seed command) instead of seeding.",
+        )
+
+    def handle(self, *args, **options):
+        self.repeat = options["repeat"]
+
+        if connection.vendor != "sqlite":
+            raise CommandError("Search uses SQLite's FTS5, use a SQLite database.")
+
+        try:
+            with transaction.atomic():
+                if not options["use_existing"]:
+                    self.stdout.write(f"Seeding {options['users']} users, {options['posts']} posts...")
+                    start = time.perf_counter()
+                    seeding.seed(
+                        num_users=options["users"],
+                        num_posts=options["posts"],
+                        num_follows=0,
+                        num_likes=0,
+                        prefix="bench",
+                    )
+                    self.stdout.write(f"  (with the search index kept up to date: {time.perf_counter() - start:.1f}s)")
+
+                # words of seeded posts by how common they are (see seeding.VOCABULARY)
+                searches = {
+                    "common word": "word1",
+                    "uncommon word": "word100",
+                    "rare word": "word5000",
+                    "two words": "word2 word50",
+                }
+
+                self.stdout.write(self.style.MIGRATE_HEADING(
+                    f"First page (median ms, FTS5 ranks the newest {SEARCH_WINDOW} matches)"
+                ))
+                self.stdout.write(f"{'':<16} {'matches':>10} {'icontains':>10} {'fts5':>10}")
+                for name, query in searches.items():
+                    fts_ms = self.time(lambda: matching_ids(match_expression(query), None))
+                    scan = Post.objects.order_by("-timestamp", "-pk").values_list("pk", flat=True)
+                    for word in query.split():
+                        # (a space after the word so word1 doesn't match word10)
+                        scan = scan.filter(content__icontains=f"{word} ")
+                    scan_ms = self.time(lambda: list(scan[:FEED_PAGE_SIZE + 1]))
+                    matches = self.count_matches(match_expression(query))
+
+                    self.stdout.write(f"{name:<16} {matches:>10} {scan_ms:>10.2f} {fts_ms:>10.2f}")
+
+                raise Rollback
+        except Rollback:
+            pass
+
+    def time(self, run):
+        # median time of run() in ms
+        times = []
+        for i in range(self.repeat):
+            start = time.perf_counter()
+            run()
+            times.append((time.perf_counter() - start) * 1000)
+        return statistics.median(times)
+
+    def count_matches(self, match):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM network_post_search WHERE network_post_search MATCH %s", [match])
+            return cursor.fetchone()[0]
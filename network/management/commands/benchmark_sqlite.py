@@ -0,0 +1,57 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare mixed read/write throughput of the default SQLite setup with production mode "
+        "(WAL, pragmas, persistent connections and queued writes) by running loadgen against a copy "
+        "of the database in each mode. Seed the database first (see the seed command)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000, help="Total number of requests in each mode.")
+        parser.add_argument("--concurrency", type=int, default=16, help="Number of simulated users at once.")
+        parser.add_argument(
+            "--mix", default="posts=40,profile=20,like=25,make-post=15",
+            help="Weights of each kind of request (see loadgen).",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("This benchmark is for SQLite databases.")
+
+        source = settings.DATABASES["default"]["NAME"]
+        manage_py = os.path.join(settings.BASE_DIR, "manage.py")
+
+        with tempfile.TemporaryDirectory() as directory:
+            for label, production in [("default", "0"), ("production", "1")]:
+                # a fresh copy each time, since load changes the data
+                # and WAL mode stays on in the file once it's set
+                copy = os.path.join(directory, f"{label}.sqlite3")
+                with sqlite3.connect(source) as source_db, sqlite3.connect(copy) as copy_db:
+                    source_db.backup(copy_db)
+                    copy_db.execute("PRAGMA journal_mode=DELETE")
+
+                self.stdout.write(self.style.MIGRATE_LABEL(f"{label} mode"))
+                result = subprocess.run(
+                    [
+                        sys.executable, manage_py, "loadgen",
+                        "--requests", str(options["requests"]),
+                        "--concurrency", str(options["concurrency"]),
+                        "--mix", options["mix"],
+                    ],
+                    env={**os.environ, "NETWORK_DATABASE": copy, "NETWORK_SQLITE_PRODUCTION": production},
+                    capture_output=True,
+                    text=True,
+                )
+                if result.returncode != 0:
+                    raise CommandError(result.stderr)
+                self.stdout.write(result.stdout)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from network import trending
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the trending scores of posts that have gone cold "
+        "(run regularly, e.g. hourly, to keep the trending table small)."
+    )
+
+    def handle(self, *args, **options):
+        num_deleted = trending.compact()
+        self.stdout.write(f"Deleted {num_deleted} cold trending score(s).")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from network import counters
+
+
+class Command(BaseCommand):
+    help = (
+        "Move likes counted in like counter shards into their posts' like_count "
+        "(run regularly, e.g. every minute, while NETWORK_LIKE_COUNTER_SHARDS is on)."
+    )
+
+    def handle(self, *args, **options):
+        num_posts = counters.fold_like_counts()
+        self.stdout.write(f"Folded the like counts of {num_posts} post(s).")
@@ -0,0 +1,39 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from network import ingest
+
+
+class Command(BaseCommand):
+    help = (
+        "Import posts from a newline-delimited JSON file with one "
+        '{"poster": "username", "content": "..."} object per line. '
+        "Bad lines are reported and skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to import ('-' reads standard input).")
+        parser.add_argument(
+            "--chunk-size", type=int, default=ingest.INGEST_CHUNK_SIZE,
+            help="Number of posts inserted per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        def on_error(line_num, message):
+            self.num_errors += 1
+            self.stderr.write(f"line {line_num}: {message}")
+
+        self.num_errors = 0
+
+        if options["path"] == "-":
+            num_created = ingest.ingest(ingest.read_lines(sys.stdin.buffer), on_error=on_error, chunk_size=options["chunk_size"])
+        else:
+            try:
+                stream = open(options["path"], "rb")
+            except OSError as e:
+                raise CommandError(e)
+            with stream:
+                num_created = ingest.ingest(ingest.read_lines(stream), on_error=on_error, chunk_size=options["chunk_size"])
+
+        self.stdout.write(f"Imported {num_created} post(s), skipped {self.num_errors} line(s).")
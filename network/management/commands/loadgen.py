@@ -0,0 +1,164 @@
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.test import Client
+
+from network.management.reporting import write_report
+from network.models import User, Post
+from network.seeding import PowerLaw
+
+
+DEFAULT_MIX = "posts=60,profile=25,like=10,make-post=5"
+
+
+class InProcessSession:
+    # sends requests straight to the views with Django's test client
+
+    def __init__(self, user):
+        # "testserver" (the test client's default host) is only allowed in tests
+        hosts = [host for host in settings.ALLOWED_HOSTS if not host.startswith((".", "*"))]
+        self.client = Client(HTTP_HOST=hosts[0] if hosts else "localhost")
+        self.client.force_login(user)
+
+    def request(self, method, path, body=None):
+        # returns the response's status code
+        response = self.client.generic(method, path, json.dumps(body) if body else "", content_type="application/json")
+        return response.status_code
+
+
+class HttpSession:
+    # sends requests to a running server, signed in through the login form
+
+    def __init__(self, base_url, username, password):
+        self.base_url = base_url
+        self.cookies = CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies))
+
+        # the login form needs the CSRF cookie
+        self.request("GET", "/login")
+        csrf_token = next(cookie.value for cookie in self.cookies if cookie.name == "csrftoken")
+        form = urllib.parse.urlencode({
+            "username": username,
+            "password": password,
+            "csrfmiddlewaretoken": csrf_token,
+        }).encode()
+        request = urllib.request.Request(
+            self.base_url + "/login", data=form, headers={"Referer": self.base_url + "/login"}
+        )
+        self.opener.open(request).read()
+
+    def request(self, method, path, body=None):
+        # returns the response's status code
+        data = json.dumps(body).encode() if body else None
+        request = urllib.request.Request(
+            self.base_url + path, data=data, method=method, headers={"Content-Type": "application/json"}
+        )
+        try:
+            with self.opener.open(request) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay a mix of posts, profile, make-post and like traffic as seeded users "
+        "(see the seed command) and report throughput and latency for each."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url",
+            help="URL of a running server (without it, requests go straight to the views in this process).",
+        )
+        parser.add_argument("--requests", type=int, default=2000, help="Total number of requests.")
+        parser.add_argument("--concurrency", type=int, default=10, help="Number of simulated users at once.")
+        parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Weights of each kind of request (default {DEFAULT_MIX}).")
+        parser.add_argument("--prefix", default="seed", help="Username prefix of the seeded users.")
+        parser.add_argument("--password", default="seedpassword", help="Password of the seeded users.")
+        parser.add_argument("--alpha", type=float, default=1.0, help="Power law exponent for picking profiles.")
+
+    def handle(self, *args, **options):
+        try:
+            mix = {
+                name: float(weight)
+                for name, weight in (item.split("=") for item in options["mix"].split(","))
+            }
+        except ValueError:
+            raise CommandError(f"Invalid --mix: {options['mix']}")
+
+        unknown = set(mix) - set(self.operations())
+        if unknown:
+            raise CommandError(f"Unknown requests in --mix: {', '.join(sorted(unknown))}")
+
+        self.users = list(User.objects.filter(username__startswith=options["prefix"]).order_by("pk"))
+        if not self.users:
+            raise CommandError("No seeded users found, run the seed command first.")
+
+        post_ids = Post.objects.aggregate(first=Min("pk"), last=Max("pk"))
+        if post_ids["first"] is None:
+            raise CommandError("No posts found, run the seed command first.")
+        self.first_post_id, self.last_post_id = post_ids["first"], post_ids["last"]
+
+        self.url = options["url"].rstrip("/") if options["url"] else None
+        self.password = options["password"]
+        self.profiles = PowerLaw([user.username for user in self.users], options["alpha"], random.Random())
+        self.local = threading.local()
+
+        names = random.choices(list(mix), weights=list(mix.values()), k=options["requests"])
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+            results = list(executor.map(self.run, names))
+        elapsed = time.perf_counter() - start
+
+        for name in mix:
+            write_report(self, name, [result for result_name, result in zip(names, results) if result_name == name], elapsed)
+        write_report(self, "total", results, elapsed)
+
+    def session(self):
+        # each thread is one seeded user
+        if not hasattr(self.local, "session"):
+            user = random.choice(self.users)
+            if self.url:
+                self.local.session = HttpSession(self.url, user.username, self.password)
+            else:
+                self.local.session = InProcessSession(user)
+        return self.local.session
+
+    def operations(self):
+        # name: function returning (method, path, body)
+        return {
+            "posts": lambda: ("GET", f"/posts/{random.choice(['all', 'following'])}", None),
+            "profile": lambda: ("GET", f"/profile/{self.profiles.choices(1)[0]}", None),
+            "like": lambda: (
+                "PUT",
+                f"/post/{random.randint(self.first_post_id, self.last_post_id)}",
+                {"like": random.random() < 0.7},
+            ),
+            "make-post": lambda: ("POST", "/make-post", {"content": f"Load test post {random.random()}"}),
+        }
+
+    def run(self, name):
+        # returns (succeeded, latency in ms)
+        session = self.session()
+        method, path, body = self.operations()[name]()
+
+        start = time.perf_counter()
+        try:
+            succeeded = session.request(method, path, body) < 400
+        except Exception:
+            # (e.g. "database is locked" or a dropped connection)
+            succeeded = False
+        return succeeded, (time.perf_counter() - start) * 1000
@@ -0,0 +1,51 @@
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from network.management.reporting import write_report
+
+
+class Command(BaseCommand):
+    help = (
+        "Send concurrent GET requests to a running server and report throughput and latency. "
+        "For example, compare `runserver` (WSGI) with `uvicorn project4.asgi:application` (ASGI) "
+        "using --path /posts/all and --path /async/posts/all."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("base_url", help="URL of the running server, e.g. http://127.0.0.1:8000")
+        parser.add_argument(
+            "--path", action="append", dest="paths",
+            help="Path to request (can be given more than once, each is reported separately).",
+        )
+        parser.add_argument("--requests", type=int, default=1000, help="Number of requests for each path.")
+        parser.add_argument("--concurrency", type=int, default=50, help="Number of requests in flight at once.")
+        parser.add_argument("--timeout", type=float, default=30, help="Seconds before a request fails.")
+
+    def handle(self, *args, **options):
+        self.timeout = options["timeout"]
+        base_url = options["base_url"].rstrip("/")
+
+        for path in options["paths"] or ["/posts/all", "/async/posts/all"]:
+            url = base_url + path
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+                results = list(executor.map(self.fetch, [url] * options["requests"]))
+            elapsed = time.perf_counter() - start
+
+            write_report(self, path, results, elapsed)
+
+    def fetch(self, url):
+        # returns (succeeded, latency in ms)
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(url, timeout=self.timeout) as response:
+                response.read()
+            succeeded = True
+        except (urllib.error.URLError, OSError):
+            succeeded = False
+        return succeeded, (time.perf_counter() - start) * 1000
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from network.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = "Recount likes and follows and fix any stored counters that have drifted."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report the counters that are wrong, don't fix them.",
+        )
+
+    def handle(self, *args, **options):
+        fix = not options["check"]
+        drift = reconcile_counters(fix=fix)
+
+        for column, num_wrong in drift.items():
+            if fix:
+                self.stdout.write(f"{column}: fixed {num_wrong} row(s)")
+            else:
+                self.stdout.write(f"{column}: {num_wrong} row(s) wrong")
+
+        if not fix and any(drift.values()):
+            # non-zero exit code so this can be used as a check
+            raise CommandError("Some counters are out of date.")
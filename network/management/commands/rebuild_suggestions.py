@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from network import suggestions
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute every user's who-to-follow suggestions from the Follow table "
+        "(run regularly, e.g. nightly, following and unfollowing only updates the user who did it)."
+    )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        num_suggestions = suggestions.rebuild()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"Stored {num_suggestions} suggestions in {elapsed:.1f}s.")
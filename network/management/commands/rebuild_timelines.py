@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from network import timelines
+
+
+class Command(BaseCommand):
+    help = "Rebuild every user's following timeline from the Follow table."
+
+    def handle(self, *args, **options):
+        num_entries = timelines.rebuild()
+        self.stdout.write(f"Rebuilt timelines with {num_entries} entries.")
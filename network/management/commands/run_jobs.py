@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from network import jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Run background jobs (timeline fan-out, suggestions, trending scores) "
+        "stored while NETWORK_JOBS_ASYNC is on. Runs until stopped unless --once is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=jobs.BATCH_SIZE, help="Number of jobs claimed at a time.")
+        parser.add_argument("--interval", type=float, default=1.0, help="Seconds to wait when there are no jobs to run.")
+        parser.add_argument("--once", action="store_true", help="Exit once there are no jobs due to run.")
+
+    def handle(self, *args, **options):
+        total = 0
+        try:
+            while True:
+                num_run = jobs.run_pending(options["batch_size"])
+                total += num_run
+                if num_run:
+                    if options["verbosity"] > 1:
+                        self.stdout.write(f"Ran {num_run} job(s).")
+                    continue
+
+                if options["once"]:
+                    break
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(f"Ran {total} job(s).")
@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from network import seeding, timelines
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with generated users, posts, follows and likes for benchmarks. "
+        "Who posts, who is followed and what is liked follow a power law (see network/seeding.py)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10000, help="Number of users.")
+        parser.add_argument("--posts", type=int, default=1000000, help="Number of posts.")
+        parser.add_argument("--follows", type=int, default=500000, help="Number of follows to try (repeats are skipped).")
+        parser.add_argument("--likes", type=int, default=2000000, help="Number of likes to try (repeats are skipped).")
+        parser.add_argument(
+            "--alpha", type=float, default=1.0,
+            help="Power law exponent (higher means activity is more concentrated on a few users/posts).",
+        )
+        parser.add_argument("--days", type=int, default=365, help="Posts are spread over this many past days.")
+        parser.add_argument("--prefix", default="seed", help="Usernames are this followed by a number.")
+        parser.add_argument("--password", default="seedpassword", help="Password of every seeded user.")
+        parser.add_argument("--batch-size", type=int, default=10000, help="Rows per bulk_create transaction.")
+        parser.add_argument("--random-seed", type=int, help="Seed for repeatable data.")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+
+        user_ids = seeding.seed(
+            num_users=options["users"],
+            num_posts=options["posts"],
+            num_follows=options["follows"],
+            num_likes=options["likes"],
+            alpha=options["alpha"],
+            days=options["days"],
+            prefix=options["prefix"],
+            password=options["password"],
+            batch_size=options["batch_size"],
+            random_seed=options["random_seed"],
+        )
+
+        # the seeded follows aren't in anyone's timeline yet
+        if timelines.enabled():
+            timelines.rebuild()
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(user_ids)} users (password {options['password']!r}) in {elapsed:.1f}s."
+        ))
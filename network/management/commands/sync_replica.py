@@ -0,0 +1,32 @@
+import sqlite3
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the default SQLite database into a replica's file (a stand-in for "
+        "replication when trying read replicas locally, see NETWORK_READ_REPLICAS)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--replica", default="replica", help="Alias of the replica in DATABASES.")
+
+    def handle(self, *args, **options):
+        if options["replica"] not in connections:
+            raise CommandError(f"No database named {options['replica']!r} in DATABASES.")
+        primary = connections["default"].settings_dict["NAME"]
+        replica = connections[options["replica"]].settings_dict["NAME"]
+        if str(primary) == str(replica):
+            raise CommandError("The replica is the default database, set NETWORK_REPLICA_DATABASE.")
+
+        # (the backup API copies a consistent snapshot, even while the site is writing)
+        source = sqlite3.connect(primary)
+        target = sqlite3.connect(replica)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        self.stdout.write(f"Copied {primary} to {replica}.")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from network import timelines
+
+
+class Command(BaseCommand):
+    help = (
+        "Trim every user's following timeline to its newest NETWORK_TIMELINE_LENGTH entries "
+        "(run regularly, e.g. every hour, while NETWORK_TIMELINES is on)."
+    )
+
+    def handle(self, *args, **options):
+        num_entries = timelines.trim()
+        self.stdout.write(f"Deleted {num_entries} timeline entries.")
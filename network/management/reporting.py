@@ -0,0 +1,26 @@
+import statistics
+
+
+# shared by the load testing commands
+
+
+def percentile(sorted_values, percent):
+    # nearest-rank percentile of an already sorted list
+    index = max(0, round(percent / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def write_report(command, name, results, elapsed):
+    # writes the throughput and latency of results to command's stdout
+    # results is a list of (succeeded, latency in ms)
+    latencies = sorted(latency for succeeded, latency in results if succeeded)
+    errors = len(results) - len(latencies)
+
+    command.stdout.write(command.style.MIGRATE_HEADING(name))
+    command.stdout.write(f"  requests:   {len(results)} ({errors} failed)")
+    command.stdout.write(f"  throughput: {len(latencies) / elapsed:.1f} req/s")
+
+    if latencies:
+        command.stdout.write(f"  p50:        {percentile(latencies, 50):.1f} ms")
+        command.stdout.write(f"  p99:        {percentile(latencies, 99):.1f} ms")
+        command.stdout.write(f"  mean:       {statistics.mean(latencies):.1f} ms")
@@ -0,0 +1,45 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:04
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    # count the existing likes and follows into the new columns
+    User = apps.get_model('network', 'User')
+    Post = apps.get_model('network', 'Post')
+    Follow = apps.get_model('network', 'Follow')
+
+    def count_of(model, field):
+        counts = model.objects.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(n=Count('pk')).values('n')
+        return Coalesce(Subquery(counts), 0)
+
+    Post.objects.update(like_count=count_of(Post.users_liked.through, 'post'))
+    User.objects.update(num_followers=count_of(Follow, 'following'), num_following=count_of(Follow, 'user'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0003_auto_20201002_2019'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='num_followers',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='num_following',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
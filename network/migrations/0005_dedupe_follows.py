@@ -0,0 +1,31 @@
+from django.db import migrations
+from django.db.models import Count, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def dedupe_follows(apps, schema_editor):
+    # delete repeated (user, following) rows (keeping the first one)
+    # so the unique_follow constraint can be added
+    User = apps.get_model('network', 'User')
+    Follow = apps.get_model('network', 'Follow')
+
+    first_follows = Follow.objects.values('user', 'following').annotate(first_id=Min('id')).values('first_id')
+    Follow.objects.exclude(id__in=first_follows).delete()
+
+    # the duplicates were counted in the follower counters, so they're counted again
+    def count_of(field):
+        counts = Follow.objects.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(n=Count('pk')).values('n')
+        return Coalesce(Subquery(counts), 0)
+
+    User.objects.update(num_followers=count_of('following'), num_following=count_of('user'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0004_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_follows, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0005_dedupe_follows'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-timestamp', '-id'], name='post_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['poster', '-timestamp', '-id'], name='post_poster_timestamp_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'following'), name='unique_follow'),
+        ),
+    ]
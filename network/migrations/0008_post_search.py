@@ -0,0 +1,61 @@
+from django.db import migrations
+
+
+# a SQLite FTS5 full-text index of Post.content (see network/search.py)
+
+# it's an "external content" table, so it only stores the index and reads
+# the text from network_post, and the triggers keep it in sync with every
+# insert, edit and delete (including bulk_create and update(), which skip signals)
+
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE network_post_search USING fts5(
+        content, content='network_post', content_rowid='id', tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER network_post_search_insert AFTER INSERT ON network_post BEGIN
+        INSERT INTO network_post_search(rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER network_post_search_delete AFTER DELETE ON network_post BEGIN
+        INSERT INTO network_post_search(network_post_search, rowid, content) VALUES ('delete', old.id, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER network_post_search_update AFTER UPDATE OF content ON network_post BEGIN
+        INSERT INTO network_post_search(network_post_search, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO network_post_search(rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+    # index the posts that already exist
+    "INSERT INTO network_post_search(network_post_search) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER network_post_search_insert",
+    "DROP TRIGGER network_post_search_delete",
+    "DROP TRIGGER network_post_search_update",
+    "DROP TABLE network_post_search",
+]
+
+
+def run_on_sqlite(statements):
+    # (FTS5 is SQLite only, other databases don't get the search index)
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == 'sqlite':
+            for statement in statements:
+                schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0007_timelineentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_sqlite(CREATE_SQL), run_on_sqlite(DROP_SQL)),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0009_suggestion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingScore',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending_score', serialize=False, to='network.post')),
+                ('log_score', models.FloatField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='trendingscore',
+            index=models.Index(fields=['-log_score'], name='trending_score_idx'),
+        ),
+    ]
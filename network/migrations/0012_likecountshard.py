@@ -0,0 +1,27 @@
+# Generated by Django 3.2.25 on 2026-10-18 10:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0011_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LikeCountShard',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('delta', models.IntegerField(default=0)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='like_count_shards', to='network.post')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='likecountshard',
+            constraint=models.UniqueConstraint(fields=('post', 'shard'), name='unique_like_count_shard'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.2.25 on 2026-10-18 10:08
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0012_likecountshard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedPost',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('content', models.CharField(max_length=280)),
+                ('timestamp', models.DateTimeField()),
+                ('like_count', models.PositiveIntegerField(default=0)),
+                ('liked_by', models.JSONField(default=list)),
+                ('poster', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_posts', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedpost',
+            index=models.Index(fields=['poster', '-timestamp', '-id'], name='archived_poster_timestamp_idx'),
+        ),
+    ]
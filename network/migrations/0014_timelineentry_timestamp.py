@@ -0,0 +1,33 @@
+# Generated by Django 3.2.25 on 2026-10-18 14:20
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.utils.timezone
+
+
+def copy_post_timestamps(apps, schema_editor):
+    Post = apps.get_model("network", "Post")
+    TimelineEntry = apps.get_model("network", "TimelineEntry")
+    post_timestamp = Post.objects.filter(pk=OuterRef("post")).values("timestamp")
+    TimelineEntry.objects.update(timestamp=Subquery(post_timestamp))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('network', '0013_archivedpost'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='timelineentry',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_post_timestamps, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', '-timestamp', '-post'], name='timeline_user_timestamp_idx'),
+        ),
+    ]
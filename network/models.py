@@ -1,15 +1,28 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
 
 
 class User(AbstractUser):
-    pass
+    # stored counts of Follow rows (kept up to date by network.counters)
+    num_followers = models.PositiveIntegerField(default=0)
+    num_following = models.PositiveIntegerField(default=0)
 
 class Post(models.Model):
     poster = models.ForeignKey(User, on_delete=models.CASCADE, related_name="posts")
     content = models.CharField(max_length=280, blank=False)
     timestamp = models.DateTimeField(auto_now_add=True)
     users_liked = models.ManyToManyField('User', blank=True, related_name="likes")
+    # stored count of users_liked (kept up to date by network.counters)
+    like_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # all posts feed (latest first)
+            models.Index(fields=["-timestamp", "-id"], name="post_timestamp_idx"),
+            # profile and following feeds (one poster's posts, latest first)
+            models.Index(fields=["poster", "-timestamp", "-id"], name="post_poster_timestamp_idx"),
+        ]
 
     def __str__(self):
         if len(content) > 10:
@@ -22,5 +35,127 @@ class Follow(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="following")
     following = models.ForeignKey(User, on_delete=models.CASCADE, related_name="followers")
 
+    class Meta:
+        constraints = [
+            # a user can only follow someone once
+            # (also the index for "does user follow following" lookups)
+            models.UniqueConstraint(fields=["user", "following"], name="unique_follow"),
+        ]
+
     def __str__(self):
         return f"{self.user} follows {self.following}"
+
+class ArchivedPost(models.Model):
+    # a post moved out of the Post table once it got old (see network.archive)
+    # (it keeps its Post id, and who liked it as a list of user ids
+    # instead of a users_liked row for each like)
+    id = models.IntegerField(primary_key=True)
+    poster = models.ForeignKey(User, on_delete=models.CASCADE, related_name="archived_posts")
+    content = models.CharField(max_length=280)
+    timestamp = models.DateTimeField()
+    like_count = models.PositiveIntegerField(default=0)
+    liked_by = models.JSONField(default=list)
+
+    class Meta:
+        indexes = [
+            # profile pages (one poster's archived posts, latest first)
+            models.Index(fields=["poster", "-timestamp", "-id"], name="archived_poster_timestamp_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.poster}: {self.content[:10]} (archived)"
+
+class LikeCountShard(models.Model):
+    # likes of post not yet added to its like_count
+    # (with NETWORK_LIKE_COUNTER_SHARDS set, see network.counters)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="like_count_shards")
+    shard = models.PositiveSmallIntegerField()
+    delta = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # (also the index for summing a post's shards)
+            models.UniqueConstraint(fields=["post", "shard"], name="unique_like_count_shard"),
+        ]
+
+class TimelineEntry(models.Model):
+    # a post in user's "following" feed
+    # (written when the post is made, see network.timelines)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="timeline")
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="timeline_entries")
+    # the post's timestamp (so a page of the timeline is read in index order)
+    timestamp = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "post"], name="unique_timeline_entry"),
+        ]
+        indexes = [
+            # reading a user's timeline (latest first)
+            models.Index(fields=["user", "-timestamp", "-post"], name="timeline_user_timestamp_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user}'s timeline: post {self.post_id}"
+
+class TrendingScore(models.Model):
+    # a post's time-decayed like score (see network.trending)
+    # only posts liked lately have one
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name="trending_score")
+    # (in network.trending's forward decay form, so it never has to be updated as time passes)
+    log_score = models.FloatField()
+
+    class Meta:
+        indexes = [
+            # the top trending posts
+            models.Index(fields=["-log_score"], name="trending_score_idx"),
+        ]
+
+    def __str__(self):
+        return f"post {self.post_id}: {self.log_score}"
+
+class Suggestion(models.Model):
+    # a user suggested for user to follow (friends of friends, see network.suggestions)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="suggestions")
+    suggested = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            # (also the index for reading a user's suggestions)
+            models.UniqueConstraint(fields=["user", "suggested"], name="unique_suggestion"),
+        ]
+
+    def __str__(self):
+        return f"{self.suggested} for {self.user}"
+
+class Job(models.Model):
+    # a piece of deferred work for the run_jobs worker (see network.jobs)
+    PENDING = "pending"
+    RUNNING = "running"
+    FAILED = "failed"
+    STATUSES = [(PENDING, "Pending"), (RUNNING, "Running"), (FAILED, "Failed")]
+
+    name = models.CharField(max_length=64)
+    args = models.JSONField(default=dict)
+    # a pending job with the same key isn't added again
+    key = models.CharField(max_length=255, null=True, blank=True)
+    status = models.CharField(max_length=16, choices=STATUSES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    # when a pending job can run (or when a running job was claimed)
+    run_at = models.DateTimeField(default=timezone.now)
+    # identifies the worker that claimed a running job
+    claimed_by = models.CharField(max_length=32, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            # the next jobs to run
+            models.Index(fields=["status", "run_at"], name="job_status_run_at_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["key"], condition=models.Q(status="pending"), name="unique_pending_job_key"),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
@@ -0,0 +1,84 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from .writes import SAFE_METHODS
+
+
+# read replicas for the feed and profile pages
+# (NETWORK_READ_REPLICAS in project4/settings.py)
+
+# ReplicaMiddleware picks a replica for GETs of views marked with
+# replica_reads (the posts and profile views), and ReplicaRouter sends that
+# request's reads there, everything else (writes, and reads of any other
+# request) goes to the default database
+
+# a replica can be a little behind, so a client that just wrote something
+# gets a cookie that keeps its reads on the default database for
+# NETWORK_REPLICA_STICKY_SECONDS (so it sees its own post, like or follow)
+
+STICKY_COOKIE = "network_primary"
+
+# the replica the current request reads from (None for the default database)
+_replica = ContextVar("network_replica", default=None)
+
+
+def current_replica():
+    # the replica this request reads from (None if it reads from the default database)
+    return _replica.get()
+
+
+def replica_reads(view_func):
+    # marks a view whose GETs can read from a replica
+    view_func.replica_reads = True
+    return view_func
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        return current_replica()
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # (replicas hold the same rows as the default database)
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get their tables from the default database
+        return db == "default"
+
+
+class ReplicaMiddleware:
+
+    def __init__(self, get_response):
+        if not settings.NETWORK_READ_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            response = self.get_response(request)
+        finally:
+            token = getattr(request, "_replica_token", None)
+            if token is not None:
+                _replica.reset(token)
+
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_cookie(
+                STICKY_COOKIE, "1",
+                max_age=settings.NETWORK_REPLICA_STICKY_SECONDS, httponly=True, samesite="Lax",
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (
+            request.method in SAFE_METHODS
+            and getattr(view_func, "replica_reads", False)
+            and STICKY_COOKIE not in request.COOKIES
+        ):
+            request._replica_token = _replica.set(random.choice(settings.NETWORK_READ_REPLICAS))
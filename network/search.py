@@ -0,0 +1,103 @@
+import base64
+import re
+
+from django.db import connection
+
+from .feed import FEED_PAGE_SIZE, add_viewer_state, feed_rows, serialize_post
+from .models import Post
+
+
+# full-text search of posts
+# (uses the network_post_search FTS5 index made in migration 0008, SQLite only)
+
+# results are ranked by bm25 (best match first, then newest) and paginated
+# with a cursor of the last result's (rank, id), like the feeds' cursors
+
+# ranking every match of a common word means scoring millions of posts,
+# so only the newest SEARCH_WINDOW matches are ranked (finding them is cheap,
+# FTS5 reads matches in id order), and the cursor keeps the same window
+
+SEARCH_WINDOW = 1000
+
+
+def match_expression(query):
+    # the FTS5 query for what a user typed: every word must appear
+    # (each word is quoted, so FTS5 operators and punctuation are just text)
+    # returns None if there are no words to search for
+    words = re.findall(r"\w+", query)
+    if not words:
+        return None
+    return " ".join(f'"{word}"' for word in words)
+
+
+def encode_cursor(start, rank, pk):
+    # (repr keeps every digit, so the rank compares equal when decoded)
+    value = f"{start}|{rank!r}|{pk}"
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(cursor):
+    # returns the (window start, rank, id) in a cursor
+    # (raises ValueError if the cursor wasn't made by encode_cursor)
+    value = base64.urlsafe_b64decode(cursor.encode()).decode()
+    start, rank, pk = value.split("|")
+    return int(start), float(rank), int(pk)
+
+
+def window_start(match):
+    # the id of the oldest of the newest SEARCH_WINDOW matches
+    # (0 if there are fewer matches than that)
+    with connection.cursor() as db_cursor:
+        db_cursor.execute(
+            "SELECT rowid FROM network_post_search WHERE network_post_search MATCH %s "
+            "ORDER BY rowid DESC LIMIT 1 OFFSET %s",
+            [match, SEARCH_WINDOW - 1],
+        )
+        row = db_cursor.fetchone()
+    return row[0] if row else 0
+
+
+def matching_ids(match, cursor):
+    # returns the (id, rank) of the best matches after cursor (one more than a page)
+    # and the start of the window they're from
+    if cursor:
+        start, rank, pk = decode_cursor(cursor)
+    else:
+        start = window_start(match)
+
+    sql = "SELECT rowid, rank FROM network_post_search WHERE network_post_search MATCH %s AND rowid >= %s"
+    params = [match, start]
+
+    if cursor:
+        sql += " AND (rank > %s OR (rank = %s AND rowid < %s))"
+        params += [rank, rank, pk]
+
+    sql += " ORDER BY rank, rowid DESC LIMIT %s"
+    params.append(FEED_PAGE_SIZE + 1)
+
+    with connection.cursor() as db_cursor:
+        db_cursor.execute(sql, params)
+        return db_cursor.fetchall(), start
+
+
+def search_posts(query, cursor, viewer):
+    # returns the formatted posts matching query after cursor and the cursor for the next page
+    # (in the same format as the feeds, next cursor is None on the last page)
+    # raises ValueError if the cursor is invalid
+    match = match_expression(query)
+    if match is None:
+        return [], None
+
+    matches, start = matching_ids(match, cursor)
+
+    next_cursor = None
+    if len(matches) > FEED_PAGE_SIZE:
+        matches = matches[:FEED_PAGE_SIZE]
+        next_cursor = encode_cursor(start, matches[-1][1], matches[-1][0])
+
+    # fetch the page's posts in one query, then put them back in rank order
+    ids = [pk for pk, rank in matches]
+    rows = {row[0]: row for row in feed_rows(Post.objects.filter(pk__in=ids))}
+    posts_array = [serialize_post(rows[pk]) for pk in ids if pk in rows]
+
+    return add_viewer_state(posts_array, viewer), next_cursor
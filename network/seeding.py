@@ -0,0 +1,153 @@
+import itertools
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from .counters import reconcile_counters
+from .models import User, Post, Follow
+
+
+# generating large amounts of realistic data for benchmarks
+# (used by the seed and benchmark_* management commands)
+
+# who posts, who gets followed and which posts get liked follow a power law
+# (a few users/posts get most of the activity), like real social networks
+
+
+# seeded posts are made of these made-up words, picked with a power law like
+# the words in real text (so searches for common and rare words can be benchmarked)
+VOCABULARY = [f"word{rank}" for rank in range(1, 10001)]
+
+
+class PowerLaw:
+    # picks items with probability proportional to 1 / rank ** alpha
+    # (the first item is the most popular)
+
+    def __init__(self, items, alpha, rng):
+        self.items = items
+        self.rng = rng
+        weights = (1 / (rank ** alpha) for rank in range(1, len(items) + 1))
+        self.cum_weights = list(itertools.accumulate(weights))
+
+    def choices(self, k):
+        return self.rng.choices(self.items, cum_weights=self.cum_weights, k=k)
+
+
+@contextmanager
+def explicit_timestamps():
+    # lets Post timestamps be set (auto_now_add normally sets them to now)
+    field = Post._meta.get_field("timestamp")
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def batches(total, batch_size):
+    # the sizes of the batches that add up to total
+    for start in range(0, total, batch_size):
+        yield min(batch_size, total - start)
+
+
+def seed_users(num_users, prefix, password, batch_size):
+    # returns the ids of the new users (all with the same password)
+    # (hashing is slow, so the password is only hashed once)
+    password_hash = make_password(password)
+
+    for start in range(0, num_users, batch_size):
+        with transaction.atomic():
+            User.objects.bulk_create([
+                User(username=f"{prefix}{i}", password=password_hash)
+                for i in range(start, min(start + batch_size, num_users))
+            ])
+
+    users = User.objects.filter(username__startswith=prefix)
+    return list(users.values_list("pk", flat=True))
+
+
+def post_texts(words, num_posts, rng):
+    # num_posts texts of 5 to 20 words
+    lengths = [rng.randint(5, 20) for i in range(num_posts)]
+    chosen = iter(words.choices(sum(lengths)))
+    return [" ".join(itertools.islice(chosen, length)) for length in lengths]
+
+
+def seed_posts(user_ids, num_posts, days, alpha, rng, batch_size):
+    # posts by power law chosen users, spread evenly over the last days
+    # (oldest first, so ids and timestamps go up together like real posts)
+    posters = PowerLaw(user_ids, alpha, rng)
+    words = PowerLaw(VOCABULARY, 1.0, rng)
+    start = timezone.now() - timedelta(days=days)
+    step = timedelta(days=days) / max(num_posts, 1)
+
+    made = 0
+    with explicit_timestamps():
+        for size in batches(num_posts, batch_size):
+            with transaction.atomic():
+                Post.objects.bulk_create([
+                    Post(poster_id=poster_id, content=content, timestamp=start + step * (made + i))
+                    for i, (poster_id, content) in enumerate(zip(posters.choices(size), post_texts(words, size, rng)))
+                ])
+            made += size
+
+
+def seed_follows(user_ids, num_follows, alpha, rng, batch_size):
+    # follows from random users to power law chosen users
+    # (repeats and self-follows are skipped, so there can be fewer than num_follows)
+    popular = PowerLaw(user_ids, alpha, rng)
+
+    for size in batches(num_follows, batch_size):
+        followers = rng.choices(user_ids, k=size)
+        with transaction.atomic():
+            Follow.objects.bulk_create(
+                [
+                    Follow(user_id=user_id, following_id=following_id)
+                    for user_id, following_id in zip(followers, popular.choices(size))
+                    if user_id != following_id
+                ],
+                ignore_conflicts=True,
+            )
+
+
+def seed_likes(user_ids, post_ids, num_likes, alpha, rng, batch_size):
+    # likes from random users on power law chosen posts
+    # (repeats are skipped, so there can be fewer than num_likes)
+    likes = Post.users_liked.through
+
+    # popularity doesn't depend on age
+    post_ids = list(post_ids)
+    if not post_ids:
+        return
+    rng.shuffle(post_ids)
+    popular = PowerLaw(post_ids, alpha, rng)
+
+    for size in batches(num_likes, batch_size):
+        likers = rng.choices(user_ids, k=size)
+        with transaction.atomic():
+            likes.objects.bulk_create(
+                [likes(user_id=user_id, post_id=post_id) for user_id, post_id in zip(likers, popular.choices(size))],
+                ignore_conflicts=True,
+            )
+
+
+def seed(num_users, num_posts, num_follows, num_likes, alpha=1.0, days=365, prefix="seed",
+         password="seedpassword", batch_size=10000, random_seed=None):
+    # seeds everything, returns the ids of the new users
+    # (the stored counters are rebuilt from the new rows afterwards)
+    rng = random.Random(random_seed)
+
+    user_ids = seed_users(num_users, prefix, password, batch_size)
+    seed_posts(user_ids, num_posts, days, alpha, rng, batch_size)
+    seed_follows(user_ids, num_follows, alpha, rng, batch_size)
+
+    post_ids = Post.objects.filter(poster__username__startswith=prefix).values_list("pk", flat=True)
+    seed_likes(user_ids, post_ids, num_likes, alpha, rng, batch_size)
+
+    reconcile_counters()
+
+    return user_ids
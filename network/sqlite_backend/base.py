@@ -0,0 +1,35 @@
+from django.db.backends.sqlite3 import base
+
+
+# the sqlite3 backend with two connection OPTIONS from newer versions of Django
+#   "init_command": SQL run on every new connection (e.g. "PRAGMA journal_mode=WAL; ...")
+#   "transaction_mode": how transactions begin ("DEFERRED", "IMMEDIATE" or "EXCLUSIVE")
+
+# with "IMMEDIATE", an atomic block takes the write lock when it begins (waiting
+# up to the "timeout" option), so a transaction never fails halfway through
+# because another connection got the write lock between its reads and writes
+
+# (used by the production mode in project4/settings.py, Django 5.1+ can use the
+# built in django.db.backends.sqlite3 with the same OPTIONS instead)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        # (these aren't arguments of sqlite3.connect)
+        self.init_command = kwargs.pop("init_command", "")
+        self.transaction_mode = kwargs.pop("transaction_mode", None)
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for statement in self.init_command.split(";"):
+            if statement.strip():
+                conn.execute(statement)
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        if self.transaction_mode is None:
+            super()._start_transaction_under_autocommit()
+        else:
+            self.cursor().execute(f"BEGIN {self.transaction_mode}")
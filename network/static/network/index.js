@@ -6,7 +6,7 @@ document.addEventListener('DOMContentLoaded', () => {
   // Profile Link
   if (document.querySelector('#profile-nav') != null) {
     document.querySelector('#profile-nav').onclick = () => {
-      loadProfileView(document.querySelector('#profile-nav').innerText, 1);
+      loadProfileView(document.querySelector('#profile-nav').innerText);
       return false;
     };
   }
@@ -14,20 +14,43 @@ document.addEventListener('DOMContentLoaded', () => {
   // Following Link
   if (document.querySelector('#following-nav') != null) {
     document.querySelector('#following-nav').onclick = () => {
-      loadPostsView('following', 1);
+      loadPostsView('following');
       return false;
     };
   }
 
+  // Trending Link
+  document.querySelector('#trending-nav').onclick = () => {
+    loadPostsView('trending');
+    return false;
+  };
+
+  // load the next page of posts when the end of the feed scrolls into view
+  const feedObserver = new IntersectionObserver(entries => {
+    if (entries[0].isIntersecting) {
+      loadNextPage();
+    }
+  });
+  feedObserver.observe(document.querySelector('#feed-end'));
+
   // By default, load first page of all posts
-  loadPostsView('all', 1);
+  loadPostsView('all');
 
 });
 
 
-function loadPostsView(postsFilter, pageNum) {
-  // Loads the page (given by pageNum) of the posts
-  // (following or all; given by postsFilter)
+// the feed being displayed and the cursor for its next page
+// (nextCursor is null when there are no more pages)
+let currentFeed = null;
+
+// server-sent events for the feed being displayed (see listenForEvents)
+let eventSource = null;
+
+
+function loadPostsView(postsFilter) {
+  // Loads the first page of the posts
+  // (following, all or trending; given by postsFilter)
+  // more pages are loaded as the user scrolls (see loadNextPage)
 
   // Show posts-view; Hide profile-view
   document.querySelector('#posts-view').style.display = 'block';
@@ -39,6 +62,7 @@ function loadPostsView(postsFilter, pageNum) {
   }
 
   document.querySelector('#all-posts-nav').closest(".nav-item").classList.remove("active");
+  document.querySelector('#trending-nav').closest(".nav-item").classList.remove("active");
 
   if (document.querySelector('#following-nav') != null) {
     document.querySelector('#following-nav').closest(".nav-item").classList.remove("active");
@@ -55,7 +79,7 @@ function loadPostsView(postsFilter, pageNum) {
     postsElement.removeChild(postsElement.firstChild);
   }
 
-  // determine and display title (All Posts or Following) and nav bar active state
+  // determine and display title (All Posts, Following or Trending) and nav bar active state
   let title = "";
 
   if (postsFilter === "all") {
@@ -64,27 +88,44 @@ function loadPostsView(postsFilter, pageNum) {
   } else if (postsFilter === "following") {
     title = "Posts from Following"
     document.querySelector('#following-nav').closest(".nav-item").classList.add("active");
+  } else if (postsFilter === "trending") {
+    title = "Trending Posts"
+    document.querySelector('#trending-nav').closest(".nav-item").classList.add("active");
   }
 
   document.querySelector('#posts-title').innerHTML = `<h3>${title}</h3>`;
 
+  // hide the new posts button until there are new posts
+  const newPostsButton = document.querySelector('#new-posts-button');
+  newPostsButton.style.display = 'none';
+  newPostsButton.onclick = event => {
+    event.preventDefault();
+    loadPostsView(postsFilter);
+  };
+
   // add onclick event listener to the make post button
   if (document.querySelector('#make-post-button') != null) {
     document.querySelector('#make-post-button').onclick = () => modalFunctionality();
   }
 
-  // get the page of posts and display them using fetch
-  fetch(`/posts/${postsFilter}/${pageNum}`)
-  .then(response => response.json())
+  // get the first page of posts and display them using fetch
+  const feed = startFeed(`/posts/${postsFilter}`, postsFilter);
+
+  fetchPage(feed.url)
   .then(result => {
     // print posts to console
     console.log(result)
 
+    // the user switched to a different feed while this page loaded
+    if (feed !== currentFeed) {
+      return;
+    }
+
     // call displayPost for each post
     result.posts.forEach(postInfo => displayPost(postInfo, postsFilter));
 
-    // add functioinality to the previous and next buttons
-    paginationFunctionality(result, postsFilter);
+    // remember where the next page starts
+    pageLoaded(feed, result.next_cursor);
 
   });
 
@@ -127,14 +168,14 @@ function modalFunctionality() {
       $("#post-modal").modal("hide");
 
       // load the first page of posts-view (so we see the post we made!)
-      loadPostsView('all', 1);
+      loadPostsView('all');
     });
   }
 }
 
 
-function loadProfileView(username, pageNum) {
-  // loads the profile (user info and their posts) of the provided user
+function loadProfileView(username) {
+  // loads the profile (user info and the first page of their posts) of the provided user
 
   // Show profile-view, hide posts-view
   document.querySelector('#posts-view').style.display = 'none';
@@ -147,6 +188,7 @@ function loadProfileView(username, pageNum) {
 
   // all else remove active
   document.querySelector('#all-posts-nav').closest(".nav-item").classList.remove("active");
+  document.querySelector('#trending-nav').closest(".nav-item").classList.remove("active");
   if (document.querySelector('#following-nav') != null) {
     document.querySelector('#following-nav').closest(".nav-item").classList.remove("active");
   }
@@ -168,12 +210,18 @@ function loadProfileView(username, pageNum) {
   }
 
   // fetch user info
-  fetch(`/profile/${username}/${pageNum}`)
-  .then(response => response.json())
+  const feed = startFeed(`/profile/${username}`, "profile");
+
+  fetchPage(feed.url)
   .then(userInfo => {
     // print user info
     console.log(userInfo);
 
+    // the user switched to a different feed while this page loaded
+    if (feed !== currentFeed) {
+      return;
+    }
+
     // display in DOM
 
     // get the element for user info
@@ -236,7 +284,7 @@ function loadProfileView(username, pageNum) {
       event.preventDefault();
 
       // send the data via POST
-      fetch(`/profile/${userInfo.username}/${pageNum}`, {
+      fetch(`/profile/${userInfo.username}`, {
         method: 'POST',
         body: JSON.stringify({
           follow: !userInfo.user_is_following
@@ -272,14 +320,8 @@ function loadProfileView(username, pageNum) {
     // display the user's posts
     userInfo.user_posts.forEach(postInfo => displayPost(postInfo, "profile"));
 
-    // info to send to the paginator function
-    result = {
-      "num_pages": userInfo.num_pages,
-      "current_page": userInfo.current_page
-    }
-
-    // add functionality for the prev/next buttons
-    paginationFunctionality(result, "profile", username)
+    // remember where the next page starts
+    pageLoaded(feed, userInfo.next_cursor);
 
   }); // end of .then for GET fetch
 
@@ -292,7 +334,7 @@ function displayPost(postInfo, postsFilter) {
   // determine where to display the post
   if (postsFilter === "profile") {
     postsDiv = document.querySelector('#user-posts');
-  } else { // postsFilter is "all" or "following"
+  } else { // postsFilter is "all", "following" or "trending"
     postsDiv = document.querySelector('#posts');
   }
 
@@ -312,7 +354,7 @@ function displayPost(postInfo, postsFilter) {
   postUsername.onclick = event => {
     event.preventDefault();
 
-    loadProfileView(postInfo.poster, 1);
+    loadProfileView(postInfo.poster);
   };
 
   // add the username to the post header
@@ -331,8 +373,9 @@ function displayPost(postInfo, postsFilter) {
   postHeader.append(editButton);
 
   // determine if the edit button should show
-  // (aka when the signed in user is the poster)
-  if (postInfo.user_is_poster) { // edit button should show
+  // (aka when the signed in user is the poster,
+  // archived posts can't be edited)
+  if (postInfo.user_is_poster && !postInfo.archived) { // edit button should show
     editButton.style.display = 'inline';
     postHeader.classList.add("justify-content-between");
   } else { // edit button should not show
@@ -373,6 +416,13 @@ function displayPost(postInfo, postsFilter) {
     likeButton.innerHTML = "Like";
   }
 
+  // archived posts can't be liked or unliked any more
+  // (so the button just shows whether the user liked it)
+  if (postInfo.archived) {
+    likeButton.disabled = true;
+    likeButton.title = "Archived posts can't be liked";
+  }
+
   // add the button to the footer
   postFooter.append(likeButton);
 
@@ -394,13 +444,16 @@ function displayPost(postInfo, postsFilter) {
     likeCount.className = 'p-2';
   }
 
+  // (so like events can update the count)
+  likeCount.classList.add('like-count');
+
   // add the like count to the footer
   postFooter.append(likeCount);
 
   // create the timestamp
   const timestamp = document.createElement('div');
   timestamp.className = 'ml-auto p-2'; // we want it on the right side
-  timestamp.innerHTML = postInfo.timestamp;
+  timestamp.innerHTML = formatTimestamp(postInfo.timestamp);
 
   // add the timestamp to the footer
   postFooter.append(timestamp);
@@ -412,7 +465,8 @@ function displayPost(postInfo, postsFilter) {
   postsDiv.append(post);
 
   // add the onclick event if the likebutton is displayed (user is signed in)
-  if (likeButton.style.display != 'none') {
+  // and the post can still be liked
+  if (likeButton.style.display != 'none' && !postInfo.archived) {
 
     likeButton.onclick = event => {
       event.preventDefault();
@@ -589,116 +643,154 @@ function editPost(postId) {
 } // end of editPost()
 
 
-function paginationFunctionality(result, postsFilter, username) {
-  // adds onclick event listeners
-  // makes it so we can only click next when there is a next page (same for prev)
+// the last page fetched from each url and its ETag (see fetchPage)
+const savedPages = new Map();
 
 
-  // determine which paginator we are dealing with
-  if (postsFilter === "profile") {
-
-    paginationDiv = document.querySelector('#profile-pagination-nav');
-    prevPageButton = document.querySelector('#prof-prev-page-nav');
-    nextPageButton = document.querySelector('#prof-next-page-nav');
+function fetchPage(url) {
+  // fetches a page of posts/profile as json
+  // sends back the ETag of the copy we have, so if the page hasn't changed
+  // the server answers with an empty 304 and we use our copy
 
-  } else { // postsFilter is all or following
+  const saved = savedPages.get(url);
+  const headers = saved ? {'If-None-Match': saved.etag} : {};
 
-    paginationDiv = document.querySelector('#pagination-nav');
-    prevPageButton = document.querySelector('#prev-page-nav');
-    nextPageButton = document.querySelector('#next-page-nav');
-
-  }
-
-  // pagination navigation
-  if (result.num_pages === 1) {
-    // only one page, so we don't need next/prev buttons
+  return fetch(url, {headers: headers})
+  .then(response => {
+    if (response.status === 304) {
+      return saved.result;
+    }
 
-    // hide the pagination-nav div
-    paginationDiv.style.display = 'none';
+    return response.json().then(result => {
+      const etag = response.headers.get('ETag');
+      if (etag !== null) {
+        savedPages.set(url, {etag: etag, result: result});
+      }
+      return result;
+    });
+  });
+}
 
-  } else {
-    // there are multiple pages
 
-    // show the pagination-nav div
-    paginationDiv.style.display = 'block';
+function startFeed(url, postsFilter) {
+  // makes the feed at url the one being displayed
+  // (any page still loading for the old feed is ignored)
 
-    // determine if next or prev needs to be disabled
-    if (result.current_page === 1) {
+  currentFeed = {
+    url: url,
+    postsFilter: postsFilter,
+    nextCursor: null,
+    loading: true
+  };
 
-      prevPageButton.classList.add("disabled");
-      prevPageButton.childNodes[0].setAttribute('aria-disabled', true);
-      prevPageButton.childNodes[0].setAttribute('tabindex', "-1");
+  return currentFeed;
+}
 
-      nextPageButton.classList.remove("disabled");
-      nextPageButton.childNodes[0].removeAttribute('aria-disabled');
-      nextPageButton.childNodes[0].removeAttribute('tabindex');
 
-    } else if (result.current_page === result.num_pages) {
+function loadNextPage() {
+  // loads the page after nextCursor for the feed being displayed
+  // (called when the end of the feed scrolls into view)
 
-      prevPageButton.classList.remove("disabled");
-      prevPageButton.childNodes[0].removeAttribute('aria-disabled');
-      prevPageButton.childNodes[0].removeAttribute('tabindex');
+  const feed = currentFeed;
 
-      nextPageButton.classList.add("disabled");
-      nextPageButton.childNodes[0].setAttribute('aria-disabled', true);
-      nextPageButton.childNodes[0].setAttribute('tabindex', "-1");
+  // nothing to do if a page is loading or there are no more pages
+  if (feed === null || feed.loading || feed.nextCursor === null) {
+    return;
+  }
 
-    } else {
+  feed.loading = true;
 
-      nextPageButton.classList.remove("disabled");
-      nextPageButton.childNodes[0].removeAttribute('aria-disabled');
-      nextPageButton.childNodes[0].removeAttribute('tabindex');
+  fetchPage(`${feed.url}?cursor=${encodeURIComponent(feed.nextCursor)}`)
+  .then(result => {
+    console.log(result);
 
-      prevPageButton.classList.remove("disabled");
-      prevPageButton.childNodes[0].removeAttribute('aria-disabled');
-      prevPageButton.childNodes[0].removeAttribute('tabindex');
+    // the user switched to a different feed while this page loaded
+    if (feed !== currentFeed) {
+      return;
+    }
 
+    // the profile view returns posts under a different key
+    let postsArray = result.posts;
+    if (feed.postsFilter === "profile") {
+      postsArray = result.user_posts;
     }
 
-    // event listener for previous button
-    prevPageButton.onclick = event => {
-      event.preventDefault();
+    postsArray.forEach(postInfo => displayPost(postInfo, feed.postsFilter));
 
-      // make sure the button isn't disabled
-      if (!prevPageButton.classList.contains("disabled")) {
+    pageLoaded(feed, result.next_cursor);
 
-        // load the view with the previous page
-        if (postsFilter === "profile") {
+  });
 
-          loadProfileView(username, result.current_page - 1);
+} // end of loadNextPage()
 
-        } else {
 
-          loadPostsView(postsFilter, result.current_page - 1);
+function pageLoaded(feed, nextCursor) {
+  // called after a page of feed has been displayed
 
-        }
+  feed.nextCursor = nextCursor;
+  feed.loading = false;
 
-      }
+  // keep loading if the end of the feed is still on screen
+  // (the observer only fires when it scrolls into view)
+  const feedEnd = document.querySelector('#feed-end').getBoundingClientRect();
+  if (feed === currentFeed && feedEnd.top < window.innerHeight) {
+    loadNextPage();
+  }
 
-    } // end of onclick for prevPageButton
+  // listen for events about the posts now on screen
+  if (feed === currentFeed) {
+    listenForEvents(feed);
+  }
 
-    // event listener for next button
-    nextPageButton.onclick = event => {
-      event.preventDefault();
+}
 
-      // make sure the button isn't disabled
-      if (!nextPageButton.classList.contains("disabled")) {
 
-        // load the view with the previous page
-        if (postsFilter === "profile") {
+function listenForEvents(feed) {
+  // (re)connects to the server-sent events stream for feed
+  // new posts show the new posts button, likes update the like counts on screen
+  // (the stream only exists when the site is served with ASGI, otherwise this does nothing)
 
-          loadProfileView(username, result.current_page + 1);
+  if (eventSource !== null) {
+    eventSource.close();
+  }
 
-        } else {
+  // the ids of the posts on screen
+  let postsDiv = document.querySelector('#posts');
+  if (feed.postsFilter === "profile") {
+    postsDiv = document.querySelector('#user-posts');
+  }
+  const postIds = Array.from(postsDiv.children).map(post => post.id.replace('post-', ''));
 
-          loadPostsView(postsFilter, result.current_page + 1);
+  let url = `/events?posts=${postIds.join(',')}`;
+  if (feed.postsFilter !== "profile") {
+    url += `&feed=${feed.postsFilter}`;
+  }
 
-        }
+  eventSource = new EventSource(url);
 
-      }
+  eventSource.addEventListener('post', () => {
+    document.querySelector('#new-posts-button').style.display = 'block';
+  });
 
-    } // end of onclick for nextPageButton
+  eventSource.addEventListener('like', event => {
+    const data = JSON.parse(event.data);
+    const likeCount = document.querySelector(`#post-${data.post_id} .like-count`);
+    if (likeCount !== null) {
+      likeCount.innerHTML = `${data.like_count} Like(s)`;
+    }
+  });
 
-  } // end of else
+}
 
-} // end of paginationFunctionality()
+
+function formatTimestamp(ms) {
+  // posts' timestamps are sent as milliseconds since 1970
+  // shown like 1/31/21, 3:04 PM in the viewer's own time zone
+  return new Date(ms).toLocaleString('en-US', {
+    month: 'numeric',
+    day: 'numeric',
+    year: '2-digit',
+    hour: 'numeric',
+    minute: '2-digit'
+  });
+}
@@ -0,0 +1,150 @@
+import heapq
+import math
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import Post, Follow, Suggestion
+
+
+# who-to-follow suggestions
+
+# a user's suggestions are the users followed by the users they follow
+# (friends of friends) that they don't follow yet, scored by how many of the
+# people they follow follow them, times a weight for how much they've posted lately
+
+# working that out with self-joins of Follow for every page view is far too slow,
+# so rebuild() works it out for everyone at once from an in-memory copy of the
+# follow graph and stores each user's top SUGGESTIONS_PER_USER as Suggestion rows
+# (read back with one indexed query)
+
+# when a user follows or unfollows someone, update_user() recomputes just
+# their suggestions, the people who follow them are updated by the next rebuild
+
+
+# number of suggestions stored for each user
+SUGGESTIONS_PER_USER = 20
+
+# posts in this many past days count towards a user's activity weight
+ACTIVITY_DAYS = 30
+
+
+class FollowGraph:
+    # who follows whom, in compact arrays instead of millions of Python objects
+    # (an adjacency list in compressed sparse row form: the users followed by
+    # users[i] are following[offsets[i]:offsets[i + 1]])
+
+    def __init__(self, edges):
+        # edges are (user id, following id) pairs sorted by user id
+        self.users = array("q")
+        self.offsets = array("q", [0])
+        self.following = array("q")
+
+        for user_id, following_id in edges:
+            if not self.users or self.users[-1] != user_id:
+                if self.users:
+                    self.offsets.append(len(self.following))
+                self.users.append(user_id)
+            self.following.append(following_id)
+
+        if self.users:
+            self.offsets.append(len(self.following))
+
+    @classmethod
+    def load(cls, follows=None):
+        # the graph of follows (every Follow row if follows isn't given)
+        if follows is None:
+            follows = Follow.objects.all()
+        edges = follows.order_by("user", "following").values_list("user", "following")
+        return cls(edges.iterator(chunk_size=10000))
+
+    def followed_by(self, user_id):
+        # the ids of the users user_id follows
+        i = bisect_left(self.users, user_id)
+        if i == len(self.users) or self.users[i] != user_id:
+            return self.following[0:0]
+        return self.following[self.offsets[i]:self.offsets[i + 1]]
+
+
+def activity_weights(posters=None):
+    # {user id: weight} for users who posted in the last ACTIVITY_DAYS
+    # (users who didn't have a weight of 1)
+    # posters limits it to some users (a queryset of ids)
+    since = timezone.now() - timedelta(days=ACTIVITY_DAYS)
+    posts = Post.objects.filter(timestamp__gte=since)
+    if posters is not None:
+        posts = posts.filter(poster__in=posters)
+
+    counts = posts.values("poster").annotate(num_posts=Count("pk")).values_list("poster", "num_posts")
+    return {poster_id: 1 + math.log1p(num_posts) for poster_id, num_posts in counts}
+
+
+def top_suggestions(graph, user_id, weights, k=SUGGESTIONS_PER_USER):
+    # the best k (score, user id) suggestions for user_id
+    followed = graph.followed_by(user_id)
+
+    # how many of the users user_id follows follow each candidate
+    # (Counter.update counts a whole array at once in C)
+    overlap = Counter()
+    for followed_id in followed:
+        overlap.update(graph.followed_by(followed_id))
+
+    already = set(followed)
+    already.add(user_id)
+
+    scored = (
+        (count * weights.get(candidate_id, 1.0), candidate_id)
+        for candidate_id, count in overlap.items()
+        if candidate_id not in already
+    )
+    return heapq.nlargest(k, scored)
+
+
+def rebuild(batch_size=10000):
+    # recomputes every user's suggestions
+    # returns the number of suggestions stored
+    graph = FollowGraph.load()
+    weights = activity_weights()
+
+    suggestions = [
+        Suggestion(user_id=user_id, suggested_id=suggested_id, score=score)
+        for user_id in graph.users
+        for score, suggested_id in top_suggestions(graph, user_id, weights)
+    ]
+
+    with transaction.atomic():
+        Suggestion.objects.all().delete()
+        Suggestion.objects.bulk_create(suggestions, batch_size=batch_size)
+
+    return len(suggestions)
+
+
+def update_user(user):
+    # recomputes user's suggestions (after they follow or unfollow someone)
+    # from just the part of the graph they need
+    followed = Follow.objects.filter(user=user).values("following")
+    two_hops = Follow.objects.filter(user__in=followed).values("following")
+
+    graph = FollowGraph.load(Follow.objects.filter(user=user) | Follow.objects.filter(user__in=followed))
+    weights = activity_weights(posters=two_hops)
+
+    with transaction.atomic():
+        Suggestion.objects.filter(user=user).delete()
+        Suggestion.objects.bulk_create([
+            Suggestion(user_id=user.pk, suggested_id=suggested_id, score=score)
+            for score, suggested_id in top_suggestions(graph, user.pk, weights)
+        ])
+
+
+def suggested_users(user, k=SUGGESTIONS_PER_USER):
+    # user's best k suggestions (best first)
+    suggestions = Suggestion.objects.filter(user=user).order_by("-score", "-suggested")[:k]
+    return [
+        {"username": username, "num_followers": num_followers}
+        for username, num_followers in suggestions.values_list("suggested__username", "suggested__num_followers")
+    ]
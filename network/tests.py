@@ -1,3 +1,1551 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, connections, transaction
+from django.db.models import F, QuerySet
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+
+from . import archive, auth, cache, checks, counters, events, follows, ingest, instrumentation, jobs, routers, seeding, suggestions, timelines, trending, viewer_state, writes
+from .event_stream import event_stream
+from .models import User, Post, Follow, TimelineEntry, Suggestion, TrendingScore, Job, LikeCountShard, ArchivedPost
+from .sqlite_backend import base as sqlite_backend
+
+
+@override_settings(NETWORK_FEED_CACHE=None)
+class FeedQueryTests(TestCase):
+
+    def setUp(self):
+        self.viewer = User.objects.create_user("viewer", "viewer@example.com", "password")
+        self.poster = User.objects.create_user("poster", "poster@example.com", "password")
+        counters.follow(self.viewer, self.poster)
+
+    def make_posts(self, num_posts):
+        # each post is liked by the viewer and the poster
+        for i in range(num_posts):
+            post = Post.objects.create(poster=self.poster, content=f"post {i}")
+            counters.like(post, self.viewer)
+            counters.like(post, self.poster)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.json()
+
+    def assert_constant_queries(self, url):
+        # a page with 1 post and a page with 10 posts take the same number of queries
+        self.make_posts(1)
+        small_page, data = self.count_queries(url)
+
+        self.make_posts(9)
+        full_page, data = self.count_queries(url)
+
+        self.assertEqual(small_page, full_page)
+        return full_page, data
+
+    def test_all_posts_signed_out(self):
+        num_queries, data = self.assert_constant_queries("/posts/all/1")
+
+        # count the pages, fetch the page
+        self.assertEqual(num_queries, 2)
+        self.assertEqual(len(data["posts"]), 10)
+        self.assertEqual(data["posts"][0]["like_count"], 2)
+        self.assertFalse(data["posts"][0]["user_liked"])
+
+    def test_following_posts_signed_in(self):
+        self.client.force_login(self.viewer)
+        num_queries, data = self.assert_constant_queries("/posts/following/1")
+
+        # session and user, then count the pages, fetch the page, fetch the likes
+        self.assertEqual(num_queries, 5)
+        self.assertEqual(len(data["posts"]), 10)
+        self.assertEqual(data["posts"][0]["like_count"], 2)
+        self.assertTrue(data["posts"][0]["user_liked"])
+        self.assertFalse(data["posts"][0]["user_is_poster"])
+
+    def test_profile_posts_signed_in(self):
+        self.client.force_login(self.poster)
+        num_queries, data = self.assert_constant_queries("/profile/poster/1")
+
+        self.assertEqual(len(data["user_posts"]), 10)
+        self.assertTrue(data["user_posts"][0]["user_is_poster"])
+        self.assertEqual(data["num_followers"], 1)
+
+
+class CounterTests(TestCase):
+
+    def setUp(self):
+        self.user1 = User.objects.create_user("user1", "user1@example.com", "password")
+        self.user2 = User.objects.create_user("user2", "user2@example.com", "password")
+        self.post = Post.objects.create(poster=self.user1, content="hello")
+
+    def test_like_and_unlike_are_idempotent(self):
+        self.assertTrue(counters.like(self.post, self.user2))
+        self.assertFalse(counters.like(self.post, self.user2))
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+
+        self.assertTrue(counters.unlike(self.post, self.user2))
+        self.assertFalse(counters.unlike(self.post, self.user2))
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 0)
+
+    def test_like_view_returns_stored_count(self):
+        self.client.force_login(self.user2)
+        response = self.client.put(f"/post/{self.post.pk}", '{"like": true}', content_type="application/json")
+        self.assertEqual(response.json(), {"like_count": 1})
+
+    def test_follow_view_updates_both_users(self):
+        self.client.force_login(self.user2)
+        for i in range(2):
+            response = self.client.post("/profile/user1/1", '{"follow": true}', content_type="application/json")
+            self.assertEqual(response.json(), {"follower_count": 1})
+
+        self.user2.refresh_from_db()
+        self.assertEqual(self.user2.num_following, 1)
+
+        response = self.client.post("/profile/user1/1", '{"follow": false}', content_type="application/json")
+        self.assertEqual(response.json(), {"follower_count": 0})
+
+    def test_follow_is_unique(self):
+        Follow.objects.create(user=self.user2, following=self.user1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Follow.objects.create(user=self.user2, following=self.user1)
+
+    def test_reconcile_fixes_drift(self):
+        # write rows behind the counters' backs
+        self.post.users_liked.add(self.user1, self.user2)
+        Follow.objects.create(user=self.user2, following=self.user1)
+
+        drift = counters.reconcile_counters(fix=False)
+        self.assertEqual(drift, {"like_count": 1, "num_followers": 1, "num_following": 1})
+
+        counters.reconcile_counters()
+        self.assertEqual(counters.reconcile_counters(fix=False), {"like_count": 0, "num_followers": 0, "num_following": 0})
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 2)
+
+    @override_settings(NETWORK_LIKE_COUNTER_SHARDS=4, NETWORK_FEED_CACHE=None)
+    def test_sharded_like_counts(self):
+        users = [User.objects.create_user(f"liker{i}", f"liker{i}@example.com", "password") for i in range(10)]
+        for user in users:
+            counters.like(self.post, user)
+        counters.unlike(self.post, users[0])
+        counters.set_likes(users[1], {self.post.pk: False})
+
+        # the post's row isn't touched, its count is the sum of its shards
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 0)
+        self.assertLessEqual(LikeCountShard.objects.filter(post=self.post).count(), 4)
+        self.assertEqual(counters.like_counts([self.post.pk]), {self.post.pk: 8})
+        self.assertEqual(self.client.get("/posts/all").json()["posts"][0]["like_count"], 8)
+
+        self.assertEqual(counters.fold_like_counts(), 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 8)
+        self.assertFalse(LikeCountShard.objects.exists())
+        self.assertEqual(counters.like_counts([self.post.pk]), {self.post.pk: 8})
+
+        # shards aren't drift, and checking for drift doesn't fold them
+        counters.like(self.post, users[0])
+        self.assertEqual(counters.reconcile_counters(fix=False), {"like_count": 0, "num_followers": 0, "num_following": 0})
+        self.assertTrue(LikeCountShard.objects.exists())
+
+    def test_fold_mixed_sign_shards(self):
+        # a negative shard isn't added before the positive one that covers it
+        LikeCountShard.objects.create(post=self.post, shard=0, delta=-1)
+        LikeCountShard.objects.create(post=self.post, shard=1, delta=2)
+        LikeCountShard.objects.create(post=self.post, shard=2, delta=-1)
+
+        self.assertEqual(counters.fold_like_counts(), 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 0)
+        self.assertFalse(LikeCountShard.objects.exists())
+
+
+class CursorPaginationTests(TestCase):
+
+    def setUp(self):
+        cache.get_cache().clear()
+        self.user = User.objects.create_user("user", "user@example.com", "password")
+        for i in range(25):
+            Post.objects.create(poster=self.user, content=f"post {i}")
+
+    def walk_feed(self, url, posts_key):
+        # follows next_cursor until the last page
+        contents = []
+        cursor = None
+        while True:
+            params = {"cursor": cursor} if cursor else {}
+            data = self.client.get(url, params).json()
+            contents += [post["content"] for post in data[posts_key]]
+            cursor = data["next_cursor"]
+            if cursor is None:
+                return contents
+
+    def test_walks_every_post_once_latest_first(self):
+        expected = [f"post {i}" for i in reversed(range(25))]
+        self.assertEqual(self.walk_feed("/posts/all", "posts"), expected)
+        self.assertEqual(self.walk_feed("/profile/user", "user_posts"), expected)
+
+    def test_same_timestamp_uses_id(self):
+        # every post has the same timestamp, so only the id orders them
+        timestamp = Post.objects.first().timestamp
+        Post.objects.update(timestamp=timestamp)
+        self.assertEqual(len(set(self.walk_feed("/posts/all", "posts"))), 25)
+
+    def test_count_is_optional(self):
+        data = self.client.get("/posts/all").json()
+        self.assertNotIn("num_posts", data)
+
+        data = self.client.get("/posts/all", {"count": 1}).json()
+        self.assertEqual(data["num_posts"], 25)
+
+    def test_invalid_cursor(self):
+        response = self.client.get("/posts/all", {"cursor": "not a cursor"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_compact_post_format(self):
+        response = self.client.get("/posts/all")
+        self.assertNotIn(b", ", response.content)
+
+        post = Post.objects.latest("timestamp")
+        data = response.json()["posts"][0]
+        self.assertEqual(data["post_id"], post.pk)
+        self.assertEqual(data["poster"], "user")
+        self.assertEqual(data["timestamp"], int(post.timestamp.timestamp() * 1000))
+
+
+@override_settings(NETWORK_TIMELINES=True, NETWORK_TIMELINE_FANOUT_LIMIT=1)
+class TimelineTests(TestCase):
+
+    def setUp(self):
+        self.viewer = User.objects.create_user("viewer", "viewer@example.com", "password")
+        self.poster = User.objects.create_user("poster", "poster@example.com", "password")
+        self.client.force_login(self.viewer)
+
+    def follow(self, username, follow=True):
+        self.client.post(f"/profile/{username}", f'{{"follow": {"true" if follow else "false"}}}', content_type="application/json")
+
+    def make_post(self, user, content):
+        self.client.force_login(user)
+        self.client.post("/make-post", f'{{"content": "{content}"}}', content_type="application/json")
+        self.client.force_login(self.viewer)
+
+    def following_feed(self):
+        return [post["content"] for post in self.client.get("/posts/following").json()["posts"]]
+
+    def test_posts_fan_out_to_followers(self):
+        self.follow("poster")
+        self.make_post(self.poster, "new post")
+
+        self.assertEqual(TimelineEntry.objects.filter(user=self.viewer).count(), 1)
+        self.assertEqual(self.following_feed(), ["new post"])
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        Post.objects.create(poster=self.poster, content="old post")
+
+        self.follow("poster")
+        self.assertEqual(self.following_feed(), ["old post"])
+
+        self.follow("poster", follow=False)
+        self.assertEqual(self.following_feed(), [])
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    def test_big_accounts_are_read_from_posts(self):
+        # poster has more followers than the fan-out limit
+        other = User.objects.create_user("other", "other@example.com", "password")
+        counters.follow(other, self.poster)
+        self.follow("poster")
+
+        self.make_post(self.poster, "big post")
+
+        self.assertFalse(TimelineEntry.objects.filter(post__content="big post").exists())
+        self.assertEqual(self.following_feed(), ["big post"])
+
+    def test_rebuild(self):
+        Post.objects.create(poster=self.poster, content="old post")
+        with self.settings(NETWORK_TIMELINES=False):
+            self.follow("poster")
+        self.assertFalse(TimelineEntry.objects.exists())
+
+        self.assertEqual(timelines.rebuild(), 1)
+        self.assertEqual(self.following_feed(), ["old post"])
+
+    def test_pages_and_trim(self):
+        self.follow("poster")
+        for i in range(12):
+            self.make_post(self.poster, f"post {i}")
+
+        # pages come from the timeline in order
+        first = self.client.get("/posts/following").json()
+        second = self.client.get("/posts/following", {"cursor": first["next_cursor"]}).json()
+        contents = [post["content"] for post in first["posts"] + second["posts"]]
+        self.assertEqual(contents, [f"post {i}" for i in range(11, -1, -1)])
+        self.assertEqual(self.client.get("/posts/following/2").json()["posts"], second["posts"])
+
+        with self.settings(NETWORK_TIMELINE_LENGTH=5):
+            out = io.StringIO()
+            call_command("trim_timelines", stdout=out)
+            self.assertIn("Deleted 7 timeline entries", out.getvalue())
+        self.assertEqual(self.following_feed(), [f"post {i}" for i in range(11, 6, -1)])
+
+    def test_dropping_under_the_limit(self):
+        # poster's post made while too big to fan out stays in the feed once they aren't
+        other = User.objects.create_user("other", "other@example.com", "password")
+        counters.follow(other, self.poster)
+        self.follow("poster")
+        self.make_post(self.poster, "big post")
+        self.assertFalse(TimelineEntry.objects.exists())
+
+        self.client.force_login(other)
+        self.follow("poster", follow=False)
+        self.client.force_login(self.viewer)
+
+        self.assertEqual(self.following_feed(), ["big post"])
+        self.assertTrue(TimelineEntry.objects.filter(user=self.viewer, post__content="big post").exists())
+
+
+class FeedCacheTests(TestCase):
+
+    def setUp(self):
+        cache.get_cache().clear()
+        self.viewer = User.objects.create_user("viewer", "viewer@example.com", "password")
+        self.poster = User.objects.create_user("poster", "poster@example.com", "password")
+        self.post = Post.objects.create(poster=self.poster, content="hello")
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get(url).json()
+        return len(queries), data
+
+    def test_anonymous_pages_are_cached(self):
+        for url in ["/posts/all/1", "/posts/all", "/profile/poster/1"]:
+            self.get(url)
+            num_queries, data = self.get(url)
+
+            # only the profile's user is looked up
+            self.assertLessEqual(num_queries, 1)
+
+    def test_viewer_state_is_cached_separately(self):
+        # an anonymous request caches the shared page
+        self.get("/posts/all/1")
+
+        self.client.force_login(self.viewer)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(f"/post/{self.post.pk}", '{"like": true}', content_type="application/json")
+
+        # session and user, then the page (the like changed the version)
+        # and the viewer's recent likes (the newest post id, then their likes since)
+        num_queries, data = self.get("/posts/all/1")
+        self.assertEqual(num_queries, 6)
+        self.assertTrue(data["posts"][0]["user_liked"])
+        self.assertEqual(data["posts"][0]["like_count"], 1)
+
+        # now it's all cached (just session and user)
+        num_queries, data = self.get("/posts/all/1")
+        self.assertEqual(num_queries, 2)
+        self.assertTrue(data["posts"][0]["user_liked"])
+
+        # other viewers see the shared page without the like
+        self.client.logout()
+        num_queries, data = self.get("/posts/all/1")
+        self.assertFalse(data["posts"][0]["user_liked"])
+        self.assertEqual(data["posts"][0]["like_count"], 1)
+
+    def test_writes_invalidate(self):
+        self.get("/profile/poster/1")
+
+        self.client.force_login(self.poster)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/make-post", '{"content": "second"}', content_type="application/json")
+            self.client.put(f"/post/{self.post.pk}", '{"edit": "edited"}', content_type="application/json")
+
+        num_queries, data = self.get("/profile/poster/1")
+        self.assertEqual([post["content"] for post in data["user_posts"]], ["second", "edited"])
+
+        self.client.force_login(self.viewer)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/profile/poster", '{"follow": true}', content_type="application/json")
+        num_queries, data = self.get("/profile/poster/1")
+        self.assertTrue(data["user_is_following"])
+        self.assertEqual(data["num_followers"], 1)
+
+    def test_bumps_wait_for_commit(self):
+        feed_cache = cache.get_cache()
+        before = cache.version(feed_cache, cache.ALL_POSTS)
+
+        # a write that's rolled back (or retried) doesn't bump or publish
+        with self.captureOnCommitCallbacks() as callbacks:
+            with self.assertRaises(IntegrityError), transaction.atomic():
+                cache.post_changed(self.poster.pk)
+                events.post_created(self.post)
+                Follow.objects.create(user=self.viewer, following=self.poster)
+                Follow.objects.create(user=self.viewer, following=self.poster)
+        self.assertEqual(callbacks, [])
+
+        # one that commits does, once it has
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with transaction.atomic():
+                cache.post_changed(self.poster.pk)
+                self.assertEqual(cache.version(feed_cache, cache.ALL_POSTS), before)
+        self.assertEqual(len(callbacks), 1)
+        self.assertNotEqual(cache.version(feed_cache, cache.ALL_POSTS), before)
+
+    def test_file_backend(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            file_cache = {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": cache_dir}
+            with self.settings(CACHES={"default": file_cache}):
+                self.get("/posts/all/1")
+                num_queries, data = self.get("/posts/all/1")
+                self.assertEqual(num_queries, 0)
+
+                with self.captureOnCommitCallbacks(execute=True):
+                    cache.post_changed(self.poster.pk)
+                num_queries, data = self.get("/posts/all/1")
+                self.assertEqual(num_queries, 2)
+
+    def test_per_process_cache_check(self):
+        # the default locmem cache is warned about by `check --deploy`
+        self.assertEqual([warning.id for warning in checks.check_feed_cache(None)], ["network.W001"])
+        with self.settings(NETWORK_FEED_CACHE=None):
+            self.assertEqual(checks.check_feed_cache(None), [])
+        file_cache = {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": "/tmp"}
+        with self.settings(CACHES={"default": file_cache}):
+            self.assertEqual(checks.check_feed_cache(None), [])
+
+
+class ConditionalGetTests(TestCase):
+
+    def setUp(self):
+        cache.get_cache().clear()
+        self.viewer = User.objects.create_user("viewer", "viewer@example.com", "password")
+        self.poster = User.objects.create_user("poster", "poster@example.com", "password")
+        self.post = Post.objects.create(poster=self.poster, content="hello")
+
+    def revalidate(self, url, response):
+        # requests url again with response's validators
+        with CaptureQueriesContext(connection) as queries:
+            again = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        return again, len(queries)
+
+    def age(self, *scopes):
+        # makes scopes' last change a few seconds old
+        # (Last-Modified is only sent once the second a scope changed in is over)
+        for scope in scopes:
+            cache.get_cache().set(cache._modified_key(scope), time.time() - 5, None)
+
+    def test_unchanged_pages_are_not_modified(self):
+        self.age(cache.ALL_POSTS, cache.profile_scope(self.poster.pk))
+        for url in ["/posts/all/1", "/posts/all", "/profile/poster/1", "/profile/poster"]:
+            response = self.client.get(url)
+            self.assertIn("ETag", response)
+            self.assertIn("Last-Modified", response)
+            self.assertIn("no-cache", response["Cache-Control"])
+
+            again, num_queries = self.revalidate(url, response)
+            self.assertEqual(again.status_code, 304)
+            self.assertEqual(again.content, b"")
+            self.assertEqual(num_queries, 0)
+
+            again = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+            self.assertEqual(again.status_code, 304)
+
+    def test_changes_are_modified(self):
+        all_posts = self.client.get("/posts/all/1")
+        poster_profile = self.client.get("/profile/poster/1")
+        viewer_profile = self.client.get("/profile/viewer/1")
+
+        self.client.force_login(self.viewer)
+
+        # viewers have their own validators
+        response, _ = self.revalidate("/posts/all/1", all_posts)
+        self.assertEqual(response.status_code, 200)
+
+        # a like changes the feed and the poster's profile
+        all_posts = self.client.get("/posts/all/1")
+        # (bumps happen when the write commits, see writes.after_commit)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(f"/post/{self.post.pk}", '{"like": true}', content_type="application/json")
+        for url, response in [("/posts/all/1", all_posts), ("/profile/poster/1", poster_profile)]:
+            response, _ = self.revalidate(url, response)
+            self.assertEqual(response.status_code, 200)
+
+        # a follow changes both profiles
+        viewer_profile = self.client.get("/profile/viewer/1")
+        poster_profile = self.client.get("/profile/poster/1")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/profile/poster", '{"follow": true}', content_type="application/json")
+        for url, response in [("/profile/viewer/1", viewer_profile), ("/profile/poster/1", poster_profile)]:
+            response, _ = self.revalidate(url, response)
+            self.assertEqual(response.status_code, 200)
+
+    def test_changes_in_the_same_second(self):
+        # a page that changed this second has no Last-Modified yet,
+        # so a second change in that second can't get a false 304
+        with mock.patch("time.time", return_value=2000000000.1):
+            response = self.client.get("/posts/all/1")
+            self.assertNotIn("Last-Modified", response)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                Post.objects.create(poster=self.poster, content="hello again")
+                cache.post_changed(self.poster.pk)
+            again = self.client.get("/posts/all/1", HTTP_IF_MODIFIED_SINCE=http_date(2000000000))
+            self.assertEqual(again.status_code, 200)
+            self.assertEqual(len(again.json()["posts"]), 2)
+
+        # and once the second is over it's a validator
+        with mock.patch("time.time", return_value=2000000001.5):
+            response = self.client.get("/posts/all/1")
+            self.assertEqual(response["Last-Modified"], http_date(2000000000))
+            again = self.client.get("/posts/all/1", HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+            self.assertEqual(again.status_code, 304)
+
+    def test_without_validators(self):
+        self.client.force_login(self.viewer)
+        self.assertNotIn("ETag", self.client.get("/posts/following"))
+        self.assertNotIn("ETag", self.client.get("/profile/nobody"))
+
+        with self.settings(NETWORK_FEED_CACHE=None):
+            self.assertNotIn("ETag", self.client.get("/posts/all"))
+
+
+class SearchTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("user", "user@example.com", "password")
+
+    def search(self, q, **params):
+        return self.client.get("/search", {"q": q, **params}).json()
+
+    def test_ranked_and_paginated(self):
+        # (the more often a word appears in a short post, the better it matches)
+        best = Post.objects.create(poster=self.user, content="cats cats cats")
+        for i in range(15):
+            Post.objects.create(poster=self.user, content=f"a cat in a long post about something else {i}")
+        Post.objects.create(poster=self.user, content="dogs only")
+
+        data = self.search("cat")
+        self.assertEqual(data["posts"][0]["post_id"], best.pk)
+        self.assertEqual(data["posts"][0]["poster"], "user")
+        self.assertIn("user_liked", data["posts"][0])
+
+        post_ids = [post["post_id"] for post in data["posts"]]
+        data = self.search("cat", cursor=data["next_cursor"])
+        post_ids += [post["post_id"] for post in data["posts"]]
+        self.assertIsNone(data["next_cursor"])
+
+        self.assertEqual(len(post_ids), 16)
+        self.assertEqual(len(set(post_ids)), 16)
+
+    def test_every_word_must_match(self):
+        Post.objects.create(poster=self.user, content="red apple")
+        Post.objects.create(poster=self.user, content="green apple")
+
+        self.assertEqual(len(self.search("apple")["posts"]), 2)
+        self.assertEqual(len(self.search("RED apple")["posts"]), 1)
+        # (operators and quotes are just words)
+        self.assertEqual(len(self.search('apple OR "pear')["posts"]), 0)
+        self.assertEqual(self.search("!!")["posts"], [])
+
+    def test_index_follows_edits_and_deletes(self):
+        post = Post.objects.create(poster=self.user, content="hello")
+        self.client.force_login(self.user)
+        self.client.put(f"/post/{post.pk}", '{"edit": "goodbye"}', content_type="application/json")
+
+        self.assertEqual(self.search("hello")["posts"], [])
+        self.assertEqual(len(self.search("goodbye")["posts"]), 1)
+
+        post.delete()
+        self.assertEqual(self.search("goodbye")["posts"], [])
+
+    def test_invalid_cursor(self):
+        response = self.client.get("/search", {"q": "hello", "cursor": "not a cursor"})
+        self.assertEqual(response.status_code, 400)
+
+
+class SuggestionTests(TestCase):
+
+    def setUp(self):
+        self.users = {
+            name: User.objects.create_user(name, f"{name}@example.com", "password")
+            for name in ["me", "friend1", "friend2", "popular", "active", "other"]
+        }
+        # me follows both friends, who both follow popular and one follows active and other
+        for user, following in [
+            ("me", "friend1"), ("me", "friend2"),
+            ("friend1", "popular"), ("friend2", "popular"),
+            ("friend1", "active"), ("friend1", "other"), ("friend1", "me"),
+        ]:
+            counters.follow(self.users[user], self.users[following])
+
+        # active's recent post weighs it above other
+        Post.objects.create(poster=self.users["active"], content="hello")
+
+    def usernames(self, user):
+        return [suggestion["username"] for suggestion in suggestions.suggested_users(user)]
+
+    def test_graph(self):
+        graph = suggestions.FollowGraph.load()
+        me = self.users["me"]
+        self.assertEqual(sorted(graph.followed_by(me.pk)), sorted([self.users["friend1"].pk, self.users["friend2"].pk]))
+        self.assertEqual(list(graph.followed_by(self.users["popular"].pk)), [])
+
+    def test_rebuild(self):
+        self.assertEqual(suggestions.rebuild(), Suggestion.objects.count())
+
+        # most overlap first, then the more active of the rest, without me or who I follow
+        self.assertEqual(self.usernames(self.users["me"]), ["popular", "active", "other"])
+        self.assertEqual(self.usernames(self.users["friend1"]), ["friend2"])
+
+    def test_follows_update_suggestions(self):
+        suggestions.rebuild()
+        self.client.force_login(self.users["me"])
+
+        self.client.post("/profile/popular", '{"follow": true}', content_type="application/json")
+        self.assertEqual(self.usernames(self.users["me"]), ["active", "other"])
+
+        self.client.post("/bulk", '{"operations": [{"op": "unfollow", "username": "friend1"}]}', content_type="application/json")
+        self.assertEqual(self.usernames(self.users["me"]), [])
+
+        response = self.client.get("/suggestions")
+        self.assertEqual(response.json(), {"users": []})
+
+    def test_endpoint(self):
+        suggestions.rebuild()
+        self.client.force_login(self.users["me"])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/suggestions")
+        self.assertEqual(response.json()["users"][0], {"username": "popular", "num_followers": 2})
+        # session, user, suggestions
+        self.assertEqual(len(queries), 3)
+
+        self.client.logout()
+        self.assertEqual(self.client.get("/suggestions").status_code, 400)
+
+
+class TrendingTests(TestCase):
+
+    def setUp(self):
+        cache.get_cache().clear()
+        self.poster = User.objects.create_user("poster", "poster@example.com", "password")
+        self.likers = [User.objects.create_user(f"liker{i}", f"liker{i}@example.com", "password") for i in range(3)]
+        self.posts = [Post.objects.create(poster=self.poster, content=f"post {i}") for i in range(15)]
+
+    def like(self, user, post, like=True):
+        self.client.force_login(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(f"/post/{post.pk}", json.dumps({"like": like}), content_type="application/json")
+
+    def trending_ids(self, **params):
+        return [post["post_id"] for post in self.client.get("/posts/trending", params).json()["posts"]]
+
+    def test_decay(self):
+        now = timezone.now()
+        self.assertAlmostEqual(trending.decayed_score(trending.log_weight(now), now), 1)
+        self.assertAlmostEqual(trending.decayed_score(trending.log_weight(now - trending.HALF_LIFE), now), 0.5)
+
+        # two likes a half life ago count as much as one now
+        old = trending.log_weight(now - trending.HALF_LIFE)
+        self.assertAlmostEqual(trending._log_add(old, old), trending.log_weight(now))
+
+    def test_scores_add_up_in_the_database(self):
+        # (the database adds to the stored score, so no like's read can be stale)
+        a_year_ago = trending.log_weight(timezone.now() - timedelta(days=365))
+        TrendingScore.objects.create(post=self.posts[0], log_score=a_year_ago)
+
+        trending.like_changed(self.posts[0].pk, True)
+        trending.like_changed(self.posts[0].pk, True)
+        score = TrendingScore.objects.get(post=self.posts[0]).log_score
+        self.assertAlmostEqual(trending.decayed_score(score), 2, places=3)
+
+        trending.like_changed(self.posts[0].pk, False)
+        score = TrendingScore.objects.get(post=self.posts[0]).log_score
+        self.assertAlmostEqual(trending.decayed_score(score), 1, places=3)
+
+        trending.like_changed(self.posts[0].pk, False)
+        self.assertFalse(TrendingScore.objects.exists())
+
+    def test_ranked_by_likes(self):
+        for liker in self.likers:
+            self.like(liker, self.posts[0])
+        self.like(self.likers[0], self.posts[1])
+        for liker in self.likers[:2]:
+            self.like(liker, self.posts[2])
+
+        self.assertEqual(self.trending_ids(), [self.posts[0].pk, self.posts[2].pk, self.posts[1].pk])
+
+        # unliking takes a post out once its score is gone
+        self.like(self.likers[0], self.posts[1], like=False)
+        self.assertEqual(self.trending_ids(), [self.posts[0].pk, self.posts[2].pk])
+
+        # the same through /bulk
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/bulk", json.dumps({"operations": [{"op": "like", "post_id": self.posts[3].pk}]}), content_type="application/json")
+        self.assertEqual(self.trending_ids()[-1], self.posts[3].pk)
+
+    def test_recent_likes_beat_old_ones(self):
+        old = trending.log_weight(timezone.now() - 3 * trending.HALF_LIFE)
+        TrendingScore.objects.create(post=self.posts[0], log_score=trending._log_add(old, old))
+        self.like(self.likers[0], self.posts[1])
+
+        self.assertEqual(self.trending_ids(), [self.posts[1].pk, self.posts[0].pk])
+
+    def test_pages(self):
+        for post in self.posts:
+            self.like(self.likers[0], post)
+
+        first = self.client.get("/posts/trending", {"count": 1}).json()
+        self.assertEqual(first["num_posts"], 15)
+        second = self.client.get("/posts/trending", {"cursor": first["next_cursor"]}).json()
+        self.assertIsNone(second["next_cursor"])
+        self.assertEqual(len(first["posts"]) + len(second["posts"]), 15)
+
+        page = self.client.get("/posts/trending/2").json()
+        self.assertEqual(page["posts"], second["posts"])
+        self.assertEqual(page["num_pages"], 2)
+
+        self.assertEqual(self.client.get("/posts/trending", {"cursor": "x"}).status_code, 400)
+
+    def test_reads_the_cached_top(self):
+        self.like(self.likers[0], self.posts[0])
+        self.client.logout()
+        self.trending_ids()
+
+        # a new like updates the cached top posts without reloading them
+        self.like(self.likers[1], self.posts[1])
+        self.client.logout()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(set(self.trending_ids()), {self.posts[0].pk, self.posts[1].pk})
+        # just the page's posts
+        self.assertEqual(len(queries), 1)
+
+    def test_compact(self):
+        cold = trending.log_weight(timezone.now() - timedelta(days=3))
+        TrendingScore.objects.create(post=self.posts[0], log_score=cold)
+        self.like(self.likers[0], self.posts[1])
+
+        self.assertEqual(trending.compact(), 1)
+        self.assertEqual(self.trending_ids(), [self.posts[1].pk])
+
+
+class BulkTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("user", "user@example.com", "password")
+        self.other = User.objects.create_user("other", "other@example.com", "password")
+        self.posts = [Post.objects.create(poster=self.other, content=f"post {i}") for i in range(3)]
+        self.client.force_login(self.user)
+
+    def bulk(self, operations):
+        return self.client.post("/bulk", {"operations": operations}, content_type="application/json")
+
+    def test_operations_are_idempotent(self):
+        operations = [{"op": "like", "post_id": post.pk} for post in self.posts]
+        operations.append({"op": "follow", "username": "other"})
+
+        for i in range(2):
+            data = self.bulk(operations).json()
+            self.assertEqual(data["like_counts"], {str(post.pk): 1 for post in self.posts})
+            self.assertEqual(data["follower_counts"], {"other": 1})
+            self.assertEqual(data["num_following"], 1)
+
+        self.assertEqual(counters.reconcile_counters(fix=False), {"like_count": 0, "num_followers": 0, "num_following": 0})
+
+    def test_later_operations_win(self):
+        data = self.bulk([
+            {"op": "like", "post_id": self.posts[0].pk},
+            {"op": "unlike", "post_id": self.posts[0].pk},
+            {"op": "follow", "username": "other"},
+            {"op": "unfollow", "username": "other"},
+            {"op": "follow", "username": "user"},
+            {"op": "like", "post_id": 0},
+        ]).json()
+
+        self.assertEqual(data["like_counts"], {str(self.posts[0].pk): 0})
+        self.assertEqual(data["follower_counts"], {"other": 0})
+        self.assertEqual(data["ignored"], [0, "user"])
+        self.assertFalse(Follow.objects.exists())
+
+    def test_invalid_operation(self):
+        response = self.bulk([{"op": "delete", "post_id": self.posts[0].pk}])
+        self.assertEqual(response.status_code, 400)
+
+    def test_operations_not_a_list(self):
+        for operations in (5, "like", {"op": "like", "post_id": self.posts[0].pk}, None):
+            self.assertEqual(self.bulk(operations).status_code, 400)
+
+    @override_settings(NETWORK_BULK_MAX_OPERATIONS=2)
+    def test_too_many_operations(self):
+        operations = [{"op": "like", "post_id": post.pk} for post in self.posts]
+        self.assertEqual(self.bulk(operations).status_code, 400)
+        self.assertEqual(self.bulk(operations[:2]).status_code, 200)
+
+    def test_bool_post_ids(self):
+        for post_id in (True, False):
+            response = self.bulk([{"op": "like", "post_id": post_id}])
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(Post.objects.filter(users_liked=self.user).exists())
+
+
+class AsyncViewTests(TransactionTestCase):
+    # (the async views read with connections of their own, which only see committed rows)
+
+    def setUp(self):
+        cache.get_cache().clear()
+        self.viewer = User.objects.create_user("viewer", "viewer@example.com", "password")
+        self.poster = User.objects.create_user("poster", "poster@example.com", "password")
+        counters.follow(self.viewer, self.poster)
+        for i in range(15):
+            post = Post.objects.create(poster=self.poster, content=f"post {i}")
+            counters.like(post, self.viewer)
+        self.client.force_login(self.viewer)
+
+    def test_same_responses_as_sync_views(self):
+        for url in ["/posts/all/1", "/posts/following/2", "/posts/all", "/profile/poster/1", "/profile/poster"]:
+            sync_data = self.client.get(url).json()
+            async_data = self.client.get(f"/async{url}").json()
+            self.assertEqual(sync_data, async_data)
+
+    def test_errors(self):
+        self.assertEqual(self.client.get("/async/profile/nobody").status_code, 404)
+        self.assertEqual(self.client.get("/async/posts/all", {"cursor": "bad"}).status_code, 400)
+        self.assertEqual(self.client.post("/async/posts/all").status_code, 400)
+
+        self.client.logout()
+        self.assertEqual(self.client.get("/async/posts/following").status_code, 400)
+
+    def test_instrumented_only_when_turned_on(self):
+        with mock.patch.object(instrumentation, "instrument_connections") as instrument:
+            with self.settings(NETWORK_INSTRUMENTATION=False):
+                self.client.get("/async/posts/all/1")
+            self.assertFalse(instrument.called)
+
+            with self.settings(NETWORK_INSTRUMENTATION=True):
+                self.client.get("/async/posts/all/1")
+            self.assertTrue(instrument.called)
+
+
+class EventStreamTests(TestCase):
+
+    async def stream(self, query, publish):
+        # runs the event stream app until publish() has been called and
+        # its events sent, then returns everything that was sent
+        sent = []
+        disconnect = asyncio.Event()
+
+        async def receive():
+            await disconnect.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "method": "GET", "path": "/events", "query_string": query.encode(), "headers": []}
+        app = asyncio.ensure_future(event_stream(scope, receive, send))
+
+        # wait until subscribed
+        while not sent:
+            await asyncio.sleep(0.01)
+
+        await publish()
+        await asyncio.sleep(0.05)
+        disconnect.set()
+        await app
+
+        return b"".join(message.get("body", b"") for message in sent[1:]).decode()
+
+    async def test_streams_wanted_events(self):
+        async def publish():
+            events.publish("post", {"post_id": 3, "poster": "poster", "poster_id": 1})
+            events.like_count_changed(1, 5)
+            events.like_count_changed(2, 7)
+
+        body = await self.stream("feed=all&posts=1", publish)
+
+        self.assertIn('event: post\ndata: {"post_id": 3', body)
+        self.assertIn('event: like\ndata: {"post_id": 1, "like_count": 5}', body)
+        self.assertNotIn('"post_id": 2', body)
+        self.assertFalse(events.get_broker().subscriptions)
+
+    async def test_views_publish_from_other_threads(self):
+        @sync_to_async
+        def like():
+            user = User.objects.create_user("user", "user@example.com", "password")
+            post = Post.objects.create(poster=user, content="hello")
+            self.client.force_login(user)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.put(f"/post/{post.pk}", '{"like": true}', content_type="application/json")
+            return post.pk
+
+        post_ids = []
+
+        async def publish():
+            post_ids.append(await like())
+
+        body = await self.stream("posts=" + ",".join(str(i) for i in range(1, 100)), publish)
+        self.assertIn(f'"post_id": {post_ids[0]}, "like_count": 1', body)
+
+
+class SeedTests(TestCase):
+    def test_seed(self):
+        user_ids = seeding.seed(20, 200, 100, 300, prefix="seed", random_seed=1)
+
+        self.assertEqual(len(user_ids), 20)
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertFalse(Follow.objects.filter(user=F("following")).exists())
+
+        # power law: the first user posts the most
+        counts = {user_id: Post.objects.filter(poster_id=user_id).count() for user_id in user_ids}
+        self.assertEqual(max(counts, key=counts.get), user_ids[0])
+
+        # timestamps were kept, oldest first
+        timestamps = list(Post.objects.order_by("pk").values_list("timestamp", flat=True))
+        self.assertEqual(timestamps, sorted(timestamps))
+        self.assertLess(timestamps[0], timestamps[-1] - timedelta(days=300))
+
+        # the counters match the seeded rows
+        self.assertEqual(counters.reconcile_counters(fix=False), {"like_count": 0, "num_followers": 0, "num_following": 0})
+
+
+@override_settings(NETWORK_INSTRUMENTATION=True, NETWORK_FEED_CACHE=None)
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        instrumentation.registry.clear()
+        self.user = User.objects.create_user("user", "user@example.com", "password")
+        for i in range(3):
+            Post.objects.create(poster=self.user, content=f"post {i}")
+
+    def test_logs_request(self):
+        with self.assertLogs("network.instrumentation", "INFO") as logs:
+            response = self.client.get("/posts/all")
+
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line["route"], "posts-cursor")
+        self.assertEqual(line["status"], 200)
+        self.assertEqual(line["bytes"], len(response.content))
+        self.assertGreater(line["queries"], 0)
+        self.assertGreater(line["serialize_ms"], 0)
+        self.assertEqual(line["repeated_queries"], [])
+
+    @override_settings(NETWORK_INSTRUMENTATION_REPEATED_QUERIES=3)
+    def test_flags_repeated_queries(self):
+        # the profile view doesn't repeat itself
+        with self.assertLogs("network.instrumentation", "INFO") as logs:
+            self.client.get(f"/profile/{self.user.username}")
+
+        self.assertEqual(logs.records[0].levelname, "INFO")
+
+        # the same statements run by a loop in one request
+        def n_plus_one(request):
+            for post in Post.objects.all():
+                post.poster.username
+            return instrumentation.JsonResponse({})
+
+        middleware = instrumentation.InstrumentationMiddleware(n_plus_one)
+        request = RequestFactory().get("/")
+        with self.assertLogs("network.instrumentation", "WARNING") as logs:
+            middleware(request)
+
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line["repeated_queries"][0]["count"], 3)
+
+    def test_metrics(self):
+        self.client.get("/posts/all")
+        self.client.get("/posts/all")
+
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        metrics = response.content.decode()
+        self.assertIn('network_request_duration_seconds_count{route="posts-cursor"} 2', metrics)
+        self.assertIn('network_request_queries_bucket{route="posts-cursor",le="+Inf"} 2', metrics)
+
+    @override_settings(NETWORK_INSTRUMENTATION=False)
+    def test_off(self):
+        self.client.get("/posts/all")
+        self.assertEqual(self.client.get("/metrics").status_code, 404)
+        self.assertFalse(instrumentation.registry.histograms)
+
+
+class SQLiteProductionTests(TestCase):
+    def test_backend_options(self):
+        with tempfile.TemporaryDirectory() as directory:
+            settings_dict = {
+                **connection.settings_dict,
+                "NAME": os.path.join(directory, "db.sqlite3"),
+                "OPTIONS": {"init_command": "PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL", "transaction_mode": "IMMEDIATE"},
+            }
+            db = sqlite_backend.DatabaseWrapper(settings_dict)
+            try:
+                with db.cursor() as cursor:
+                    cursor.execute("PRAGMA journal_mode")
+                    self.assertEqual(cursor.fetchone()[0], "wal")
+                    cursor.execute("PRAGMA synchronous")
+                    self.assertEqual(cursor.fetchone()[0], 1)
+
+                # an immediate transaction holds the write lock before it writes
+                db.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+                other = sqlite3.connect(settings_dict["NAME"], timeout=0)
+                with self.assertRaisesMessage(sqlite3.OperationalError, "database is locked"):
+                    other.execute("BEGIN IMMEDIATE")
+                other.close()
+                db.set_autocommit(True)
+            finally:
+                db.close()
+
+    def test_retry_locked(self):
+        calls = []
+
+        def write():
+            calls.append(1)
+            if len(calls) < 3:
+                raise OperationalError("database is locked")
+            return "done"
+
+        self.assertEqual(writes.retry_locked(write, retries=5, base_delay=0), "done")
+        self.assertEqual(len(calls), 3)
+
+        calls.clear()
+        with self.assertRaises(OperationalError):
+            writes.retry_locked(write, retries=1, base_delay=0)
+
+        def broken():
+            raise OperationalError("no such table")
+
+        with self.assertRaisesMessage(OperationalError, "no such table"):
+            writes.retry_locked(broken, retries=5, base_delay=0)
+
+    @override_settings(NETWORK_SQLITE_PRODUCTION=True, NETWORK_WRITE_QUEUE_TIMEOUT=0.01)
+    def test_write_queue(self):
+        user = User.objects.create_user("user", "user@example.com", "password")
+        self.client.force_login(user)
+
+        response = self.client.post("/make-post", '{"content": "hello"}', content_type="application/json")
+        self.assertEqual(response.status_code, 201)
+
+        # another write is taking too long
+        with writes._write_lock:
+            response = self.client.post("/make-post", '{"content": "hello"}', content_type="application/json")
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response["Retry-After"], "1")
+
+            # reads don't wait
+            self.assertEqual(self.client.get("/posts/all").status_code, 200)
+
+        self.assertEqual(Post.objects.count(), 1)
+
+
+@override_settings(NETWORK_JOBS_ASYNC=True, NETWORK_TIMELINES=True)
+class JobTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("user", "user@example.com", "password")
+        self.poster = User.objects.create_user("poster", "poster@example.com", "password")
+        self.client.force_login(self.user)
+
+    def follow(self, follow=True):
+        self.client.post("/profile/poster", json.dumps({"follow": follow}), content_type="application/json")
+
+    def test_deferred_until_run(self):
+        self.follow()
+        self.client.force_login(self.poster)
+        self.client.post("/make-post", '{"content": "hello"}', content_type="application/json")
+
+        # the post and follow are saved, their side work is waiting
+        self.assertEqual(Post.objects.count(), 1)
+        self.assertEqual(Follow.objects.count(), 1)
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(Job.objects.count(), 3)
+
+        self.assertEqual(jobs.run_pending(), 3)
+        self.assertEqual(TimelineEntry.objects.get().user, self.user)
+        self.assertFalse(Job.objects.exists())
+        self.assertEqual(jobs.run_pending(), 0)
+
+    def test_keys(self):
+        Post.objects.create(poster=self.poster, content="hello")
+
+        # one job each while they're waiting, run for how things are now
+        self.follow()
+        self.follow(False)
+        self.follow()
+        self.assertEqual(sorted(Job.objects.values_list("name", flat=True)), ["follow_changed", "update_suggestions"])
+
+        jobs.run_pending()
+        self.assertEqual(TimelineEntry.objects.get().user, self.user)
+
+        # added again once they've run
+        self.follow(False)
+        self.assertEqual(Job.objects.count(), 2)
+        jobs.run_pending()
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    def test_retries(self):
+        def broken(batch):
+            Post.objects.create(poster=self.poster, content="rolled back")
+            raise ValueError("broken")
+
+        jobs.HANDLERS["broken"] = broken
+        self.addCleanup(jobs.HANDLERS.pop, "broken")
+        jobs.enqueue("broken", {})
+
+        with self.assertLogs("network.jobs", "ERROR"):
+            self.assertEqual(jobs.run_pending(), 1)
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), (Job.PENDING, 1))
+        self.assertIn("ValueError: broken", job.last_error)
+        self.assertFalse(Post.objects.exists())
+
+        # not due again yet
+        self.assertEqual(jobs.run_pending(), 0)
+
+        for attempt in range(jobs.MAX_ATTEMPTS - 1):
+            Job.objects.update(run_at=timezone.now())
+            with self.assertLogs("network.jobs", "ERROR"):
+                jobs.run_pending()
+        self.assertEqual(Job.objects.get().status, Job.FAILED)
+
+    def test_deleted_with_their_work(self):
+        # a job whose delete fails is run again, so its work is rolled back with it
+        def create_post(batch):
+            Post.objects.create(poster=self.poster, content="once")
+
+        jobs.HANDLERS["create_post"] = create_post
+        self.addCleanup(jobs.HANDLERS.pop, "create_post")
+        jobs.enqueue("create_post", {})
+
+        with mock.patch.object(QuerySet, "delete", side_effect=OperationalError("locked")):
+            with self.assertLogs("network.jobs", "ERROR"):
+                jobs.run_pending()
+        self.assertFalse(Post.objects.exists())
+        self.assertEqual(Job.objects.get().status, Job.PENDING)
+
+        Job.objects.update(run_at=timezone.now())
+        jobs.run_pending()
+        self.assertEqual(Post.objects.count(), 1)
+        self.assertFalse(Job.objects.exists())
+
+    def test_committed_with_the_write(self):
+        # a post whose job can't be stored isn't saved either
+        self.client.force_login(self.poster)
+        with mock.patch.object(jobs, "enqueue_many", side_effect=OperationalError("lost")):
+            with self.assertRaises(OperationalError):
+                self.client.post("/make-post", '{"content": "hello"}', content_type="application/json")
+        self.assertFalse(Post.objects.exists())
+
+        self.client.force_login(self.user)
+        with mock.patch.object(jobs, "enqueue_many", side_effect=OperationalError("lost")):
+            with self.assertRaises(OperationalError):
+                self.follow()
+        self.assertFalse(Follow.objects.exists())
+
+    @override_settings(NETWORK_JOBS_ASYNC=False)
+    def test_sync(self):
+        self.follow()
+        self.client.force_login(self.poster)
+        self.client.post("/make-post", '{"content": "hello"}', content_type="application/json")
+
+        self.assertEqual(TimelineEntry.objects.count(), 1)
+        self.assertFalse(Job.objects.exists())
+
+
+class FollowListTests(TestCase):
+
+    def setUp(self):
+        cache.get_cache().clear()
+        self.user = User.objects.create_user("user", "user@example.com", "password")
+        self.viewer = User.objects.create_user("viewer", "viewer@example.com", "password")
+        self.followers = [
+            User.objects.create_user(f"follower{i}", f"follower{i}@example.com", "password")
+            for i in range(follows.FOLLOWS_PAGE_SIZE + 5)
+        ]
+        for follower in self.followers:
+            counters.follow(follower, self.user)
+        counters.follow(self.viewer, self.followers[-1])
+        self.client.force_login(self.viewer)
+
+    def test_pages(self):
+        first = self.client.get("/profile/user/followers").json()
+        usernames = [user["username"] for user in first["users"]]
+        self.assertEqual(usernames, [f"follower{i}" for i in range(len(self.followers) - 1, 4, -1)])
+        self.assertEqual([user["viewer_follows"] for user in first["users"]][:2], [True, False])
+
+        second = self.client.get("/profile/user/followers", {"cursor": first["next_cursor"]}).json()
+        self.assertEqual([user["username"] for user in second["users"]], [f"follower{i}" for i in range(4, -1, -1)])
+        self.assertIsNone(second["next_cursor"])
+
+        following = self.client.get("/profile/viewer/following").json()
+        self.assertEqual(following["users"], [{"username": self.followers[-1].username, "viewer_follows": True}])
+
+        self.assertEqual(self.client.get("/profile/nobody/followers").status_code, 404)
+        self.assertEqual(self.client.get("/profile/user/followers", {"cursor": "x"}).status_code, 400)
+
+    def test_cached_first_page(self):
+        self.client.get("/profile/user/followers")
+
+        # the page and who the viewer follows are cached
+        # (just the session and user lookups)
+        with self.assertNumQueries(2):
+            self.client.get("/profile/user/followers")
+
+        # following someone changes both of their lists
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/profile/user", json.dumps({"follow": True}), content_type="application/json")
+        self.assertEqual(self.client.get("/profile/user/followers").json()["users"][0]["username"], "viewer")
+        self.assertEqual(self.client.get("/profile/viewer/following").json()["users"][0]["username"], "user")
+
+    def test_user_registered_later(self):
+        # a username that isn't taken isn't cached as missing
+        self.assertEqual(self.client.get("/profile/newbie/followers").status_code, 404)
+        self.client.post("/register", {
+            "username": "newbie", "email": "newbie@example.com", "password": "password", "confirmation": "password",
+        })
+        self.assertEqual(self.client.get("/profile/newbie/followers").status_code, 200)
+        self.assertEqual(self.client.get("/profile/newbie/1").status_code, 200)
+
+
+class IngestTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("user", "user@example.com", "password")
+        self.follower = User.objects.create_user("follower", "follower@example.com", "password")
+        counters.follow(self.follower, self.user)
+
+    @override_settings(NETWORK_TIMELINES=True)
+    def test_endpoint(self):
+        self.client.force_login(self.user)
+        lines = [
+            json.dumps({"content": "first"}),
+            "",
+            "not json",
+            json.dumps({"content": "x" * 281}),
+            json.dumps({"content": "x" * 280}),
+            json.dumps(["content"]),
+            json.dumps({"content": "   "}),
+        ]
+        response = self.client.post("/import-posts", "\n".join(lines), content_type="application/x-ndjson")
+
+        self.assertEqual(response.json(), {
+            "created": 2,
+            "num_errors": 4,
+            "errors": [
+                {"line": 3, "error": "Invalid JSON."},
+                {"line": 4, "error": "Content is longer than 280 characters."},
+                {"line": 6, "error": "Expected a JSON object."},
+                {"line": 7, "error": "Content required."},
+            ],
+        })
+        self.assertEqual(list(self.user.posts.order_by("pk").values_list("content", flat=True)), ["first", "x" * 280])
+
+        # with the same side work as make_post
+        self.assertEqual(TimelineEntry.objects.filter(user=self.follower).count(), 2)
+        self.assertEqual(self.client.get("/posts/all").json()["posts"][0]["content"], "x" * 280)
+
+    def test_command(self):
+        lines = [json.dumps({"poster": "user" if i % 2 else "follower", "content": f"post {i}"}) for i in range(5)]
+        lines.append(json.dumps({"poster": "nobody", "content": "hello"}))
+        lines.append(json.dumps({"content": "hello"}))
+
+        with tempfile.NamedTemporaryFile("w", suffix=".ndjson", delete=False) as f:
+            f.write("\n".join(lines))
+        self.addCleanup(os.remove, f.name)
+
+        out, err = io.StringIO(), io.StringIO()
+        call_command("import_posts", f.name, chunk_size=2, stdout=out, stderr=err)
+
+        self.assertIn("Imported 5 post(s), skipped 2 line(s).", out.getvalue())
+        self.assertEqual(err.getvalue().splitlines(), ["line 6: Unknown poster.", "line 7: Poster required."])
+        self.assertEqual(self.user.posts.count(), 2)
+        self.assertEqual(self.follower.posts.count(), 3)
+
+    def test_long_lines(self):
+        stream = io.BytesIO(b"a" * (ingest.MAX_LINE_BYTES * 2) + b"\nshort\n")
+        self.assertEqual(list(ingest.read_lines(stream)), [None, b"short\n"])
+
+
+@override_settings(NETWORK_USER_CACHE_TTL=30, NETWORK_FEED_CACHE=None)
+class UserCacheTests(TestCase):
+
+    def setUp(self):
+        auth.user_cache.clear()
+        self.addCleanup(auth.user_cache.clear)
+        self.user = User.objects.create_user("user", "user@example.com", "password")
+        self.client.login(username="user", password="password")
+
+    def test_cached_user(self):
+        self.client.get("/posts/following")
+
+        # just the session and the feed
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/posts/following")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any('FROM "network_user"' in query["sql"] for query in queries.captured_queries))
+
+    @override_settings(SESSION_ENGINE="django.contrib.sessions.backends.signed_cookies")
+    def test_signed_cookie_sessions(self):
+        self.client.login(username="user", password="password")
+        self.client.get("/posts/following")
+
+        # no auth queries at all
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/posts/following")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any(
+            'FROM "network_user"' in query["sql"] or "django_session" in query["sql"]
+            for query in queries.captured_queries
+        ))
+
+    def test_logout(self):
+        self.client.get("/posts/following")
+        self.client.get("/logout")
+        self.assertNotIn(self.user.pk, auth.user_cache.entries)
+        self.assertEqual(self.client.get("/posts/following").status_code, 400)
+
+    def test_password_change(self):
+        other = self.client_class()
+        other.login(username="user", password="password")
+        other.get("/posts/following")
+
+        # the other session's auth hash no longer matches
+        self.user.set_password("new password")
+        self.user.save()
+        self.assertEqual(other.get("/posts/following").status_code, 400)
+
+    def test_expires(self):
+        self.client.get("/posts/following")
+        with override_settings(NETWORK_USER_CACHE_TTL=-1):
+            auth.user_cache.set(self.user, "django.contrib.auth.backends.ModelBackend")
+        self.assertIsNone(auth.user_cache.get(self.user.pk, "django.contrib.auth.backends.ModelBackend", self.user.get_session_auth_hash()))
+
+    @override_settings(NETWORK_USER_CACHE_SIZE=1)
+    def test_lru(self):
+        other = User.objects.create_user("other", "other@example.com", "password")
+        backend = "django.contrib.auth.backends.ModelBackend"
+        auth.user_cache.set(self.user, backend)
+        auth.user_cache.set(other, backend)
+        self.assertEqual(list(auth.user_cache.entries), [other.pk])
+
+
+class ViewerStateTests(TestCase):
+
+    def setUp(self):
+        cache.get_cache().clear()
+        self.viewer = User.objects.create_user("viewer", "viewer@example.com", "password")
+        self.poster = User.objects.create_user("poster", "poster@example.com", "password")
+        self.other = User.objects.create_user("other", "other@example.com", "password")
+        self.posts = [Post.objects.create(poster=self.poster, content=f"post {i}") for i in range(3)]
+        self.client.force_login(self.viewer)
+
+    def lookup(self, posts, users):
+        return self.client.get("/viewer-state", {"posts": ",".join(map(str, posts)), "users": ",".join(users)}).json()
+
+    def test_lookup(self):
+        counters.like(self.posts[1], self.viewer)
+        counters.follow(self.viewer, self.poster)
+        post_ids = [post.pk for post in self.posts]
+
+        self.assertEqual(self.lookup(post_ids, ["poster", "other", "nobody"]), {"liked": [self.posts[1].pk], "following": ["poster"]})
+
+        # cached until the viewer likes or follows something
+        with self.assertNumQueries(2):
+            self.lookup(post_ids, ["poster", "other"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(f"/post/{self.posts[0].pk}", '{"like": true}', content_type="application/json")
+            self.client.post("/profile/other", '{"follow": true}', content_type="application/json")
+        self.assertEqual(
+            self.lookup(post_ids, ["poster", "other"]),
+            {"liked": [self.posts[0].pk, self.posts[1].pk], "following": ["poster", "other"]},
+        )
+
+        self.assertEqual(self.client.get("/viewer-state", {"posts": "x"}).status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.client.get("/viewer-state").status_code, 400)
+
+    def test_older_posts(self):
+        # likes of posts older than the cached ones are looked up
+        counters.like(self.posts[0], self.viewer)
+        self.addCleanup(setattr, viewer_state, "RECENT_POSTS", viewer_state.RECENT_POSTS)
+        viewer_state.RECENT_POSTS = 1
+        self.assertEqual(viewer_state.liked_post_ids(self.viewer, [post.pk for post in self.posts]), {self.posts[0].pk})
+
+
+class ArchiveTests(TestCase):
+
+    def setUp(self):
+        cache.get_cache().clear()
+        self.poster = User.objects.create_user("poster", "poster@example.com", "password")
+        self.liker = User.objects.create_user("liker", "liker@example.com", "password")
+
+        # 12 posts from last year, then 3 from today (newest last)
+        now = timezone.now()
+        self.posts = []
+        for i in range(15):
+            post = Post.objects.create(poster=self.poster, content=f"post {i}")
+            days_ago = 400 - i if i < 12 else 0
+            Post.objects.filter(pk=post.pk).update(timestamp=now - timedelta(days=days_ago, minutes=15 - i))
+            self.posts.append(post)
+        counters.like(self.posts[0], self.liker)
+
+    def test_archive(self):
+        out = io.StringIO()
+        call_command("archive_posts", days=30, batch_size=5, stdout=out)
+        self.assertIn("Archived 12 post(s)", out.getvalue())
+
+        self.assertEqual(Post.objects.count(), 3)
+        archived = ArchivedPost.objects.get(pk=self.posts[0].pk)
+        self.assertEqual((archived.content, archived.like_count, archived.liked_by), ("post 0", 1, [self.liker.pk]))
+        self.assertFalse(Post.users_liked.through.objects.exists())
+
+        # nothing left to do
+        self.assertEqual(archive.archive(30), 0)
+
+        # only live posts in the all posts feed
+        self.assertEqual(len(self.client.get("/posts/all").json()["posts"]), 3)
+
+    def test_profile_pages(self):
+        archive.archive(30)
+        newest_first = [f"post {i}" for i in range(14, -1, -1)]
+
+        # cursor pages carry on into the archive
+        contents = []
+        cursor = ""
+        while cursor is not None:
+            data = self.client.get("/profile/poster", {"cursor": cursor}).json()
+            contents += [post["content"] for post in data["user_posts"]]
+            cursor = data["next_cursor"]
+        self.assertEqual(contents, newest_first)
+
+        # and so do numbered pages
+        first = self.client.get("/profile/poster/1").json()
+        second = self.client.get("/profile/poster/2").json()
+        self.assertEqual(first["num_pages"], 2)
+        self.assertEqual([post["content"] for post in first["user_posts"] + second["user_posts"]], newest_first)
+        self.assertEqual(second["user_posts"][-1]["like_count"], 1)
+
+        self.assertEqual(self.client.get("/profile/poster", {"count": 1}).json()["num_posts"], 15)
+
+    def test_archived_likes(self):
+        # the liker still sees that they liked an archived post once nothing about it is cached
+        self.client.force_login(self.liker)
+        archive.archive(30)
+        cache.get_cache().clear()
+
+        oldest = self.client.get("/profile/poster/2").json()["user_posts"][-1]
+        self.assertEqual((oldest["post_id"], oldest["archived"]), (self.posts[0].pk, True))
+        self.assertTrue(oldest["user_liked"])
+        self.assertFalse(self.client.get("/profile/poster/2").json()["user_posts"][0]["user_liked"])
+
+        lookup = self.client.get("/viewer-state", {"posts": f"{self.posts[0].pk},{self.posts[1].pk}"}).json()
+        self.assertEqual(lookup["liked"], [self.posts[0].pk])
+        with override_settings(NETWORK_FEED_CACHE=None):
+            self.assertTrue(self.client.get("/profile/poster/2").json()["user_posts"][-1]["user_liked"])
+
+
+@override_settings(NETWORK_READ_REPLICAS=["replica"], NETWORK_FEED_CACHE=None)
+class ReplicaTests(TransactionTestCase):
+    # (in tests the replica is the default database under another connection)
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        self.user = User.objects.create_user("user", "user@example.com", "password")
+        Post.objects.create(poster=self.user, content="post")
+        self.client.force_login(self.user)
+
+    def queries(self, method, *args, **kwargs):
+        # (the response, the number of queries on the default database, the number on the replica)
+        with CaptureQueriesContext(connections["default"]) as primary:
+            with CaptureQueriesContext(connections["replica"]) as replica:
+                response = getattr(self.client, method)(*args, **kwargs)
+        return response, len(primary), len(replica)
+
+    def test_reads_go_to_the_replica(self):
+        for url, posts_key in [("/posts/all/1", "posts"), ("/profile/user/1", "user_posts")]:
+            response, primary, replica = self.queries("get", url)
+            self.assertEqual(response.json()[posts_key][0]["content"], "post")
+            self.assertGreater(replica, 0, url)
+            self.assertEqual(primary, 0, url)
+
+        # (the async views read in pool threads, with connections of their own,
+        # so the router's choices are recorded instead of the queries)
+        reads = []
+
+        def db_for_read(model, **hints):
+            reads.append(routers.current_replica())
+            return reads[-1]
+
+        with mock.patch.object(routers.ReplicaRouter, "db_for_read", side_effect=db_for_read):
+            for url, posts_key in [("/async/posts/all/1", "posts"), ("/async/profile/user/1", "user_posts")]:
+                reads.clear()
+                self.assertEqual(self.client.get(url).json()[posts_key][0]["content"], "post")
+                self.assertEqual(set(reads), {"replica"}, url)
+
+        # other views read from the default database
+        response, primary, replica = self.queries("get", "/viewer-state", {"posts": "1"})
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+    def test_writes_stick_to_the_primary(self):
+        response, primary, replica = self.queries("post", "/make-post", '{"content": "new post"}', content_type="application/json")
+        self.assertEqual(replica, 0)
+        self.assertGreater(primary, 0)
+        self.assertEqual(response.cookies[routers.STICKY_COOKIE]["max-age"], 10)
+
+        # the writer reads from the default database until the cookie expires
+        response, primary, replica = self.queries("get", "/posts/all/1")
+        self.assertEqual(response.json()["posts"][0]["content"], "new post")
+        self.assertEqual(replica, 0)
+
+        del self.client.cookies[routers.STICKY_COOKIE]
+        response, primary, replica = self.queries("get", "/posts/all/1")
+        self.assertEqual(primary, 0)
+
+    @override_settings(NETWORK_FEED_CACHE="default")
+    def test_no_validators_while_a_replica_may_lag(self):
+        # a page read from a replica right after a write could be from before
+        # it, so it doesn't get the new version's validators
+        self.client.post("/make-post", '{"content": "new post"}', content_type="application/json")
+        del self.client.cookies[routers.STICKY_COOKIE]
+        etag = cache.etag(cache.ALL_POSTS, self.user)
+
+        response, primary, replica = self.queries("get", "/posts/all/1", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(replica, 0)
+        self.assertNotIn("ETag", response)
+        self.assertNotIn("Last-Modified", response)
+
+        # once the replica has had time to catch up, it does
+        with mock.patch("time.time", return_value=time.time() + 11):
+            response = self.client.get("/posts/all/1")
+            self.assertEqual(response["ETag"], etag)
+            self.assertEqual(self.client.get("/posts/all/1", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    @override_settings(NETWORK_FEED_CACHE="default")
+    def test_cached_from_replica(self):
+        # what's cached from a replica isn't seen by requests reading the default database
+        cache.get_cache().clear()
+        token = routers._replica.set("replica")
+        try:
+            self.assertEqual(cache.cached("scope", "key", lambda: "stale"), "stale")
+        finally:
+            routers._replica.reset(token)
+        self.assertEqual(cache.cached("scope", "key", lambda: "fresh"), "fresh")
+
+    @override_settings(NETWORK_READ_REPLICAS=[])
+    def test_no_replicas(self):
+        response, primary, replica = self.queries("get", "/posts/all/1")
+        self.assertEqual(replica, 0)
+        self.assertNotIn(routers.STICKY_COOKIE, response.cookies)
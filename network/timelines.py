@@ -0,0 +1,147 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from .models import Post, Follow, TimelineEntry
+
+
+# fan-out on write for the "following" feed
+
+# when a post is made it's added to every follower's timeline,
+# so reading the feed is a lookup of the viewer's timeline entries
+# instead of a join over everyone they follow
+
+# users with more than NETWORK_TIMELINE_FANOUT_LIMIT followers are skipped
+# (fan-out on read): their followers read their posts from the Post table
+
+# entries store their post's timestamp, so a page of a timeline is a range of
+# its (user, -timestamp, -post) index, and each timeline is trimmed to its
+# newest NETWORK_TIMELINE_LENGTH entries by trim() (see the trim_timelines
+# command), older posts drop out of the following feed
+
+
+# number of a user's latest posts added to a new follower's timeline
+BACKFILL_POSTS = 200
+
+
+def enabled():
+    return settings.NETWORK_TIMELINES
+
+
+def is_fanned_out(user):
+    # whether user's posts are written into their followers' timelines
+    return user.num_followers <= settings.NETWORK_TIMELINE_FANOUT_LIMIT
+
+
+def fan_out(post):
+    # adds a new post to the timelines of its poster's followers
+    if not enabled() or not is_fanned_out(post.poster):
+        return
+
+    follower_ids = Follow.objects.filter(following=post.poster_id).values_list("user", flat=True)
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, post_id=post.pk, timestamp=post.timestamp) for user_id in follower_ids],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+def backfill(user, following):
+    # adds following's latest posts to user's timeline (after user follows them)
+    if enabled():
+        _add_latest_posts(user, following)
+
+
+def _add_latest_posts(user, following):
+    if not is_fanned_out(following):
+        return
+
+    posts = following.posts.order_by("-timestamp", "-pk").values_list("pk", "timestamp")[:BACKFILL_POSTS]
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user.pk, post_id=post_id, timestamp=timestamp) for post_id, timestamp in posts],
+        ignore_conflicts=True,
+    )
+
+
+def unfollowed(following, num_unfollows):
+    # after num_unfollows of following's followers unfollowed them:
+    # if that took following back under the fan-out limit, adds their latest
+    # posts to the timelines of the followers they have left
+    # (their posts were read from the Post table until now, so they're in no
+    # timeline and would drop out of their followers' feeds)
+    limit = settings.NETWORK_TIMELINE_FANOUT_LIMIT
+    if not enabled() or not is_fanned_out(following) or following.num_followers + num_unfollows <= limit:
+        return
+
+    posts = list(following.posts.order_by("-timestamp", "-pk").values_list("pk", "timestamp")[:BACKFILL_POSTS])
+    for user_id in Follow.objects.filter(following=following).values_list("user", flat=True).iterator():
+        TimelineEntry.objects.bulk_create(
+            [TimelineEntry(user_id=user_id, post_id=post_id, timestamp=timestamp) for post_id, timestamp in posts],
+            ignore_conflicts=True,
+        )
+
+
+def prune(user, following):
+    # removes following's posts from user's timeline (after user unfollows them)
+    if not enabled():
+        return
+
+    TimelineEntry.objects.filter(user=user, post__poster=following).delete()
+
+
+def rebuild():
+    # rebuilds every timeline from the Follow table
+    # (works while timelines are turned off, so it can be run before turning them on)
+    # returns the number of timeline entries
+    with transaction.atomic():
+        TimelineEntry.objects.all().delete()
+
+        for follow in Follow.objects.select_related("user", "following").iterator():
+            _add_latest_posts(follow.user, follow.following)
+
+        return TimelineEntry.objects.count()
+
+
+def trim():
+    # deletes the entries of every timeline after its newest NETWORK_TIMELINE_LENGTH
+    # returns the number of entries deleted
+    length = settings.NETWORK_TIMELINE_LENGTH
+    long_timelines = (
+        TimelineEntry.objects.values("user").annotate(length=Count("pk")).filter(length__gt=length)
+        .values_list("user", flat=True)
+    )
+
+    deleted = 0
+    for user_id in list(long_timelines):
+        timeline = TimelineEntry.objects.filter(user=user_id)
+        # (the first entry past the newest length)
+        timestamp, post_id = timeline.order_by("-timestamp", "-post").values_list("timestamp", "post")[length]
+        older = timeline.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, post__lte=post_id))
+        deleted += older.delete()[0]
+    return deleted
+
+
+def following_posts(viewer):
+    # the posts in viewer's "following" feed (unordered)
+
+    following = Follow.objects.filter(user=viewer)
+
+    if not enabled():
+        # fan-out on read: posts where the poster is followed by viewer
+        # (IN on the Follow table uses the unique_follow and poster indexes)
+        return Post.objects.filter(poster__in=following.values("following"))
+
+    limit = settings.NETWORK_TIMELINE_FANOUT_LIMIT
+    big_following = following.filter(following__num_followers__gt=limit).values("following")
+
+    if big_following.exists():
+        # posts written into viewer's timeline plus posts by followed users
+        # that are too big to fan out (ordered by the posts' own columns)
+        in_timeline = Q(pk__in=TimelineEntry.objects.filter(user=viewer).values("post"))
+        return Post.objects.filter(in_timeline | Q(poster__in=big_following))
+
+    # posts written into viewer's timeline, ordered by the timeline's own
+    # columns (see feed.order_fields) so pages are read from its index
+    return Post.objects.filter(timeline_entries__user=viewer).alias(
+        feed_timestamp=F("timeline_entries__timestamp"), feed_post=F("timeline_entries__post")
+    )
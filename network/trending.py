@@ -0,0 +1,197 @@
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Exp, Greatest, Least, Ln
+from django.utils import timezone
+
+from . import cache, writes
+from .feed import FEED_PAGE_SIZE, add_viewer_state, feed_rows, serialize_post
+from .models import Post, TrendingScore
+
+
+# the trending feed: posts ranked by how fast they're being liked
+
+# every like is worth 1 when it happens and halves every HALF_LIFE after,
+# and a post's score is the sum over its likes
+
+# decaying every score as time passes would mean rewriting every row, so
+# scores are stored "forward decayed": a like at time t adds
+# exp(DECAY * (t - EPOCH)) instead of 1, which divided by exp(DECAY * (now - EPOCH))
+# is its decayed worth now. every score is divided by the same number, so the
+# stored values rank posts the same as their decayed scores and only change
+# when a post is liked (they're stored as logs, since they grow without bound)
+
+# scores are updated by the database (an UPDATE adding to the stored value),
+# so likes of the same post at the same time don't overwrite each other
+
+# the top TRENDING_SIZE posts are kept in the cache, so reading the feed is
+# one cache lookup plus fetching the page's posts
+# (likes update it as they happen, best effort: two likes updating it at
+# once can undo each other's change, so it's reloaded from the index every
+# TOP_TIMEOUT seconds)
+
+HALF_LIFE = timedelta(hours=6)
+DECAY = math.log(2) / HALF_LIFE.total_seconds()
+EPOCH = datetime(2020, 1, 1, tzinfo=dt_timezone.utc)
+
+# number of posts in the trending feed
+TRENDING_SIZE = 100
+
+# posts whose score has decayed below this are dropped by compact()
+# (a single like is worth this after about a day)
+COLD_SCORE = 0.05
+
+# an unlike taking a score within this (as a log) of 0 deletes it
+# (the log of what's left wouldn't be a number)
+MIN_LOG_DIFFERENCE = 1e-9
+
+TOP_KEY = "trending:top"
+TOP_TIMEOUT = 60
+
+
+def log_weight(when=None):
+    # the log of what a like at when (default now) adds to a stored score
+    when = when or timezone.now()
+    return DECAY * (when - EPOCH).total_seconds()
+
+
+def decayed_score(log_score, now=None):
+    # a stored score decayed to now
+    return math.exp(log_score - log_weight(now))
+
+
+def _log_add(a, b):
+    # log(exp(a) + exp(b)) without overflowing
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
+def _log_add_expression(weight):
+    # _log_add(log_score, weight) done by the database
+    weight = Value(weight)
+    high, low = Greatest(F("log_score"), weight), Least(F("log_score"), weight)
+    return high + Ln(1 + Exp(low - high))
+
+
+def _log_subtract_expression(weight):
+    # log(exp(log_score) - exp(weight)) done by the database (for scores above weight)
+    return F("log_score") + Ln(1 - Exp(Value(weight) - F("log_score")))
+
+
+def like_changed(post_id, liked):
+    # updates a post's score after it was liked (or unliked)
+    # (an unlike takes off what a like now is worth, since when the like
+    # was made isn't stored, so it can take off a little too much)
+    weight = log_weight()
+    scores = TrendingScore.objects.filter(post_id=post_id)
+
+    with transaction.atomic():
+        if liked:
+            if not scores.update(log_score=_log_add_expression(weight)):
+                try:
+                    with transaction.atomic():
+                        TrendingScore.objects.create(post_id=post_id, log_score=weight)
+                except IntegrityError:
+                    # another like made the score first
+                    scores.update(log_score=_log_add_expression(weight))
+        else:
+            above = scores.filter(log_score__gt=weight + MIN_LOG_DIFFERENCE)
+            if not above.update(log_score=_log_subtract_expression(weight)):
+                scores.delete()
+
+        log_score = scores.values_list("log_score", flat=True).first()
+
+    writes.after_commit(lambda: _update_top(post_id, log_score))
+
+
+def _load_top():
+    # [(log score, post id)] of the best TRENDING_SIZE posts, best first
+    scores = TrendingScore.objects.order_by("-log_score", "-post")[:TRENDING_SIZE]
+    return [(log_score, post_id) for post_id, log_score in scores.values_list("post", "log_score")]
+
+
+def top_posts():
+    # the cached [(log score, post id)] of the best TRENDING_SIZE posts, best first
+    feed_cache = cache.get_cache()
+    if feed_cache is None:
+        return _load_top()
+
+    top = feed_cache.get(TOP_KEY)
+    if top is None:
+        top = _load_top()
+        feed_cache.set(TOP_KEY, top, TOP_TIMEOUT)
+    return top
+
+
+def _update_top(post_id, log_score):
+    # moves post_id to its new place in the cached top posts
+    # (log_score None takes it out)
+    feed_cache = cache.get_cache()
+    if feed_cache is None:
+        return
+
+    top = feed_cache.get(TOP_KEY)
+    if top is None:
+        # loaded on the next read
+        return
+
+    top = [entry for entry in top if entry[1] != post_id]
+    if log_score is not None:
+        top.append((log_score, post_id))
+    top.sort(reverse=True)
+    feed_cache.set(TOP_KEY, top[:TRENDING_SIZE], TOP_TIMEOUT)
+
+
+def trending_feed(start, viewer):
+    # returns the formatted posts of the trending feed from position start
+    # (in the same format as the other feeds) and the number of trending posts
+    top = top_posts()
+    post_ids = [post_id for log_score, post_id in top[start:start + FEED_PAGE_SIZE]]
+
+    # fetch the page's posts in one query, then put them back in trending order
+    rows = {row[0]: row for row in feed_rows(Post.objects.filter(pk__in=post_ids))}
+    posts_array = [serialize_post(rows[post_id]) for post_id in post_ids if post_id in rows]
+
+    return add_viewer_state(posts_array, viewer), len(top)
+
+
+def feed_page(request, page_num):
+    # the trending version of views.feed_page
+    # (the cursor is just the position of the next page in the trending posts)
+    # raises ValueError if the cursor GET parameter is invalid
+    if page_num is None:
+        start = int(request.GET.get("cursor") or 0)
+        if start < 0:
+            raise ValueError("Invalid cursor.")
+
+        posts_array, num_posts = trending_feed(start, request.user)
+        next_start = start + FEED_PAGE_SIZE
+        page_dict = {
+            "posts": posts_array,
+            "next_cursor": str(next_start) if next_start < num_posts else None,
+        }
+        if request.GET.get("count"):
+            page_dict["num_posts"] = num_posts
+        return page_dict
+
+    posts_array, num_posts = trending_feed((page_num - 1) * FEED_PAGE_SIZE, request.user)
+    return {
+        "posts": posts_array,
+        "num_pages": max(1, math.ceil(num_posts / FEED_PAGE_SIZE)),
+        "current_page": page_num,
+    }
+
+
+def compact(now=None):
+    # deletes the scores of posts that have gone cold
+    # returns the number deleted
+    cold = math.log(COLD_SCORE) + log_weight(now)
+    num_deleted, _ = TrendingScore.objects.filter(log_score__lt=cold).delete()
+
+    feed_cache = cache.get_cache()
+    if feed_cache is not None:
+        feed_cache.delete(TOP_KEY)
+
+    return num_deleted
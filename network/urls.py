@@ -1,7 +1,7 @@
 
 from django.urls import path
 
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     path("", views.index, name="index"),
@@ -11,7 +11,23 @@ urlpatterns = [
 
     # API Routes
     path("make-post", views.make_post, name="make-post"),
+    path("posts/<str:posts_filter>", views.posts, name="posts-cursor"),
     path("posts/<str:posts_filter>/<int:page_num>", views.posts, name="posts"),
     path("post/<int:post_id>", views.post, name="post"),
-    path("profile/<str:username>/<int:page_num>", views.profile, name="profile")
+    path("profile/<str:username>", views.profile, name="profile-cursor"),
+    path("profile/<str:username>/<int:page_num>", views.profile, name="profile"),
+    path("profile/<str:username>/followers", views.follow_list, {"direction": "followers"}, name="followers"),
+    path("profile/<str:username>/following", views.follow_list, {"direction": "following"}, name="following"),
+    path("bulk", views.bulk, name="bulk"),
+    path("import-posts", views.import_posts, name="import-posts"),
+    path("search", views.search, name="search"),
+    path("suggestions", views.suggested, name="suggestions"),
+    path("viewer-state", views.viewer_state_lookup, name="viewer-state"),
+    path("metrics", views.metrics, name="metrics"),
+
+    # Async (ASGI) versions of the read API Routes
+    path("async/posts/<str:posts_filter>", async_views.posts, name="async-posts-cursor"),
+    path("async/posts/<str:posts_filter>/<int:page_num>", async_views.posts, name="async-posts"),
+    path("async/profile/<str:username>", async_views.profile, name="async-profile-cursor"),
+    path("async/profile/<str:username>/<int:page_num>", async_views.profile, name="async-profile")
 ]
@@ -0,0 +1,104 @@
+from django.db.models import Subquery
+
+from . import cache
+from .models import Post, Follow, ArchivedPost
+
+
+# which posts the viewer liked and which users they follow
+# (for the feeds, profiles, follow lists and the /viewer-state endpoint)
+
+# each viewer's likes of the newest RECENT_POSTS posts and the usernames of
+# everyone they follow are cached as sets in their viewer scope (bumped when
+# they like, unlike, follow or unfollow), so most checks are set lookups
+# likes of older posts are looked up with one query, and so are follows of
+# viewers following more than MAX_CACHED_FOLLOWING users
+# likes of archived posts are kept in their liked_by (see network/archive.py)
+
+# a viewer's likes of this many of the newest posts are cached
+RECENT_POSTS = 10000
+
+# viewers following more users than this don't get them cached
+MAX_CACHED_FOLLOWING = 5000
+
+# most posts (and users) the /viewer-state endpoint looks up at once
+MAX_LOOKUP = 100
+
+
+def _recent_likes(viewer):
+    # (the lowest post id of the recent posts, the ids of the recent posts viewer liked)
+    # (the recent posts start after the newest archived one, so archived posts are always looked up)
+    newest_archived = Subquery(ArchivedPost.objects.order_by("-pk").values("pk")[:1])
+    newest = Post.objects.order_by("-pk").values_list("pk", newest_archived).first()
+    if newest is None:
+        # (no live posts, so none are recent)
+        return float("inf"), frozenset()
+    newest, newest_archived = newest
+    oldest = max(newest - RECENT_POSTS + 1, (newest_archived or 0) + 1)
+    likes = Post.users_liked.through.objects.filter(user=viewer.pk, post__gte=oldest)
+    return oldest, frozenset(likes.values_list("post", flat=True))
+
+
+def _query_likes(viewer, post_ids):
+    likes = Post.users_liked.through.objects.filter(user=viewer.pk, post__in=post_ids)
+    return set(likes.values_list("post", flat=True))
+
+
+def _archived_likes(viewer, post_ids):
+    # the ids in post_ids of archived posts viewer liked
+    archived = ArchivedPost.objects.filter(pk__in=post_ids).values_list("pk", "liked_by")
+    return {post_id for post_id, liked_by in archived if viewer.pk in liked_by}
+
+
+def liked_post_ids(viewer, post_ids, archived_ids=None):
+    # the ids in post_ids of the posts viewer liked
+    # archived_ids are the ones of archived posts (None if that isn't known,
+    # then the posts looked up with a query are looked for in the archive too)
+    if not viewer.is_authenticated or not post_ids:
+        return set()
+
+    liked = set()
+    if archived_ids is not None:
+        archived_ids = set(archived_ids)
+        if archived_ids:
+            liked = _archived_likes(viewer, archived_ids)
+            post_ids = [post_id for post_id in post_ids if post_id not in archived_ids]
+
+    if cache.get_cache() is None:
+        older = post_ids
+    else:
+        oldest, recent = cache.cached(cache.viewer_scope(viewer.pk), "likes", lambda: _recent_likes(viewer))
+        liked |= {post_id for post_id in post_ids if post_id >= oldest and post_id in recent}
+        older = [post_id for post_id in post_ids if post_id < oldest]
+
+    if older:
+        liked |= _query_likes(viewer, older)
+        if archived_ids is None:
+            liked |= _archived_likes(viewer, [post_id for post_id in older if post_id not in liked])
+    return liked
+
+
+def _following(viewer):
+    # the usernames of everyone viewer follows (None if that's too many to cache)
+    following = Follow.objects.filter(user=viewer.pk).values_list("following__username", flat=True)
+    usernames = list(following[:MAX_CACHED_FOLLOWING + 1])
+    if len(usernames) > MAX_CACHED_FOLLOWING:
+        return None
+    return frozenset(usernames)
+
+
+def _query_following(viewer, usernames):
+    follows = Follow.objects.filter(user=viewer.pk, following__username__in=usernames)
+    return set(follows.values_list("following__username", flat=True))
+
+
+def followed_usernames(viewer, usernames):
+    # the usernames in usernames of the users viewer follows
+    if not viewer.is_authenticated or not usernames:
+        return set()
+    if cache.get_cache() is None:
+        return _query_following(viewer, usernames)
+
+    following = cache.cached(cache.viewer_scope(viewer.pk), "following", lambda: _following(viewer))
+    if following is None:
+        return _query_following(viewer, usernames)
+    return {username for username in usernames if username in following}
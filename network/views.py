@@ -1,14 +1,23 @@
 import json
+import time
+from functools import wraps
+
+from django.conf import settings
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
-from django.db import IntegrityError
-from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
+from django.db import IntegrityError, transaction
+from django.http import Http404, HttpResponse, HttpResponseRedirect
 from django.shortcuts import render
 from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
 from django.views.decorators.csrf import csrf_exempt
-from django.core.paginator import Paginator
 
-from .models import User, Post, Follow
+from . import cache, counters, events, follows, ingest, instrumentation, jobs, routers, suggestions, timelines, trending, viewer_state, writes
+from .feed import FeedRows, cursor_feed, newest_first, paginate_feed
+from .instrumentation import JsonResponse
+from .search import search_posts
+from .models import User, Post, ArchivedPost
 
 
 def index(request):
@@ -79,94 +88,274 @@ def make_post(request):
     data = json.loads(request.body)
     post_content = data.get("content")
 
-    # add the post to the database
-    new_post = Post(
-        poster=request.user,
-        content=post_content,
-    )
-    new_post.save()
+    # add the post to the database, and add it to the poster's followers' timelines
+    # (in the background with NETWORK_JOBS_ASYNC, see network/jobs.py: the job
+    # is stored in the same transaction as the post, so neither is lost)
+    with transaction.atomic():
+        new_post = Post(
+            poster=request.user,
+            content=post_content,
+        )
+        new_post.save()
+        jobs.post_created(new_post)
+
+    # cached pages of all posts and the poster's profile are out of date
+    cache.post_changed(request.user.pk)
+
+    # tell anyone watching the feed about the new post
+    events.post_created(new_post)
 
     # return a success message
     return JsonResponse({"message": "Post created successfully."}, status=201)
 
 
-def posts(request, posts_filter, page_num):
+def conditional(scope_of):
+    # answers a GET with an empty 304 if the client's copy of the page is still current,
+    # checking its If-None-Match/If-Modified-Since against the version of the
+    # page's network.cache scope before any of the page is built
+    # scope_of(request, *args, **kwargs) returns the scope (None to always send the page)
+
+    def decorator(view):
+        @wraps(view)
+        def conditional_view(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view(request, *args, **kwargs)
+
+            scope = scope_of(request, *args, **kwargs)
+            etag = cache.etag(scope, request.user) if scope is not None else None
+            if etag is None:
+                return view(request, *args, **kwargs)
+            modified = cache.last_modified(scope).timestamp()
+
+            # a replica may not have caught up with the write that last changed
+            # the scope, and a page built from it under the new version's
+            # validators would then be revalidated as current until the next
+            # change, so for as long as a replica is expected to lag
+            # (see network/routers.py) replica reads get no validators
+            if (
+                routers.current_replica() is not None
+                and time.time() - modified < settings.NETWORK_REPLICA_STICKY_SECONDS
+            ):
+                return view(request, *args, **kwargs)
+
+            # Last-Modified only has whole seconds, so a scope that changed
+            # this second could change again in it without a new Last-Modified
+            # (and an If-Modified-Since would get a false 304), until the
+            # second is over only the ETag (the scope's version) is used
+            last_modified = int(modified)
+            if last_modified >= int(time.time()):
+                last_modified = None
+
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = view(request, *args, **kwargs)
+
+            if response.status_code in (200, 304):
+                response["ETag"] = etag
+                if last_modified is not None:
+                    response["Last-Modified"] = http_date(last_modified)
+                # (so browsers check with us instead of guessing how long it's fresh)
+                patch_cache_control(response, private=True, no_cache=True)
+
+            return response
+
+        return conditional_view
+
+    return decorator
+
+
+def posts_scope(request, posts_filter, page_num=None):
+    # only all posts has a version (following pages aren't cached)
+    return cache.ALL_POSTS if posts_filter == "all" else None
+
+
+def user_id_for(username):
+    # the id of the user with username (None if there isn't one), cached
+    # (USER_IDS is never bumped, so usernames that aren't taken aren't cached,
+    # they could be registered next)
+    return cache.cached(
+        cache.USER_IDS, username,
+        lambda: User.objects.filter(username=username).values_list("pk", flat=True).first(),
+        cache_none=False,
+    )
+
+
+def profile_scope(request, username, page_num=None):
+    user_id = user_id_for(username)
+    return cache.profile_scope(user_id) if user_id is not None else None
+
+
+@routers.replica_reads
+@conditional(posts_scope)
+def posts(request, posts_filter, page_num=None):
     # posts_filter tells us what posts we want
     # page_num tells us what page of those posts we want to display
-    # (default from index.js is 1)
+    # (without a page_num, pages are found with the cursor GET parameter)
 
     # determrine what posts we're getting (all or following?)
     if posts_filter == "all":
         posts = Post.objects.all()
+        # the same pages are shown to everyone, so they're cached
+        cache_scope = cache.ALL_POSTS
     elif posts_filter == "following":
         # for following posts, a user needs to be signed in
         if request.user.is_authenticated:
             # posts where the poster is followed by request.user
-            posts = Post.objects.filter(poster__followers__user=request.user)
+            # (from request.user's timeline if timelines are turned on)
+            posts = timelines.following_posts(request.user)
+            cache_scope = None
         else:
             return JsonResponse({"error": "User is not signed in"}, status=400)
+    elif posts_filter == "trending":
+        # trending posts come ranked from network.trending, not from a queryset
+        try:
+            return JsonResponse(trending.feed_page(request, page_num))
+        except ValueError:
+            return JsonResponse({"error": "Invalid cursor."}, status=400)
     else:
         return JsonResponse({"error": "Invalid posts filter"}, status=400)
 
     # order pages (latest first)
-    posts = posts.order_by("-timestamp").all()
+    posts = newest_first(posts)
 
-    # paginate posts (10 posts per page)
-    post_paginator = Paginator(posts, 10)
+    # get the formatted posts on the page
+    # (shared with the profile view)
+    try:
+        posts_dict = feed_page(request, posts, cache_scope, page_num)
+    except ValueError:
+        return JsonResponse({"error": "Invalid cursor."}, status=400)
 
-    # get the number of pages
-    num_pages = post_paginator.num_pages
+    # return the dict
+    return JsonResponse(posts_dict)
 
-    # get the page reference from page_num
-    current_page = post_paginator.page(page_num)
 
-    # format posts we want to return (similar code in profile view)
+def feed_page(request, posts, cache_scope, page_num, posts_key="posts", archived=None):
+    # returns a dict with the page of posts we want to display
+    # (shared by the posts and profile views, and their async versions)
+    # archived posts (the profile's, see network/archive.py) come after posts
+    # raises ValueError if the cursor GET parameter is invalid
 
-    posts_array = []
-    posts_dict = {}
+    page_dict = {}
 
-    # for each post on the page we're displaying
-    for post in current_page.object_list:
+    if page_num is None:
+        # cursor pagination (used by index.js when scrolling)
+        posts_array, next_cursor = cursor_feed(posts, request.GET.get("cursor"), request.user, cache_scope, archived)
 
-        # determine if the user is the poster or if they liked the post
+        page_dict[posts_key] = posts_array
+        page_dict["next_cursor"] = next_cursor
 
-        user_is_poster = False
-        user_liked = False
+        # counting every post is slow for big feeds, so it's only done if asked for
+        if request.GET.get("count"):
+            page_dict["num_posts"] = FeedRows(posts, archived).count()
 
-        if request.user.is_authenticated:
+    else:
+        # get the formatted posts on the page and the number of pages
+        posts_array, num_pages = paginate_feed(posts, page_num, request.user, cache_scope, archived)
 
-            if post.poster == request.user:
-                user_is_poster = True
-            else:
-                user_is_poster = False
-
-            try:
-                post.users_liked.get(pk=request.user.pk)
-                user_liked = True
-            except User.DoesNotExist:
-                user_liked = False
-
-        # this is the post format we return
-        temp_post = {
-            'post_id': post.pk,
-            'poster': post.poster.username,
-            'content': post.content,
-            'timestamp': post.timestamp.strftime("%-m/%-d/%y %-I:%M %p"),
-            'like_count': post.users_liked.count(),
-            'user_liked': user_liked,
-            'user_is_poster': user_is_poster
-        }
-
-        # add the post to the posts_array
-        posts_array.append(temp_post)
-
-    #we want to return a json dict, so we add the posts_array with some other variables
-    posts_dict["posts"] = posts_array
-    posts_dict["num_pages"] = num_pages
-    posts_dict["current_page"] = page_num
+        #we want to return a json dict, so we add the posts_array with some other variables
+        page_dict[posts_key] = posts_array
+        page_dict["num_pages"] = num_pages
+        page_dict["current_page"] = page_num
 
-    # return the dict
-    return JsonResponse(posts_dict)
+    return page_dict
+
+
+def profile_info(viewer, user):
+    # returns a dict with user's info for viewer
+    # (shared by the profile view and its async version)
+
+    # determine if this is the profile of the signed in user
+    # or if the signed in user is following this user
+
+    is_signed_in_user = False;
+    user_is_following = False;
+
+    if viewer.is_authenticated:
+
+        # (cached per viewer, see network/viewer_state.py)
+        user_is_following = user.username in viewer_state.followed_usernames(viewer, [user.username])
+
+        if viewer == user:
+            is_signed_in_user = True
+
+    # return user info
+    return {
+        'username': user.username,
+        'date_joined': user.date_joined.strftime("%B %Y"),
+        'num_followers': user.num_followers,
+        'num_following': user.num_following,
+        'is_signed_in_user': is_signed_in_user,
+        'user_is_following': user_is_following,
+    }
+
+
+def search(request):
+    # GET /search?q=words returns the posts with all of the words, best match first
+    # (in the same format as a cursor page of the posts view)
+
+    if request.method != "GET":
+        return JsonResponse({"error": "GET request required."}, status=400)
+
+    try:
+        posts_array, next_cursor = search_posts(request.GET.get("q", ""), request.GET.get("cursor"), request.user)
+    except ValueError:
+        return JsonResponse({"error": "Invalid cursor."}, status=400)
+
+    return JsonResponse({"posts": posts_array, "next_cursor": next_cursor})
+
+
+def suggested(request):
+    # GET /suggestions returns users the signed in user might want to follow
+    # (precomputed, see network/suggestions.py)
+
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "User is not signed in"}, status=400)
+
+    return JsonResponse({"users": suggestions.suggested_users(request.user)})
+
+
+def viewer_state_lookup(request):
+    # GET /viewer-state?posts=1,2,3&users=name1,name2 returns which of the posts
+    # the signed in user liked and which of the users they follow
+    # (for posts and users shown from anywhere, see network/viewer_state.py)
+
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "User is not signed in"}, status=400)
+
+    try:
+        post_ids = [int(post_id) for post_id in request.GET.get("posts", "").split(",") if post_id]
+    except ValueError:
+        return JsonResponse({"error": "Invalid post ids."}, status=400)
+    usernames = [username for username in request.GET.get("users", "").split(",") if username]
+
+    if len(post_ids) > viewer_state.MAX_LOOKUP or len(usernames) > viewer_state.MAX_LOOKUP:
+        return JsonResponse({"error": f"At most {viewer_state.MAX_LOOKUP} posts and users."}, status=400)
+
+    liked = viewer_state.liked_post_ids(request.user, post_ids)
+    following = viewer_state.followed_usernames(request.user, usernames)
+
+    return JsonResponse({
+        "liked": [post_id for post_id in post_ids if post_id in liked],
+        "following": [username for username in usernames if username in following],
+    })
+
+
+def follow_list(request, username, direction):
+    # GET /profile/<username>/followers (or /following) returns a page of the users
+    # following username (or followed by them), newest first, with whether the
+    # signed in user follows each of them
+    # (later pages are found with the cursor GET parameter, see network/follows.py)
+
+    user_id = user_id_for(username)
+    if user_id is None:
+        return JsonResponse({"error": "User not found."}, status=404)
+
+    try:
+        users, next_cursor = follows.follow_list(user_id, direction, request.GET.get("cursor"), request.user)
+    except ValueError:
+        return JsonResponse({"error": "Invalid cursor."}, status=400)
+
+    return JsonResponse({"users": users, "next_cursor": next_cursor})
 
 
 @login_required
@@ -186,18 +375,32 @@ def post(request, post_id):
         # if the user is liking/unliking
         like_status = data.get("like")
         if like_status is not None:
-            if like_status:
-                # the user liked the post
-                post.users_liked.add(request.user)
-            else:
-                # the user is unliking the post
-                post.users_liked.remove(request.user)
+            # (the like and its jobs are committed together)
+            with transaction.atomic():
+                if like_status:
+                    # the user liked the post
+                    changed = counters.like(post, request.user)
+                else:
+                    # the user is unliking the post
+                    changed = counters.unlike(post, request.user)
+
+                # cached pages with this post are out of date
+                # (and it's trending more or less)
+                if changed:
+                    cache.post_changed(post.poster_id)
+                    cache.likes_changed(request.user.pk)
+                    jobs.likes_changed({post.pk: bool(like_status)})
+
+            # read back the stored count (someone else may have liked it too)
+            like_count = counters.like_counts([post.pk])[post.pk]
+
+            if changed:
+                events.like_count_changed(post.pk, like_count)
 
             response = {
-                "like_count": post.users_liked.count()
+                "like_count": like_count
             }
 
-            post.save()
             return JsonResponse(response)
 
         # if the user is editing
@@ -206,7 +409,9 @@ def post(request, post_id):
             if request.user == post.poster:
                 post.content = edit_status
 
-                post.save()
+                # only save the content (so we don't overwrite like_count)
+                post.save(update_fields=["content"])
+                cache.post_changed(post.poster_id)
 
                 return JsonResponse({"message": "Changes to post saved."}, status=201)
             else:
@@ -219,10 +424,13 @@ def post(request, post_id):
         return JsonResponse({"error": "PUT request required."}, status=400)
 
 
+@routers.replica_reads
 @csrf_exempt
-def profile(request, username, page_num):
+@conditional(profile_scope)
+def profile(request, username, page_num=None):
     # username gives us the username of the user we're viewing
     # page_num gives us the page of the user's posts we would like to view
+    # (without a page_num, pages are found with the cursor GET parameter)
 
     # query for the user
     try:
@@ -233,82 +441,20 @@ def profile(request, username, page_num):
     # if we're just viewing the profile, method is GET
     if request.method == "GET":
 
-        # get user's posts (similar code in posts view)
-        posts = Post.objects.filter(poster=user).order_by("-timestamp").all()
-
-        # pagination of the user's posts
-        post_paginator = Paginator(posts, 10)
-        num_pages = post_paginator.num_pages
-
-        # get page we're viewing
-        current_page = post_paginator.page(page_num)
-
-        # format posts to return
-        posts_array = []
-
-        # for each post in the page
-        for post in current_page.object_list:
-
-            # check if the user made the post or if they liked it
-            user_is_poster = False
-            user_liked = False
+        user_info = profile_info(request.user, user)
 
-            if request.user.is_authenticated:
+        # get user's posts (shared code with posts view)
+        # (followed by their archived posts, once the pages get that far back)
+        posts = Post.objects.filter(poster=user).order_by("-timestamp", "-pk")
+        archived = ArchivedPost.objects.filter(poster=user).order_by("-timestamp", "-pk")
 
-                if post.poster == request.user:
-                    user_is_poster = True
-                else:
-                    user_is_poster = False
-
-                try:
-                    post.users_liked.get(pk=request.user.pk)
-                    user_liked = True
-                except User.DoesNotExist:
-                    user_liked = False
-
-            # this is the format in which we return the post
-            temp_post = {
-                'post_id': post.pk,
-                'poster': post.poster.username,
-                'content': post.content,
-                'timestamp': post.timestamp.strftime("%-m/%-d/%y %-I:%M %p"),
-                'like_count': post.users_liked.count(),
-                'user_liked': user_liked,
-                'user_is_poster': user_is_poster
-            }
-
-            # add the post to the posts_array
-            posts_array.append(temp_post)
-
-        # determine if this is the profile of the signed in user
-        # or if the signed in user is following this user
-
-        is_signed_in_user = False;
-        user_is_following = False;
-
-        if request.user.is_authenticated:
-
-            try:
-                user.followers.get(user=request.user)
-                user_is_following = True
-            except Follow.DoesNotExist:
-                user_is_following = False
-
-            if request.user == user:
-                is_signed_in_user = True
-
-        # return user info
-        user_info = {
-            'username': user.username,
-            'date_joined': user.date_joined.strftime("%B %Y"),
-            'num_followers': user.followers.count(),
-            'num_following': user.following.count(),
-            'is_signed_in_user': is_signed_in_user,
-            'user_is_following': user_is_following,
-            'user_posts': posts_array,
-            'num_pages': num_pages,
-            'current_page': page_num
-        }
+        # format the page of posts we're viewing
+        try:
+            user_info.update(feed_page(
+                request, posts, cache.profile_scope(user.pk), page_num, posts_key="user_posts", archived=archived
+            ))
+        except ValueError:
+            return JsonResponse({"error": "Invalid cursor."}, status=400)
 
         return JsonResponse(user_info)
 
@@ -323,25 +469,27 @@ def profile(request, username, page_num):
 
             follow_status = data.get("follow")
 
-            if follow_status:
-                # request.user is following user
+            # (the follow and its jobs are committed together)
+            with transaction.atomic():
+                if follow_status:
+                    # request.user is following user
+                    # (and gets user's latest posts in their timeline)
+                    if counters.follow(request.user, user):
+                        cache.follow_changed(request.user.pk, user.pk)
+                        jobs.follows_changed(request.user, [user.pk])
 
-                # add the follow to the database
-                new_follow = Follow(
-                    user=request.user,
-                    following=user
-                )
-
-                new_follow.save()
-
-            else:
-                # request.user is unfollowing user
+                else:
+                    # request.user is unfollowing user
+                    # (and user's posts leave their timeline)
+                    if counters.unfollow(request.user, user):
+                        cache.follow_changed(request.user.pk, user.pk)
+                        jobs.follows_changed(request.user, [user.pk])
 
-                # remove the follow from the database
-                user.followers.filter(user=request.user, following=user).delete()
+            # read back the stored count
+            user.refresh_from_db(fields=["num_followers"])
 
             response = {
-                "follower_count": user.followers.count()
+                "follower_count": user.num_followers
             }
 
             return JsonResponse(response)
@@ -353,3 +501,126 @@ def profile(request, username, page_num):
     # Email must be via GET or POST
     else:
         return JsonResponse({"error": "GET or POST request required."}, status=400)
+
+
+@csrf_exempt
+@login_required
+@writes.own_transactions
+def import_posts(request):
+    # POST /import-posts makes a post by the signed in user from each line of
+    # a newline-delimited JSON body ({"content": "..."} per line)
+    # the body is read as it arrives and posts are saved in chunks,
+    # so it can be any length (see network/ingest.py)
+
+    # returns the number of posts made and what's wrong with the lines that weren't
+
+    if request.method != "POST":
+        return JsonResponse({"error": "POST request required."}, status=400)
+
+    errors = []
+    num_errors = 0
+
+    def on_error(line_num, message):
+        nonlocal num_errors
+        num_errors += 1
+        if len(errors) < ingest.MAX_REPORTED_ERRORS:
+            errors.append({"line": line_num, "error": message})
+
+    num_created = ingest.ingest(ingest.read_lines(request), poster=request.user, on_error=on_error)
+
+    return JsonResponse({"created": num_created, "num_errors": num_errors, "errors": errors})
+
+
+@csrf_exempt
+@login_required
+def bulk(request):
+    # applies many like/unlike/follow/unfollow operations in one transaction
+    # operations that are already true (liking a liked post) do nothing,
+    # so the same request can safely be sent again
+
+    # expects {"operations": [{"op": "like", "post_id": 1}, {"op": "follow", "username": "name"}, ...]}
+
+    if request.method != "POST":
+        return JsonResponse({"error": "POST request required."}, status=400)
+
+    try:
+        operations = json.loads(request.body)["operations"]
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({"error": "Operations required."}, status=400)
+    if not isinstance(operations, list):
+        return JsonResponse({"error": "Operations must be a list."}, status=400)
+    if len(operations) > settings.NETWORK_BULK_MAX_OPERATIONS:
+        return JsonResponse(
+            {"error": f"At most {settings.NETWORK_BULK_MAX_OPERATIONS} operations are allowed."}, status=400
+        )
+
+    # what each post/user should end up as (later operations win)
+    liked = {}
+    followed = {}
+
+    for operation in operations:
+        op = operation.get("op") if isinstance(operation, dict) else None
+        post_id = operation.get("post_id") if isinstance(operation, dict) else None
+        # (true and false are ints in python, but aren't post ids)
+        if op in ("like", "unlike") and isinstance(post_id, int) and not isinstance(post_id, bool):
+            liked[operation["post_id"]] = op == "like"
+        elif op in ("follow", "unfollow") and isinstance(operation.get("username"), str):
+            followed[operation["username"]] = op == "follow"
+        else:
+            return JsonResponse({"error": f"Invalid operation: {operation}"}, status=400)
+
+    # look up what the operations refer to
+    # (ignoring anything that doesn't exist and following yourself)
+    posts = Post.objects.in_bulk(list(liked))
+    users = User.objects.in_bulk(list(followed), field_name="username")
+    users.pop(request.user.username, None)
+
+    with transaction.atomic():
+        changed_posts = counters.set_likes(
+            request.user, {post_id: liked[post_id] for post_id in posts}
+        )
+        added_follows, removed_follows = counters.set_follows(
+            request.user, {user.pk: followed[username] for username, user in users.items()}
+        )
+
+        # the same side effects as the post and profile views
+        # (the jobs are committed with the writes)
+        for user_id in added_follows + removed_follows:
+            cache.follow_changed(request.user.pk, user_id)
+        jobs.follows_changed(request.user, added_follows + removed_follows)
+        for poster_id in {posts[post_id].poster_id for post_id in changed_posts}:
+            cache.post_changed(poster_id)
+        if changed_posts:
+            cache.likes_changed(request.user.pk)
+        jobs.likes_changed({post_id: liked[post_id] for post_id in changed_posts})
+
+    users_by_id = {user.pk: user for user in users.values()}
+
+    # return the new counts of everything the operations refer to
+    like_counts = counters.like_counts(posts)
+    follower_counts = User.objects.filter(pk__in=users_by_id).values_list("username", "num_followers")
+    request.user.refresh_from_db(fields=["num_following"])
+
+    for post_id in changed_posts:
+        events.like_count_changed(post_id, like_counts[post_id])
+
+    response = {
+        "like_counts": {str(post_id): like_count for post_id, like_count in like_counts.items()},
+        "follower_counts": dict(follower_counts),
+        "num_following": request.user.num_following,
+        # posts/users that don't exist (or the user themselves)
+        "ignored": (
+            [post_id for post_id in liked if post_id not in posts] +
+            [username for username in followed if username not in users]
+        ),
+    }
+
+    return JsonResponse(response)
+
+
+def metrics(request):
+    # the request histograms (see network/instrumentation.py) for a scraper
+    if not settings.NETWORK_INSTRUMENTATION:
+        raise Http404
+
+    return HttpResponse(instrumentation.registry.render(), content_type="text/plain; version=0.0.4")
@@ -0,0 +1,123 @@
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import OperationalError, connection, transaction
+from django.http import JsonResponse
+
+
+# serializing writes for SQLite (used in production mode, see project4/settings.py)
+
+# SQLite allows one writer at a time, and a write that can't get the lock
+# fails with "database is locked" instead of waiting its turn
+
+# WriteQueueMiddleware runs every request that can write (anything but GET,
+# HEAD and OPTIONS) in one transaction, one at a time per process: requests
+# wait in line for a lock instead of fighting over SQLite's
+# if another process holds SQLite's lock for too long, the whole transaction
+# was rolled back, so it's retried with backoff
+# if a request waits too long either way, it gets a 503 (try again later)
+# instead of an error, so bursts of writes slow down rather than fail
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# one writer at a time in this process
+_write_lock = threading.Lock()
+
+
+def is_locked_error(error):
+    message = str(error)
+    return "database is locked" in message or "database table is locked" in message
+
+
+def retry_locked(write, retries, base_delay=0.05):
+    # calls write() until it doesn't fail because the database is locked,
+    # sleeping longer (with jitter) after each failure,
+    # write must roll back everything it did if it fails (e.g. be atomic)
+    for attempt in range(retries + 1):
+        try:
+            return write()
+        except OperationalError as e:
+            if not is_locked_error(e) or attempt == retries:
+                raise
+        time.sleep(base_delay * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+def after_commit(func):
+    # calls func() once the transaction it's called in commits (right away
+    # outside a transaction), for the side effects of a write outside the
+    # database (cache bumps, events): a write that's rolled back, or retried
+    # by retry_locked, doesn't call it
+    # (unlike transaction.on_commit it doesn't connect to the database
+    # outside a transaction, so it can be called from async code)
+    if connection.in_atomic_block:
+        transaction.on_commit(func)
+    else:
+        func()
+
+
+def own_transactions(view_func):
+    # marks a view that makes its own transactions (e.g. one per chunk of a long
+    # upload, with locked_write), so WriteQueueMiddleware doesn't run all of it
+    # in one transaction holding the lock
+    view_func.own_transactions = True
+    return view_func
+
+
+def locked_write(write):
+    # runs write() in a transaction, one at a time per process and retried
+    # if another process holds the lock like WriteQueueMiddleware does
+    # (just in a transaction outside production mode)
+    def atomic_write():
+        with transaction.atomic():
+            return write()
+
+    if not settings.NETWORK_SQLITE_PRODUCTION or connection.in_atomic_block:
+        return atomic_write()
+
+    with _write_lock:
+        return retry_locked(atomic_write, settings.NETWORK_WRITE_RETRIES)
+
+
+def too_busy():
+    response = JsonResponse({"error": "Too many writes, try again."}, status=503)
+    response["Retry-After"] = "1"
+    return response
+
+
+class WriteQueueMiddleware:
+    # goes last in settings.MIDDLEWARE, so the CSRF check has already run
+    # and only the view itself is in the transaction
+
+    def __init__(self, get_response):
+        if not settings.NETWORK_SQLITE_PRODUCTION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method in SAFE_METHODS or getattr(view_func, "own_transactions", False):
+            return None
+
+        if not _write_lock.acquire(timeout=settings.NETWORK_WRITE_QUEUE_TIMEOUT):
+            return too_busy()
+
+        def write():
+            with transaction.atomic():
+                return view_func(request, *view_args, **view_kwargs)
+
+        try:
+            if connection.in_atomic_block:
+                # (the transaction can't be retried inside someone else's)
+                return write()
+            return retry_locked(write, settings.NETWORK_WRITE_RETRIES)
+        except OperationalError as e:
+            if is_locked_error(e):
+                return too_busy()
+            raise
+        finally:
+            _write_lock.release()
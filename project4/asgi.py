@@ -13,4 +13,15 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project4.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# (imported after Django is set up)
+from network.event_stream import event_stream
+
+
+async def application(scope, receive, send):
+    # the event stream is served outside of Django so it can stay open
+    if scope["type"] == "http" and scope["path"] == "/events":
+        await event_stream(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
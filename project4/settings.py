@@ -41,13 +41,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'network.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'network.auth.CachedAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'network.routers.ReplicaMiddleware',
+    'network.writes.WriteQueueMiddleware',
 ]
 
 ROOT_URLCONF = 'project4.urls'
@@ -77,12 +80,51 @@ WSGI_APPLICATION = 'project4.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'NAME': os.environ.get('NETWORK_DATABASE', os.path.join(BASE_DIR, 'db.sqlite3')),
     }
 }
 
+# SQLite production mode (NETWORK_SQLITE_PRODUCTION=1 in the environment)
+# WAL lets reads carry on during a write, the pragmas trade a little durability
+# on power loss (not on crashes) for much faster commits, connections are kept
+# open between requests and writes wait their turn (see network/writes.py)
+NETWORK_SQLITE_PRODUCTION = os.environ.get('NETWORK_SQLITE_PRODUCTION') == '1'
+
+if NETWORK_SQLITE_PRODUCTION:
+    DATABASES['default'].update({
+        'ENGINE': 'network.sqlite_backend',
+        'CONN_MAX_AGE': None,
+        'OPTIONS': {
+            # seconds to wait for another process's write lock
+            'timeout': 5,
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA mmap_size=268435456;'
+                'PRAGMA cache_size=-65536;'
+                'PRAGMA temp_store=MEMORY;'
+            ),
+        },
+    })
+
+# Seconds a write request waits in line before getting a 503
+NETWORK_WRITE_QUEUE_TIMEOUT = 10
+
+# Times a write is retried if another process holds the database's write lock
+NETWORK_WRITE_RETRIES = 5
+
 AUTH_USER_MODEL = "network.User"
 
+# Cache
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -120,3 +162,120 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.0/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Following feed timelines
+# (see network/timelines.py)
+
+# When True, new posts are written into their poster's followers' timelines
+# and the following feed is read from them. Run `manage.py rebuild_timelines`
+# before turning this on for a database that already has posts.
+NETWORK_TIMELINES = False
+
+# Posts from users with more followers than this aren't written into timelines,
+# they're read from the Post table instead (so one post isn't millions of writes)
+NETWORK_TIMELINE_FANOUT_LIMIT = 10000
+
+# Entries kept in each timeline by `manage.py trim_timelines` (run it regularly),
+# posts older than a user's newest this many leave their following feed
+NETWORK_TIMELINE_LENGTH = 1000
+
+
+# Feed page caching
+# (see network/cache.py)
+
+# Alias in CACHES used for cached feed pages (None turns caching off).
+# The default locmem cache is per process, so with more than one worker
+# process use a shared cache (`manage.py check --deploy` warns otherwise)
+NETWORK_FEED_CACHE = 'default'
+
+# Seconds a cached feed page is kept (changes invalidate it sooner)
+NETWORK_FEED_CACHE_TIMEOUT = 300
+
+
+# Event stream
+# (see network/events.py)
+
+# Broker that delivers new post and like events to /events subscribers
+NETWORK_EVENT_BROKER = 'network.events.InProcessBroker'
+
+
+# Request instrumentation
+# (see network/instrumentation.py)
+
+# Log the queries, SQL time, serialization time and response size of every
+# request and serve histograms of them at /metrics (off, the middleware does nothing)
+NETWORK_INSTRUMENTATION = False
+
+# A request running the same SQL this many times is flagged as an N+1 pattern
+NETWORK_INSTRUMENTATION_REPEATED_QUERIES = 5
+
+
+# Background jobs
+# (see network/jobs.py)
+
+# Store the side work of writes (timeline fan-out, suggestions, trending scores)
+# as jobs for `manage.py run_jobs` instead of doing it in the request
+# (off, it's done right away and no worker is needed)
+NETWORK_JOBS_ASYNC = False
+
+
+# Authentication fast path
+# (see network/auth.py)
+
+# Keep sessions in a signed cookie instead of the database, so finding the
+# signed in user doesn't start with a session query (logging out deletes the
+# cookie, but a copy of it would still work until it expires)
+NETWORK_SIGNED_COOKIE_SESSIONS = os.environ.get('NETWORK_SIGNED_COOKIE_SESSIONS') == '1'
+
+if NETWORK_SIGNED_COOKIE_SESSIONS:
+    SESSION_ENGINE = 'django.contrib.sessions.backends.signed_cookies'
+
+# Seconds each process keeps a signed in user in memory instead of fetching
+# them for every request (0 fetches them every time)
+NETWORK_USER_CACHE_TTL = 0
+
+# Number of users each process keeps in memory (least recently used go first)
+NETWORK_USER_CACHE_SIZE = 10000
+
+
+# Like counters
+# (see network/counters.py)
+
+# Number of counter rows each post's likes are spread over, so likes of a
+# viral post don't all wait on its one row (0 updates Post.like_count directly).
+# Run `manage.py fold_like_counts` regularly when this is on.
+NETWORK_LIKE_COUNTER_SHARDS = 0
+
+# Most like/unlike/follow/unfollow operations one /bulk request can make
+NETWORK_BULK_MAX_OPERATIONS = 500
+
+
+# Post archive
+# (see network/archive.py)
+
+# Posts older than this many days are moved to the archive by
+# `manage.py archive_posts` (they stay on their poster's profile)
+NETWORK_ARCHIVE_AFTER_DAYS = 365
+
+
+# Read replicas
+# (see network/routers.py)
+
+# A copy of the database that GETs of the feeds and profiles read from
+# (NETWORK_REPLICA_DATABASE=path in the environment: another SQLite file kept
+# up to date by `manage.py sync_replica` locally, or by replication)
+DATABASES['replica'] = {
+    **DATABASES['default'],
+    'NAME': os.environ.get('NETWORK_REPLICA_DATABASE', DATABASES['default']['NAME']),
+    'TEST': {'MIRROR': 'default'},
+}
+
+DATABASE_ROUTERS = ['network.routers.ReplicaRouter']
+
+# Aliases in DATABASES that reads can go to (none sends everything to 'default')
+NETWORK_READ_REPLICAS = ['replica'] if os.environ.get('NETWORK_REPLICA_DATABASE') else []
+
+# Seconds a client's reads stay on 'default' after it writes something,
+# so it doesn't read from a replica that hasn't caught up with its write yet
+NETWORK_REPLICA_STICKY_SECONDS = 10